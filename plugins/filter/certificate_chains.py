@@ -0,0 +1,58 @@
+"""
+This module provides functionality for building leaf to root certificate chains out of a bundle of certificates.
+
+The main function, `certificate_chains`, takes a string that contains one or more PEM-formatted certificates, or a list of such strings,
+removes the duplicated certificates, and returns the ordered chain of every leaf, with the certificates which cannot be chained.
+Issuers are found through indexes by subject and by subject key identifier, not by comparing every pair of certificates.
+
+The module also includes a `FilterModule` class that makes the `certificate_chains` function available as a filter in Ansible playbooks.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import build_chains, iter_certificates
+
+
+def certificate_chains(bundle, include_root=True):
+    """
+    Builds the leaf to root chain of every leaf certificate of a bundle.
+
+    This function takes a string that contains one or more PEM-formatted certificates in any order, or a list of such strings.
+    A leaf is a certificate which does not issue any other certificate of the bundle.
+
+    Parameters:
+        bundle (str|list): A string containing one or more concatenated PEM-formatted certificates, or a list of such strings.
+        include_root (bool): Keep the self signed root at the end of the chains. Optional.
+
+    Returns:
+        dict: `chains`, a list of dictionaries with the `fingerprints` and `certificates` of the chain, leaf first,
+            the concatenated `fullchain`, and `complete`, false when the chain does not end with a self signed root.
+            `unchained`, the metadata of the certificates whose issuer is not in the bundle.
+            `duplicates`, the number of duplicated certificates removed.
+    """
+    return build_chains(list(iter_certificates(bundle)), include_root=include_root)
+
+
+class FilterModule:
+    """
+    A filter plugin class for Ansible.
+
+    This class provides a filter named 'certificate_chains' that can be used in Ansible templates. The filter takes a string of concatenated PEM-formatted certificates and returns the ordered chain of every leaf certificate.
+
+    Methods:
+        filters: Returns a dictionary mapping the filter name ('certificate_chains') to the filter function.
+    """
+
+    def filters(self):
+        """
+        Returns a dictionary mapping filter names to filter functions.
+
+        This function is used by Ansible to discover all of the filters in this plugin. The returned dictionary maps the name of each filter (as a string) to the function that implements the filter.
+
+        Returns:
+            dict: A dictionary where the keys are filter names and the values are the corresponding filter functions.
+        """
+        return {"certificate_chains": certificate_chains}
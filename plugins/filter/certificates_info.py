@@ -0,0 +1,55 @@
+"""
+This module provides functionality for reading the metadata of every certificate of a bundle in one pass.
+
+The main function, `certificates_info`, takes a string that contains one or more PEM-formatted certificates, or a list of such strings,
+and returns a list of compact records, one per certificate, in the order of the bundle.
+The certificates are parsed in process and memoized, no module is executed.
+
+The module also includes a `FilterModule` class that makes the `certificates_info` function available as a filter in Ansible playbooks.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import certificate_record, iter_certificates
+
+
+def certificates_info(bundle):
+    """
+    Returns the metadata of every certificate of a bundle.
+
+    This function takes a string that contains one or more PEM-formatted certificates, or a list of such strings,
+    and parses every certificate once, text outside the certificates is ignored.
+
+    Parameters:
+        bundle (str|list): A string containing one or more concatenated PEM-formatted certificates, or a list of such strings.
+
+    Returns:
+        list: A list of dictionaries with `fingerprint_sha256`, `serial_number`, `subject`, `issuer`, `subject_key_identifier`,
+            `authority_key_identifier`, `not_before`, `not_after`, `subject_alt_name` and `is_ca`.
+    """
+    return [certificate_record(pem) for pem in iter_certificates(bundle)]
+
+
+class FilterModule:
+    """
+    A filter plugin class for Ansible.
+
+    This class provides a filter named 'certificates_info' that can be used in Ansible templates. The filter takes a string of concatenated PEM-formatted certificates and returns the metadata of every certificate.
+
+    Methods:
+        filters: Returns a dictionary mapping the filter name ('certificates_info') to the filter function.
+    """
+
+    def filters(self):
+        """
+        Returns a dictionary mapping filter names to filter functions.
+
+        This function is used by Ansible to discover all of the filters in this plugin. The returned dictionary maps the name of each filter (as a string) to the function that implements the filter.
+
+        Returns:
+            dict: A dictionary where the keys are filter names and the values are the corresponding filter functions.
+        """
+        return {"certificates_info": certificates_info}
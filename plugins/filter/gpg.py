@@ -5,6 +5,16 @@ The main function, `gpg`, takes a set of parameters including the GnuPG home dir
 key server, key fingerprint, key path, key contents, passphrase,
 mode of operation, data to be encrypted or decrypted, and a flag indicating whether to receive the key from the key server.
 
+The `gpg_enc_many` and `gpg_dec_many` filters process every string of a list or nested dictionary,
+such as a whole vars tree, with one keyring preparation and a bounded pool of workers.
+
+Prepared keyrings are cached for the rest of the process by `gnupg_core`, so the keys are imported and trusted
+once and not for every value. The cache applies only to a persistent GnuPG home, and only within one task, Ansible
+evaluates the filters of a task in the worker process of that task.
+The default `temp` GnuPG home is a new directory for every filter call, removed before the call returns, so every
+`gpg_enc` or `gpg_dec` of a value imports the keys again and the user's keyring is never touched.
+To process many values with one keyring, pass them together to `gpg_enc_many` or `gpg_dec_many`.
+
 The module also includes a `FilterModule` class that makes the `gpg` function available as a filter in Ansible playbooks.
 
 This module is part of the arpanrec.nebula collection.
@@ -13,16 +23,13 @@ Author:
     Arpan Mandal (arpan.rec@gmail.com)
 """
 
-import os
-import tempfile
-from pathlib import Path
-import gnupg
+from ansible_collections.arpanrec.nebula.plugins.module_utils.gnupg_core import d_gpg_ops, d_gpg_ops_many
 
 DOCUMENTATION = """
 filter_name:
   - description: A brief description of what the filter does.
   - parameters:
-    - gnupg_home: The path to the GnuPG home directory. Default is None.
+    - gnupg_home: The path to the GnuPG home directory, or temp for a temporary one created and removed for every call. Default is temp.
     - key_server: The key server to use for key operations. Default is 'hkps://keys.openpgp.org'.
     - fingerprint: The fingerprint of the key to use for encryption or decryption. Required if recv_keys is False and key_path and key_contents are None.
     - key_path: The path to the key file to use for encryption or decryption. Required if key_contents is None and recv_keys is False and fingerprint is None.
@@ -31,114 +38,18 @@ filter_name:
     - mode: The mode of operation. Must be either 'encrypt' or 'decrypt'. Required.
     - data: The data to encrypt or decrypt. Required.
     - recv_keys: Whether to receive the key from the key server. Default is False.
+    - key_cache_dir: Directory of the received keys cache. Default is $XDG_CACHE_HOME/nebula-gpg-keys.
+    - key_cache_ttl: Seconds a received key is used from the cache before it is received again. Default is 86400.
+    - offline: Only use the received keys cache, never the key server. Default is False.
   - return: The result of the encryption or decryption operation.
+gpg_enc_many, gpg_dec_many:
+  - description: Same as gpg_enc and gpg_dec, for every non empty string of a list or nested dictionary.
+  - parameters:
+    - concurrency: Maximum number of concurrent gpg processes. Default is 8.
+  - return: The same structure with the encrypted or decrypted values.
 """
 
 
-def d_gpg_ops(
-    gnupg_home: str = None,
-    key_server: str = "hkps://keys.openpgp.org",
-    fingerprint: str = None,
-    key_path: str = None,
-    key_contents: str = None,
-    passphrase: str = None,
-    mode: str = None,
-    data: str = None,
-    recv_keys: bool = False,
-) -> str:
-    """
-    __gpg_ops:
-    - description: Performs encryption or decryption using GnuPG.
-    - parameters:
-        - gnupg_home: The path to the GnuPG home directory. Default is None.
-        - key_server: The key server to use for key operations. Default is 'hkps://keys.openpgp.org'.
-        - fingerprint: The fingerprint of the key to use for encryption or decryption. Required if recv_keys is False and key_path and key_contents are None.
-        - key_path: The path to the key file to use for encryption or decryption. Required if key_contents is None and recv_keys is False and fingerprint is None.
-        - key_contents: The contents of the key to use for encryption or decryption. Required if key_path is None and recv_keys is False and fingerprint is None.
-        - passphrase: The passphrase to use for key operations. Default is None.
-        - mode: The mode of operation. Must be either 'encrypt' or 'decrypt'. Required.
-        - data: The data to encrypt or decrypt. Required.
-        - recv_keys: Whether to receive the key from the key server. Default is False.
-    - return: The result of the encryption or decryption operation.
-    """
-    if data is None or len(data) == 0:
-        raise ValueError("data is required")
-
-    if key_contents and key_path:
-        raise ValueError("key_contents and key_path are mutually exclusive")
-
-    if recv_keys and not fingerprint:
-        raise ValueError("recv_keys is True but fingerprint is None")
-
-    if mode not in ["encrypt", "decrypt"]:
-        raise ValueError("mode must be either encrypt or decrypt")
-
-    if mode == "decrypt" and recv_keys:
-        raise ValueError("mode is decrypt but recv_keys is True")
-
-    if not gnupg_home:
-        gnupg_env_home = os.getenv("GNUPGHOME", None)
-        if gnupg_env_home:
-            gnupg_home = gnupg_env_home
-        else:
-            gnupg_home = Path.joinpath(Path.home(), ".gnupg")
-    elif gnupg_home.lower() == "temp":
-        with tempfile.TemporaryDirectory(suffix=None, prefix=None, dir=None, ignore_cleanup_errors=False) as temporary_directory:
-            gnupg_home = temporary_directory
-    else:
-        pass
-    if not os.path.exists(gnupg_home):
-        os.makedirs(gnupg_home, exist_ok=True)
-    elif os.path.exists(gnupg_home) and os.path.isfile(gnupg_home):
-        raise ValueError("gnupg_home is a file, not a directory")
-
-    gpg = gnupg.GPG(gnupghome=gnupg_home)
-    gpg.encoding = "utf-8"
-
-    if recv_keys and fingerprint:
-        gpg.recv_keys(key_server, fingerprint)
-
-    if key_path:
-        gpg.import_keys_file(key_path, passphrase=passphrase)
-    if key_contents:
-        gpg.import_keys(key_contents, passphrase=passphrase)
-
-    if mode == "encrypt":
-        keys_list = gpg.list_keys()
-    elif mode == "decrypt":
-        keys_list = gpg.list_keys(True)
-    else:
-        raise ValueError("mode must be either encrypt or decrypt")
-
-    if len(keys_list) == 0:
-        raise ValueError("no keys found")
-
-    if len(keys_list) > 1 and not fingerprint:
-        raise ValueError("multiple keys found, please specify a fingerprint")
-
-    if not fingerprint:
-        fingerprint = keys_list[0]["fingerprint"]
-
-    gpg.trust_keys(fingerprints=fingerprint, trustlevel="TRUST_ULTIMATE")
-
-    if mode == "encrypt":
-        ascii_data = gpg.encrypt(data=data, recipients=fingerprint)
-
-    if mode == "decrypt":
-        ascii_data = gpg.decrypt(
-            message=data,
-            passphrase=passphrase,
-            extra_args=["--pinentry-mode", "loopback", "--recipient", fingerprint],
-        )
-
-    final_result = str(ascii_data)
-
-    if not ascii_data.ok or len(final_result) == 0:
-        raise ValueError("decryption failed : " + ascii_data.status)
-
-    return final_result
-
-
 def gpg_enc(
     data,
     fingerprint=None,
@@ -148,6 +59,9 @@ def gpg_enc(
     passphrase=None,
     key_contents=None,
     recv_keys=False,
+    key_cache_dir=None,
+    key_cache_ttl=86400,
+    offline=False,
 ):
     """
     Encrypts the provided data using GnuPG.
@@ -162,6 +76,10 @@ def gpg_enc(
         key_contents (str): The key contents. Optional.
         passphrase (str): The passphrase. Required.
         data (str): The data to be encrypted. Required.
+        recv_keys (bool): Receive the key from the key server, through the local key cache. Optional.
+        key_cache_dir (str): Directory of the received keys cache. Optional.
+        key_cache_ttl (int): Seconds a received key is used from the cache. Optional.
+        offline (bool): Only use the received keys cache. Optional.
 
     Returns:
         str: The encrypted data.
@@ -177,6 +95,9 @@ def gpg_enc(
         mode="encrypt",
         data=data,
         recv_keys=recv_keys,
+        key_cache_dir=key_cache_dir,
+        key_cache_ttl=key_cache_ttl,
+        offline=offline,
     )
 
 
@@ -219,15 +140,96 @@ def gpg_dec(
     )
 
 
+def gpg_enc_many(
+    data,
+    fingerprint=None,
+    gnupg_home="temp",
+    key_server="hkps://keys.openpgp.org",
+    key_path=None,
+    passphrase=None,
+    key_contents=None,
+    recv_keys=False,
+    key_cache_dir=None,
+    key_cache_ttl=86400,
+    offline=False,
+    concurrency=8,
+):
+    """
+    Encrypts every non empty string of a list or nested dictionary using GnuPG.
+
+    The keys are imported and trusted once, the values are encrypted by up to `concurrency` gpg processes.
+
+    Parameters:
+        data (dict|list): The values to be encrypted. Required.
+        concurrency (int): Maximum number of concurrent gpg processes. Optional.
+        Other parameters are the same as `gpg_enc`.
+
+    Returns:
+        dict|list: The same structure with the encrypted values.
+    """
+    return d_gpg_ops_many(
+        data,
+        concurrency=concurrency,
+        fingerprint=fingerprint,
+        gnupg_home=gnupg_home,
+        key_server=key_server,
+        key_path=key_path,
+        passphrase=passphrase,
+        key_contents=key_contents,
+        mode="encrypt",
+        recv_keys=recv_keys,
+        key_cache_dir=key_cache_dir,
+        key_cache_ttl=key_cache_ttl,
+        offline=offline,
+    )
+
+
+def gpg_dec_many(
+    data,
+    fingerprint=None,
+    gnupg_home="temp",
+    key_server="hkps://keys.openpgp.org",
+    key_path=None,
+    passphrase=None,
+    key_contents=None,
+    concurrency=8,
+):
+    """
+    Decrypts every non empty string of a list or nested dictionary using GnuPG.
+
+    The keys are imported and trusted once, the values are decrypted by up to `concurrency` gpg processes.
+
+    Parameters:
+        data (dict|list): The values to be decrypted. Required.
+        concurrency (int): Maximum number of concurrent gpg processes. Optional.
+        Other parameters are the same as `gpg_dec`.
+
+    Returns:
+        dict|list: The same structure with the decrypted values.
+    """
+    return d_gpg_ops_many(
+        data,
+        concurrency=concurrency,
+        fingerprint=fingerprint,
+        gnupg_home=gnupg_home,
+        key_server=key_server,
+        key_path=key_path,
+        passphrase=passphrase,
+        key_contents=key_contents,
+        mode="decrypt",
+        recv_keys=False,
+    )
+
+
 class FilterModule:
     """
     A filter plugin class for Ansible.
 
-    This class provides a filter named 'gpg_enc' and 'gpg_dec' that can be used in Ansible templates.
+    This class provides the filters 'gpg_enc', 'gpg_dec', 'gpg_enc_many' and 'gpg_dec_many' that can be used in Ansible templates.
     The filters take a set of parameters including the GnuPG home directory, key server, key fingerprint, key path, key contents, passphrase, and data to be encrypted or decrypted.
 
     Methods:
-        filters: Returns a dictionary mapping the filter names ('gpg_enc', 'gpg_dec') to the filter functions.
+        filters: Returns a dictionary mapping the filter names ('gpg_enc', 'gpg_dec', 'gpg_enc_many', 'gpg_dec_many') to the filter functions.
     """
 
     def filters(self):
@@ -239,4 +241,4 @@ class FilterModule:
         Returns:
             dict: A dictionary where the keys are filter names and the values are the corresponding filter functions.
         """
-        return {"gpg_enc": gpg_enc, "gpg_dec": gpg_dec}
+        return {"gpg_enc": gpg_enc, "gpg_dec": gpg_dec, "gpg_enc_many": gpg_enc_many, "gpg_dec_many": gpg_dec_many}
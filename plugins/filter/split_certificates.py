@@ -6,12 +6,17 @@ Each certificate in the list is a string that begins with "-----BEGIN CERTIFICAT
 
 The module also includes a `FilterModule` class that makes the `split_certificates` function available as a filter in Ansible playbooks.
 
+Certificates are found with the single pass PEM scanner of `pem_core`, which also returns keys, certificate signing requests
+and CRLs as typed blocks through the `pem_blocks` filter.
+
 This module is part of the arpanrec.nebula collection.
 
 Author:
     Arpan Mandal (arpan.rec@gmail.com)
 """
 
+from ansible_collections.arpanrec.nebula.plugins.module_utils.pem_core import iter_pem_blocks
+
 
 def split_certificates(string):
     """
@@ -26,32 +31,38 @@ def split_certificates(string):
     Returns:
         list: A list of strings, where each string is a PEM-formatted certificate.
     """
+    return [block["pem"] for block in iter_pem_blocks(string, types=["certificate"])]
+
+
+def pem_blocks(string, types=None, lazy=False):
+    """
+    Splits a string of PEM blocks into typed blocks.
 
-    list_of_certs = []
-    list_of_lines = string.split("\n")
-    for line in list_of_lines:
-        if line == "-----BEGIN CERTIFICATE-----":
-            temp_cert_list = []
-            temp_cert_list.append(line)
-        elif line == "":
-            continue
-        elif line == "-----END CERTIFICATE-----":
-            temp_cert_list.append(line + "\n")
-            certificate = "\n".join(temp_cert_list)
-            list_of_certs.append(certificate)
-        else:
-            temp_cert_list.append(line)
-    return list_of_certs
+    This function scans the string once and returns every PEM block, certificates, private keys, certificate signing requests,
+    CRLs and public keys, as a dictionary with the `type`, the `label` of the BEGIN line, and the `pem` block.
+
+    Parameters:
+        string (str): A string containing one or more PEM blocks.
+        types (list): Only return blocks of these types: certificate, private_key, csr, crl, public_key, other.
+        lazy (bool): Return a generator instead of a list, to iterate over large bundles in a template loop.
+
+    Returns:
+        list: A list of dictionaries with `type`, `label` and `pem`.
+    """
+    blocks = iter_pem_blocks(string, types=types)
+    if lazy:
+        return blocks
+    return list(blocks)
 
 
 class FilterModule:
     """
     A filter plugin class for Ansible.
 
-    This class provides a filter named 'split_certificates' that can be used in Ansible templates. The filter takes a string of concatenated PEM-formatted certificates and splits it into a list of individual certificates.
+    This class provides the filters 'split_certificates' and 'pem_blocks' that can be used in Ansible templates. The filters take a string of concatenated PEM blocks and split it into a list of individual certificates, or of typed blocks.
 
     Methods:
-        filters: Returns a dictionary mapping the filter name ('split_certificates') to the filter function.
+        filters: Returns a dictionary mapping the filter names ('split_certificates', 'pem_blocks') to the filter functions.
     """
 
     def filters(self):
@@ -63,4 +74,4 @@ class FilterModule:
         Returns:
             dict: A dictionary where the keys are filter names and the values are the corresponding filter functions.
         """
-        return {"split_certificates": split_certificates}
+        return {"split_certificates": split_certificates, "pem_blocks": pem_blocks}
@@ -1,10 +1,25 @@
 from __future__ import absolute_import, division, print_function
-from yaml.loader import SafeLoader
-import yaml
-from ansible.utils.vars import load_extra_vars
-from ansible.plugins.inventory import BaseInventoryPlugin
-import hvac
+import argparse
 import os
+import sys
+from collections.abc import Mapping
+from jinja2 import Undefined
+from ansible.errors import AnsibleParserError
+from ansible.inventory.data import InventoryData
+from ansible.module_utils.common.text.converters import to_native
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible.plugins.loader import init_plugin_loader, inventory_loader
+from ansible_collections.arpanrec.nebula.plugins.module_utils.hashicorp_vault_core import (
+    authenticate,
+    join_path,
+    read_snapshot,
+    register_lazy_host,
+    shard_of,
+    vault_client,
+    walk_kv_tree,
+    write_snapshot,
+)
 
 __metaclass__ = type
 
@@ -14,7 +29,24 @@ DOCUMENTATION = r"""
   requirements:
       - python >= 3
       - hvac >= 1.0.2
-  description: Reads inventories from the HashiCorp Vault KV engine.
+  description:
+    - Reads inventories from the HashiCorp Vault KV engine.
+    - Every secret below O(path) is a host, the secret data are the host variables.
+    - Every folder below O(path) is a group, nested folders are child groups.
+    - Hosts and groups are named by the last segment of their path, host names must be unique in the whole tree,
+      folders with the same name in different places share one group.
+    - With O(cache) enabled the secrets are stored in the inventory cache together with their KV version,
+      later runs use the cached inventory as is, or with O(cache_check_versions) read the metadata
+      and read again only the secrets whose version changed.
+    - The cache contains the host variables, which are secrets, protect the cache connection accordingly.
+    - With O(lazy_vars) only the hosts and groups are listed, the host variables are read by the
+      P(arpanrec.nebula.vault_inv_vars#vars) vars plugin the first time a host is used.
+    - O(compose), O(groups) and O(keyed_groups) are evaluated in a single pass over the hosts,
+      every expression is compiled once and reused for all hosts.
+      With O(lazy_vars) the expressions only see the variables known to the inventory, not the secrets.
+  extends_documentation_fragment:
+    - inventory_cache
+    - constructed
   options:
     plugin:
       description: The name of this plugin, it should always be set to 'vault_inv' for this plugin to recognize it as it's own.
@@ -39,54 +71,228 @@ DOCUMENTATION = r"""
       default: "/"
     token:
       description:
-        - Vault Token.
+        - Vault Token, used with O(auth_method=token).
         - Environment variable `VAULT_TOKEN` has more priority
       type: str
-      required: true
+      required: false
+    auth_method:
+      description:
+        - How to get a vault token.
+        - V(token) uses O(token).
+        - V(approle) logs in with O(role_id) and O(secret_id).
+        - V(jwt) logs in with O(jwt) and O(role).
+        - V(cert) logs in with the TLS client certificate O(cert) and the certificate role O(role).
+      type: str
+      required: false
+      default: token
+      choices:
+        - token
+        - approle
+        - jwt
+        - cert
+      env:
+        - name: VAULT_AUTH_METHOD
+    auth_mount_point:
+      description: Mount point of the auth method, defaults to the name of O(auth_method).
+      type: str
+      required: false
+    role:
+      description: Role to log in with, for O(auth_method=jwt) and O(auth_method=cert).
+      type: str
+      required: false
+      env:
+        - name: VAULT_ROLE
+    role_id:
+      description: AppRole role id.
+      type: str
+      required: false
+      env:
+        - name: VAULT_ROLE_ID
+    secret_id:
+      description: AppRole secret id.
+      type: str
+      required: false
+      env:
+        - name: VAULT_SECRET_ID
+    jwt:
+      description: The signed JSON Web Token, for example the CI job token.
+      type: str
+      required: false
+      env:
+        - name: VAULT_JWT
+    token_cache_path:
+      description:
+        - File keeping the token issued by O(auth_method), written with mode 0600.
+        - Later runs reuse the token until it is within O(token_renew_threshold) of its expiry,
+          then it is renewed, and vault is only logged in again when the renewal fails.
+        - The cached token is checked with a token lookup before it is reused, a revoked token leads to a new login.
+        - Empty to log in on every run.
+      type: path
+      required: false
+      default: ~/.ansible/vault_inv_token.json
+    token_renew_threshold:
+      description: Remaining TTL in seconds below which the cached token is renewed.
+      type: int
+      required: false
+      default: 300
+    shard_count:
+      description:
+        - Number of shards the hosts are split in, by rendezvous hashing of the inventory hostname.
+        - A host always belongs to the same shard, changing O(shard_count) only moves the hosts of the added or removed shards.
+        - Groups are listed in every shard, only the hosts are split.
+      type: int
+      required: false
+      default: 1
+      env:
+        - name: VAULT_INV_SHARD_COUNT
+    shard_index:
+      description: Shard to load, from 0 to O(shard_count) - 1.
+      type: int
+      required: false
+      default: 0
+      env:
+        - name: VAULT_INV_SHARD_INDEX
     verify:
       description:
         - Verify Vault HTTPS Connection
         - False to disable verification
         - Environment variable `VAULT_CAPATH` < `VAULT_CACERT`, this comes in to effect if `verify` is not provided.
+      type: raw
       required: false
       default: true
     cert:
       description:
         - Mutual Client Certificate
         - Environment variable `VAULT_CLIENT_CERT` and `VAULT_CLIENT_KEY`
-      type: tuple
+      type: list
+      elements: str
+      required: false
+    concurrency:
+      description:
+        - Maximum number of concurrent requests to vault while walking the KV tree.
+        - Also the size of the HTTP connection pool.
+      type: int
+      required: false
+      default: 10
+    cache_check_versions:
+      description:
+        - When the inventory is found in the cache, compare the cached KV versions with the secret metadata
+          and read again only the secrets which changed.
+        - Every folder is listed and the metadata of every secret is read, one request per secret,
+          so it costs about as many requests as reading the whole tree again, only the secret data is saved.
+        - False to use the cached inventory as is, without any request to vault, until O(cache_timeout) expires.
+      type: bool
+      required: false
+      default: false
+    lazy_vars:
+      description:
+        - Only list the KV tree to build the hosts and groups, do not read any secret.
+        - The P(arpanrec.nebula.vault_inv_vars#vars) vars plugin must be enabled, it reads the secret of a host
+          the first time Ansible asks for its variables and keeps it for the rest of the run.
+        - Hosts excluded with C(--limit) are never read.
+      type: bool
       required: false
+      default: false
+    snapshot_path:
+      description:
+        - Path of a gzip compressed json snapshot of the resolved inventory, hosts, groups, host variables and KV versions.
+        - When the snapshot exists, is younger than O(snapshot_ttl) and was taken with the same O(hostname), O(mount_point),
+          O(path) and O(lazy_vars), the inventory is loaded from it without any request to vault.
+        - Otherwise, or when the cache is flushed, vault is walked and the snapshot is written again.
+        - A truncated or corrupt snapshot is ignored with a warning and replaced by a fresh walk.
+        - The snapshot contains the host variables, which are secrets, it is written with mode 0600.
+        - Run C(python -m ansible_collections.arpanrec.nebula.plugins.inventory.vault_inv inventory.yml) to refresh it ahead of time.
+      type: path
+      required: false
+    snapshot_ttl:
+      description: Maximum age of the snapshot in seconds, 0 to never expire.
+      type: int
+      required: false
+      default: 3600
 """
 
 EXAMPLES = """
 # inventory.yml
 plugin: arpanrec.nebula.vault_inv
-host: http://localhost:8200
+hostname: http://localhost:8200
+mount_point: secret
+path: ansible/inventory
+concurrency: 20
+
+# inventory.yml, cached in a json file for a day
+plugin: arpanrec.nebula.vault_inv
+mount_point: secret
+path: ansible/inventory
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.ansible/tmp/vault_inv
+cache_timeout: 86400
+
+# inventory.yml, secrets are read only for the hosts used by the play
+# ansible.cfg:
+#   [defaults]
+#   vars_plugins_enabled = ansible.builtin.host_group_vars,arpanrec.nebula.vault_inv_vars
+plugin: arpanrec.nebula.vault_inv
+mount_point: secret
+path: ansible/inventory
+lazy_vars: true
+
+# inventory.yml, loaded from a snapshot refreshed every 6 hours
+plugin: arpanrec.nebula.vault_inv
+mount_point: secret
+path: ansible/inventory
+snapshot_path: /var/cache/ansible/vault_inv.json.gz
+snapshot_ttl: 21600
+
+# inventory.yml, grouped by the role, environment and region stored in the host secrets
+plugin: arpanrec.nebula.vault_inv
+mount_point: secret
+path: ansible/inventory
+compose:
+  ansible_host: address | default(inventory_hostname)
+groups:
+  production: environment == "prod"
+keyed_groups:
+  - key: role
+    prefix: role
+  - key: region
+    prefix: region
+    default_value: unknown
+
+# inventory.yml, logged in with AppRole, the token is reused by later runs
+plugin: arpanrec.nebula.vault_inv
+hostname: https://vault.example.com:8200
+mount_point: secret
+path: ansible/inventory
+auth_method: approle
+# role_id and secret_id from the environment variables VAULT_ROLE_ID and VAULT_SECRET_ID
+
+# inventory.yml, the controller containers set VAULT_INV_SHARD_INDEX to 0, 1, 2 and 3
+plugin: arpanrec.nebula.vault_inv
+mount_point: secret
+path: ansible/inventory
+shard_count: 4
+
+# refresh the snapshot, e.g. when building the CI runner image
+# PYTHONPATH=~/.ansible/collections python -m ansible_collections.arpanrec.nebula.plugins.inventory.vault_inv inventory.yml
 """
 
 
-class VaultInventoryModule(BaseInventoryPlugin):
+class VaultInventoryModule(BaseInventoryPlugin, Cacheable, Constructable):
     NAME = "vault_inv"
 
-    __inventory_config = {}
-
     def verify_file(self, path):
         """return true/false if this is possibly a valid file for this plugin to consume"""
         valid = False
         if super(VaultInventoryModule, self).verify_file(path):
-            with open(path, encoding="utf-8") as inventory_file_stream:
-                self.__inventory_config = yaml.load(
-                    inventory_file_stream, Loader=SafeLoader
-                )
-                self.display.vvv("Ansible Inventory Loaded from: " + path)
-                self.display.vvvv(
-                    "Ansible Inventory Information: " + self.__inventory_config
-                )
-                valid = True
+            valid = path.endswith((".yml", ".yaml"))
+            self.display.vvv("Ansible Inventory Loaded from: " + path)
         return valid
 
     def parse(self, inventory, loader, path, cache=True):
         super(VaultInventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
         self.display.vvvv("Adding Localhost")
         self.inventory.add_host("localhost")
         self.inventory.set_variable("localhost", "ansible_connection", "local")
@@ -95,26 +301,249 @@ class VaultInventoryModule(BaseInventoryPlugin):
         )
 
         self.display.vvvv("Parsing Vault inventory : " + path)
-        self.inventory = inventory
-        self._vars = load_extra_vars(loader)
+        shard_count = self.get_option("shard_count")
+        shard_index = self.get_option("shard_index")
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise AnsibleParserError(f"shard_index must be between 0 and shard_count - 1, got {shard_index} of {shard_count}")
+        cache_key = self.get_cache_key(path)
+        if shard_count > 1:
+            cache_key = f"{cache_key}_shard{shard_index}of{shard_count}"
+        user_cache_setting = self.get_option("cache")
+        cached_tree = None
+        if user_cache_setting and cache:
+            try:
+                cached_tree = self._cache[cache_key]
+            except KeyError:
+                self.display.vvv("vault_inv: inventory not found in cache")
+
+        lazy_vars = self.get_option("lazy_vars")
+        client = None
+        snapshot_path = self.get_option("snapshot_path")
+        snapshot_source = {
+            "hostname": self.get_option("hostname"),
+            "mount_point": self.get_option("mount_point"),
+            "path": self.get_option("path"),
+            "lazy_vars": lazy_vars,
+            "shard": [shard_index, shard_count],
+        }
+        snapshot = None
+        if snapshot_path and cache:
+            snapshot = read_snapshot(snapshot_path, self.get_option("snapshot_ttl"), snapshot_source, warn=self.display.warning)
+
+        if snapshot:
+            self.display.v(f"vault_inv: inventory loaded from snapshot {snapshot_path}")
+            tree = snapshot
+        elif cached_tree and not self.get_option("cache_check_versions"):
+            tree = cached_tree
+        else:
+            client = self.get_vault_client()
+            tree = walk_kv_tree(
+                client,
+                mount_point=self.get_option("mount_point"),
+                path=self.get_option("path"),
+                concurrency=self.get_option("concurrency"),
+                read=not lazy_vars,
+                known=cached_tree["leaves"] if cached_tree else None,
+                select=(lambda leaf: shard_of(leaf.rpartition("/")[2], shard_count) == shard_index) if shard_count > 1 else None,
+            )
+            for phase, seconds in tree["timings"].items():
+                self.display.v(f"vault_inv: {phase} phase took {seconds:.3f}s")
+            if user_cache_setting:
+                self._cache[cache_key] = {"leaves": tree["leaves"], "folders": tree["folders"]}
+            if snapshot_path:
+                write_snapshot(snapshot_path, tree, snapshot_source)
+
+        self._populate(tree)
+        self._construct([leaf.rpartition("/")[2] for leaf in tree["leaves"]])
+        if lazy_vars:
+            client = client or self.get_vault_client()
+            for leaf in tree["leaves"]:
+                register_lazy_host(
+                    leaf.rpartition("/")[2], client, self.get_option("mount_point"), join_path(self.get_option("path"), leaf)
+                )
+
+    def _construct(self, hostnames: list) -> None:
+        """
+        Applies `compose`, `groups` and `keyed_groups` to the hosts in one pass.
+        The expressions are compiled once, then evaluated against the variables of each host.
+        """
+        compose = self.get_option("compose") or {}
+        groups = self.get_option("groups") or {}
+        keyed_groups = [keyed for keyed in self.get_option("keyed_groups") or [] if keyed and isinstance(keyed, dict)]
+        if not (compose or groups or keyed_groups):
+            return
+        strict = self.get_option("strict")
+
+        environment = self.templar.environment
+        compiled_compose = [(name, environment.compile_expression(expression, undefined_to_none=False)) for name, expression in compose.items()]
+        compiled_groups = [
+            (self._sanitize_group_name(name), environment.compile_expression(conditional, undefined_to_none=False))
+            for name, conditional in groups.items()
+        ]
+        compiled_keyed_groups = []
+        for keyed in keyed_groups:
+            if keyed.get("trailing_separator") is not None and keyed.get("default_value") is not None:
+                raise AnsibleParserError("parameters are mutually exclusive for keyed groups: default_value|trailing_separator")
+            parent_group = keyed.get("parent_group")
+            if parent_group:
+                parent_group = self.inventory.add_group(self._sanitize_group_name(self.templar.template(parent_group)))
+            compiled_keyed_groups.append((keyed, environment.compile_expression(keyed.get("key"), undefined_to_none=False), parent_group))
+
+        extra_vars = self._vars if self.get_option("use_extra_vars") else {}
+        for hostname in hostnames:
+            variables = self.inventory.get_host(hostname).get_vars()
+            variables.update(extra_vars)
+
+            for name, expression in compiled_compose:
+                try:
+                    value = self._evaluate(expression, variables)
+                except Exception as ex:  # pylint: disable=broad-except
+                    if strict:
+                        raise AnsibleParserError(f"Could not set {name} for host {hostname}: {to_native(ex)}") from ex
+                    continue
+                self.inventory.set_variable(hostname, name, value)
+                variables[name] = value
+
+            for group, conditional in compiled_groups:
+                try:
+                    result = self._evaluate(conditional, variables)
+                except Exception as ex:  # pylint: disable=broad-except
+                    if strict:
+                        raise AnsibleParserError(f"Could not add host {hostname} to group {group}: {to_native(ex)}") from ex
+                    continue
+                if result:
+                    self.inventory.add_child(self.inventory.add_group(group), hostname)
+
+            for keyed, expression, parent_group in compiled_keyed_groups:
+                try:
+                    key = self._evaluate(expression, variables)
+                except Exception as ex:  # pylint: disable=broad-except
+                    if strict:
+                        raise AnsibleParserError(f"Could not generate group for host {hostname} from {keyed.get('key')} entry: {to_native(ex)}") from ex
+                    continue
+                group_names = self._keyed_group_names(keyed, key)
+                if not group_names and strict and key not in ([], {}):
+                    raise AnsibleParserError(f"No key or key resulted empty for {keyed.get('key')} in host {hostname}, invalid entry")
+                for group in group_names:
+                    group = self.inventory.add_group(group)
+                    self.inventory.add_host(hostname, group)
+                    if parent_group:
+                        self.inventory.add_child(parent_group, group)
 
     @staticmethod
-    def get_from_vault(
-        hostname: str = "http://localhost:8200",
-        mount_point: str = "secret",
-        path: str = "/",
-        token: str = None,
-        verify: bool = False,
-        cert: tuple = None,
-    ) -> None:
-        vault_client = hvac.Client(
-            hostname,
-            token=os.environ.get("VAULT_TOKEN", token),
-            verify=verify,
+    def _evaluate(expression, variables: dict):
+        """Evaluates a compiled expression, undefined results are errors"""
+        result = expression(variables)
+        if isinstance(result, Undefined):
+            result._fail_with_undefined_error()  # pylint: disable=protected-access
+        return result
+
+    def _keyed_group_names(self, keyed: dict, key) -> list:
+        """Sanitized group names of a `keyed_groups` entry for the evaluated `key`, same rules as the constructed plugin"""
+        default_value = keyed.get("default_value")
+        if key in (None, "") and default_value is not None:
+            raw_names = [default_value]
+        elif not key:
+            return []
+        elif isinstance(key, (str, int, float)):
+            raw_names = [str(key)]
+        elif isinstance(key, list):
+            raw_names = [default_value if name in (None, "") and default_value is not None else name for name in key]
+        elif isinstance(key, Mapping):
+            separator = keyed.get("separator", "_")
+            raw_names = []
+            for name, value in key.items():
+                if value in (None, "") and default_value is not None:
+                    value = default_value
+                if value in (None, "") and keyed.get("trailing_separator") is False:
+                    raw_names.append(name)
+                else:
+                    raw_names.append(f"{name}{separator}{value}")
+        else:
+            raise AnsibleParserError(f"Invalid group name format, expected a string or a list of them or dictionary, got: {type(key)}")
+
+        prefix = keyed.get("prefix", "")
+        separator = keyed.get("separator", "_")
+        if prefix == "" and self.get_option("leading_separator") is False:
+            separator = ""
+        return [self._sanitize_group_name(f"{prefix}{separator}{name}") for name in raw_names]
+
+    def get_vault_client(self):
+        """Authenticated vault client of the configured connection options, see `vault_client` and `authenticate`"""
+        cert = tuple(self.get_option("cert")) if self.get_option("cert") else None
+        client = vault_client(
+            self.get_option("hostname"),
+            token=self.get_option("token"),
+            verify=self.get_option("verify"),
             cert=cert,
+            pool_size=self.get_option("concurrency"),
         )
-        print(vault_client.is_authenticated())
-        secret_version_response = vault_client.secrets.kv.v2.read_secret_version(
-            path=path, mount_point=mount_point
+        authenticate(
+            client,
+            auth_method=self.get_option("auth_method"),
+            auth_mount_point=self.get_option("auth_mount_point"),
+            role=self.get_option("role"),
+            role_id=self.get_option("role_id"),
+            secret_id=self.get_option("secret_id"),
+            jwt=self.get_option("jwt"),
+            cert=cert,
+            token_cache_path=self.get_option("token_cache_path"),
+            renew_threshold=self.get_option("token_renew_threshold"),
         )
-        print(secret_version_response)
+        return client
+
+    def _populate(self, tree: dict) -> None:
+        """
+        Adds the folders of the walked tree as groups and the leaves as hosts.
+
+        Hosts and groups are named by the last segment of their path, folders with the same name share one group,
+        and two leaves with the same name are refused instead of one silently overwriting the other.
+        """
+        leaf_of = {}
+        for leaf in tree["leaves"]:
+            hostname = leaf.rpartition("/")[2]
+            if hostname in leaf_of:
+                raise AnsibleParserError(f"Duplicate host {hostname} at {leaf_of[hostname]} and {leaf}, host names must be unique in the tree")
+            leaf_of[hostname] = leaf
+
+        for folder in tree["folders"]:
+            group = self.inventory.add_group(self._sanitize_group_name(folder.rsplit("/", 1)[-1]))
+            if "/" in folder:
+                parent = self.inventory.add_group(self._sanitize_group_name(folder.rsplit("/", 2)[-2]))
+                self.inventory.add_child(parent, group)
+
+        for leaf, secret in tree["leaves"].items():
+            folder, _, hostname = leaf.rpartition("/")
+            group = self._sanitize_group_name(folder.rsplit("/", 1)[-1]) if folder else None
+            self.inventory.add_host(hostname, group=group)
+            for key, value in (secret["data"] if secret else {}).items():
+                self.inventory.set_variable(hostname, key, value)
+
+
+class InventoryModule(VaultInventoryModule):
+    """Ansible loads inventory plugins by this class name, which also names the plugin type of the options"""
+
+
+def main():
+    """
+    Walks vault for the given inventory file and writes its snapshot, without any existing snapshot or cache.
+    """
+    parser = argparse.ArgumentParser(prog="vault_inv", description="Write the snapshot of a vault_inv inventory.")
+    parser.add_argument("inventory", help="vault_inv inventory file with snapshot_path")
+    args = parser.parse_args()
+
+    # Started with `python -m`, the collection was imported as a plain package, let the collection loader import it again.
+    for module_name in [name for name in sys.modules if name.startswith("ansible_collections")]:
+        del sys.modules[module_name]
+    init_plugin_loader()
+    inventory_path = os.path.abspath(args.inventory)
+    plugin = inventory_loader.get("arpanrec.nebula.vault_inv")
+    inventory = InventoryData()
+    plugin.parse(inventory, DataLoader(), inventory_path, cache=False)
+    if not plugin.get_option("snapshot_path"):
+        parser.error(f"snapshot_path is not set in {inventory_path}")
+    print(f"{len(inventory.hosts)} hosts written to {plugin.get_option('snapshot_path')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+This module provides a lookup reading many secrets from the HashiCorp Vault KV v2 engine at once.
+
+The secrets are read concurrently over one pooled HTTP session, a path repeated in the terms is read once.
+Ansible runs every lookup in a new worker process, so call it once per play, with `run_once`, to read the secrets once.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.lookup import LookupBase
+from ansible_collections.arpanrec.nebula.plugins.module_utils.hashicorp_vault_core import read_secrets, vault_client
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+  name: vault_kv_many
+  short_description: Read many secrets from the hashicorp vault KV v2 engine at once.
+  requirements:
+      - python >= 3
+      - hvac >= 1.0.2
+  description:
+    - Reads the latest version of every secret path in the terms, concurrently over one pooled HTTP session.
+    - A path repeated in the terms is read once, nothing is kept between tasks or hosts.
+    - Call it once for all the hosts, for example with C(run_once), instead of once per host.
+  options:
+    _terms:
+      description: Paths of the secrets, relative to O(mount_point), lists are flattened.
+      required: true
+    url:
+      description: The URL of the hashicorp vault.
+      type: str
+      default: http://localhost:8200
+      env:
+        - name: VAULT_ADDR
+    token:
+      description:
+        - Vault Token.
+        - Environment variable `VAULT_TOKEN` has more priority
+      type: str
+      required: false
+    mount_point:
+      description: Name of KV secret engine.
+      type: str
+      default: secret
+    verify:
+      description:
+        - Verify Vault HTTPS Connection
+        - False to disable verification, or the path of a CA bundle.
+      type: raw
+      default: true
+    concurrency:
+      description: Maximum number of concurrent requests to vault, also the size of the HTTP connection pool.
+      type: int
+      default: 10
+"""
+
+EXAMPLES = r"""
+- name: Read the inventory secret of many hosts
+  ansible.builtin.set_fact:
+    host_secrets: >-
+      {{ query('arpanrec.nebula.vault_kv_many', ['ansible/inventory/web1', 'ansible/inventory/web2'],
+      url='https://vault.example.com:8200', token=vault_token) }}
+"""
+
+RETURN = r"""
+_raw:
+  description: The secret data of every path, in the order of the terms, empty for a missing or deleted secret.
+  type: list
+  elements: dict
+"""
+
+
+class LookupModule(LookupBase):
+    """
+    Lookup reading many vault KV v2 secrets concurrently.
+    """
+
+    def run(self, terms, variables=None, **kwargs):
+        """
+        Returns the secret data of every path in `terms`.
+        """
+        self.set_options(var_options=variables, direct=kwargs)
+        paths = self._flatten(terms)
+        concurrency = self.get_option("concurrency")
+
+        client = vault_client(
+            self.get_option("url"),
+            token=self.get_option("token"),
+            verify=self.get_option("verify"),
+            pool_size=concurrency,
+        )
+
+        try:
+            return read_secrets(client, self.get_option("mount_point"), paths, concurrency=concurrency)
+        except Exception as ex:
+            raise AnsibleError(f"Unable to read secrets from vault: {to_native(ex)}") from ex
@@ -0,0 +1,254 @@
+"""
+GitHub helpers shared by the arpanrec.nebula plugins.
+
+All requests of a client go through one pooled HTTP session, and the `X-RateLimit-Remaining` and `X-RateLimit-Reset`
+headers of every response are tracked, when the remaining requests drop to a threshold the next requests wait for the reset.
+Secondary rate limits, a 403 or 429 with `Retry-After`, are retried after the given delay.
+
+The public key of a repository or an organization and the login of the PAT owner are fetched once per client,
+so sealing many secrets for the same scope needs one public key request.
+
+GitHub never returns secret values, so a ledger keeps an HMAC of every plain text secret that was sent,
+with the `updated_at` GitHub reported after it, a secret whose digest and `updated_at` are unchanged does not need to be sent again.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import b64encode
+
+import requests
+from nacl import encoding, public
+from requests.adapters import HTTPAdapter
+
+
+def encrypt(public_key: str, secret_value: str) -> str:
+    """Encrypt a Unicode string using the public key."""
+    public_key = public.PublicKey(public_key.encode("utf-8"), encoding.Base64Encoder())
+    sealed_box = public.SealedBox(public_key)
+    encrypted = sealed_box.encrypt(secret_value.encode("utf-8"))
+    return b64encode(encrypted).decode("utf-8")
+
+
+def _response_error(response: requests.Response) -> dict:
+    """
+    Error of a failed response, the JSON body when there is one.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return {"response": body, "status": response.status_code}
+
+
+class GithubClient:
+    """
+    Pooled, rate limit aware GitHub REST API client, safe to share between threads.
+
+    Parameters:
+        api_ep (str): The endpoint of the GitHub API, like `https://api.github.com`.
+        pat (str): The Personal Access Token (PAT) for the GitHub API.
+        pool_size (int): Maximum number of connections kept open.
+        min_remaining (int): Requests wait for the rate limit reset when no more than this many remain.
+        max_retries (int): Maximum number of retries of a request hitting a rate limit.
+    """
+
+    def __init__(self, api_ep: str, pat: str, pool_size: int = 8, min_remaining: int = 10, max_retries: int = 5):
+        self.api_ep = api_ep.rstrip("/")
+        self.min_remaining = min_remaining
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/vnd.github+json", "Authorization": f"token {pat}"})
+        self._lock = threading.Lock()
+        self._rate_limit_remaining = None
+        self._rate_limit_reset = 0.0
+        self._public_keys = {}
+        self._login = None
+
+    def _wait_for_rate_limit(self) -> None:
+        """
+        Sleeps until the rate limit reset when no more than `min_remaining` requests remain.
+        """
+        with self._lock:
+            remaining, reset = self._rate_limit_remaining, self._rate_limit_reset
+        if remaining is not None and remaining <= self.min_remaining and reset > time.time():
+            time.sleep(reset - time.time() + 1)
+
+    def _track_rate_limit(self, response: requests.Response) -> None:
+        """
+        Keeps the rate limit headers of `response`.
+        """
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            self._rate_limit_remaining = int(remaining)
+            self._rate_limit_reset = float(reset)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request to `path`, relative to the API endpoint or absolute, retrying it when a rate limit is hit.
+        """
+        url = path if path.startswith(("https://", "http://")) else f"{self.api_ep}/{path.lstrip('/')}"
+        kwargs.setdefault("timeout", 30)
+        for _ in range(self.max_retries):
+            self._wait_for_rate_limit()
+            response = self.session.request(method, url, **kwargs)
+            self._track_rate_limit(response)
+            if response.status_code not in (403, 429):
+                return response
+            if "Retry-After" in response.headers:
+                time.sleep(int(response.headers["Retry-After"]))
+            elif response.headers.get("X-RateLimit-Remaining") == "0":
+                time.sleep(max(float(response.headers.get("X-RateLimit-Reset", 0)) - time.time(), 0) + 1)
+            else:
+                return response
+        return response
+
+    def login(self) -> str:
+        """
+        Login of the PAT owner, fetched once.
+        """
+        if self._login is None:
+            response = self.request("GET", "user")
+            response.raise_for_status()
+            self._login = response.json()["login"]
+        return self._login
+
+    def scope(self, owner: str = None, repository: str = None, organization: str = None) -> str:
+        """
+        API path of the secrets of a repository, `repos/<owner>/<repository>`, or of an organization, `orgs/<organization>`.
+
+        The repository owner is `owner`, else `organization`, else the PAT owner.
+        """
+        if repository:
+            return f"repos/{owner or organization or self.login()}/{repository}"
+        return f"orgs/{organization}"
+
+    def public_key(self, scope: str) -> dict:
+        """
+        Actions public key of `scope`, with `key` and `key_id`, fetched once per scope.
+        """
+        with self._lock:
+            if scope in self._public_keys:
+                return self._public_keys[scope]
+        response = self.request("GET", f"{scope}/actions/secrets/public-key")
+        if response.status_code != 200:
+            raise GithubError(_response_error(response))
+        key = response.json()
+        with self._lock:
+            self._public_keys[scope] = {"key": key["key"], "key_id": key["key_id"]}
+        return self._public_keys[scope]
+
+    def list_secrets(self, scope: str) -> dict:
+        """
+        Actions secrets of `scope` by name, with `updated_at`, 100 per page following the `next` links.
+        """
+        secrets = {}
+        url = f"{scope}/actions/secrets?per_page=100"
+        while url:
+            response = self.request("GET", url)
+            if response.status_code != 200:
+                raise GithubError(_response_error(response))
+            for secret in response.json().get("secrets", []):
+                secrets[secret["name"]] = secret
+            url = response.links.get("next", {}).get("url")
+        return secrets
+
+    def get_secret(self, scope: str, name: str) -> dict:
+        """
+        Actions secret `name` of `scope`, with `updated_at`, None when it does not exist.
+        """
+        response = self.request("GET", f"{scope}/actions/secrets/{name}")
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise GithubError(_response_error(response))
+        return response.json()
+
+    def put_secret(self, scope: str, name: str, unencrypted_secret: str, visibility: str = None) -> dict:
+        """
+        Seals `unencrypted_secret` with the public key of `scope` and creates or updates the secret `name`.
+
+        Returns:
+            dict: `created` or `updated`, or `error`.
+        """
+        try:
+            key = self.public_key(scope)
+        except GithubError as ex:
+            return {"error": ex.args[0]}
+        data = {"encrypted_value": encrypt(key["key"], unencrypted_secret), "key_id": key["key_id"]}
+        if scope.startswith("orgs/"):
+            data["visibility"] = visibility
+        response = self.request("PUT", f"{scope}/actions/secrets/{name}", json=data)
+        if response.status_code == 201:
+            return {"created": True}
+        if response.status_code == 204:
+            return {"updated": True}
+        return {"error": _response_error(response)}
+
+    def delete_secret(self, scope: str, name: str) -> dict:
+        """
+        Deletes the secret `name` of `scope`.
+
+        Returns:
+            dict: `deleted`, false when it did not exist, or `error`.
+        """
+        response = self.request("DELETE", f"{scope}/actions/secrets/{name}")
+        if response.status_code == 204:
+            return {"deleted": True}
+        if response.status_code == 404:
+            return {"deleted": False}
+        return {"error": _response_error(response)}
+
+
+def secret_digest(ledger_key: str, scope: str, name: str, unencrypted_secret: str) -> str:
+    """
+    HMAC-SHA256 of a plain text secret, bound to its scope and name, the only trace of it kept in a ledger.
+    """
+    message = f"{scope}/{name}\0{unencrypted_secret}".encode("utf-8")
+    return hmac.new(ledger_key.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def read_ledger(ledger_path: str) -> dict:
+    """
+    Reads a ledger file, empty when missing or unreadable.
+    """
+    try:
+        with open(ledger_path, encoding="utf-8") as ledger_file:
+            return json.load(ledger_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_ledger(ledger_path: str, ledger: dict) -> None:
+    """
+    Atomically writes a ledger file with mode 0600.
+    """
+    ledger_dir = os.path.dirname(os.path.abspath(ledger_path))
+    os.makedirs(ledger_dir, mode=0o700, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=ledger_dir, prefix=".github_ledger_")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as ledger_file:
+            json.dump(ledger, ledger_file, indent=1, sort_keys=True)
+        os.replace(temp_path, ledger_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class GithubError(Exception):
+    """
+    A GitHub API request failed, the argument is the status and the response.
+    """
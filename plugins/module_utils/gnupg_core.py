@@ -0,0 +1,533 @@
+"""
+GnuPG helpers shared by the arpanrec.nebula plugins.
+
+Preparing a keyring, importing the keys, trusting them and receiving them from a key server, spawns several gpg
+processes, so keyrings in a persistent GnuPG home are kept for the rest of the process, keyed by the GnuPG home and a hash
+of the key material. Ansible runs every task in a new worker process, so this only saves work within one task.
+
+Keys received from a key server are exported to a local cache, one file per fingerprint, and imported from
+there until they are older than a TTL, so encrypting for a known recipient needs no network round trip.
+
+The `temp` GnuPG home is a directory created for one call, `d_gpg_ops`, `d_gpg_ops_many` or `d_gpg_file_ops`,
+its gpg-agent is stopped and it is removed before the call returns, whatever the outcome. Ansible workers exit
+without running `atexit` handlers, so nothing is left to process exit.
+
+Files are streamed through gpg with a fixed size buffer and written atomically, whatever their size.
+
+Lists and nested dictionaries of values are processed with one keyring preparation, the leaves spread over a bounded thread pool.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import gnupg
+
+_KEYRINGS = {}
+_KEYRINGS_LOCK = threading.Lock()
+
+
+def _remove_gnupg_home(gnupg_home: str) -> None:
+    """
+    Stops the gpg-agent of a GnuPG home and removes the directory.
+    """
+    try:
+        subprocess.run(
+            ["gpgconf", "--homedir", gnupg_home, "--kill", "gpg-agent"],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        pass
+    shutil.rmtree(gnupg_home, ignore_errors=True)
+
+
+def _key_material_hash(key_path: str = None, key_contents: str = None, passphrase: str = None) -> str:
+    """
+    SHA-256 of the key file content, the key contents and the passphrase, a changed key file is a new keyring.
+    """
+    digest = hashlib.sha256()
+    if key_path:
+        with open(key_path, "rb") as key_file:
+            digest.update(key_file.read())
+    digest.update(b"\0")
+    if key_contents:
+        digest.update(key_contents.encode("utf-8"))
+    digest.update(b"\0")
+    if passphrase:
+        digest.update(passphrase.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _default_key_cache_dir() -> str:
+    """
+    Directory of the received keys cache when not given, `$XDG_CACHE_HOME/nebula-gpg-keys`.
+    """
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "nebula-gpg-keys")
+
+
+def _imports_fingerprint(import_result, fingerprint: str) -> bool:
+    """
+    Whether a gpg import or receive result contains the key `fingerprint`, a full fingerprint or a key id.
+    """
+    return any(imported and imported.upper().endswith(fingerprint) for imported in import_result.fingerprints)
+
+
+def receive_key(
+    gpg: gnupg.GPG,
+    key_server: str = "hkps://keys.openpgp.org",
+    fingerprint: str = None,
+    key_cache_dir: str = None,
+    key_cache_ttl: int = 86400,
+    offline: bool = False,
+) -> None:
+    """
+    Imports the public key `fingerprint` into `gpg`, from the local cache when possible, else from the key server.
+
+    A key received from the key server is exported to `<key_cache_dir>/<FINGERPRINT>.asc`. The cached key is imported
+    instead of receiving it again until it is older than `key_cache_ttl` seconds. When the key server cannot be reached,
+    an expired cached key is still used.
+
+    Parameters:
+        gpg (gnupg.GPG): The GnuPG instance to import the key into.
+        key_server (str): The key server to receive the key from.
+        fingerprint (str): The fingerprint of the key.
+        key_cache_dir (str): Directory of the cache, see `_default_key_cache_dir`.
+        key_cache_ttl (int): Seconds a cached key is used before it is received again.
+        offline (bool): Only use the cache, whatever the age of the cached key.
+    """
+    fingerprint = fingerprint.replace(" ", "").upper()
+    key_cache_dir = key_cache_dir or _default_key_cache_dir()
+    cache_path = os.path.join(key_cache_dir, f"{fingerprint}.asc")
+
+    cached_key = None
+    if os.path.isfile(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            cached_key = cache_file.read()
+        is_fresh = time.time() - os.path.getmtime(cache_path) < key_cache_ttl
+        if (offline or is_fresh) and _imports_fingerprint(gpg.import_keys(cached_key), fingerprint):
+            return
+
+    if offline:
+        raise ValueError(f"key {fingerprint} is not in the key cache {key_cache_dir} and offline is True")
+
+    if not _imports_fingerprint(gpg.recv_keys(key_server, fingerprint), fingerprint):
+        if cached_key and _imports_fingerprint(gpg.import_keys(cached_key), fingerprint):
+            return
+        raise ValueError(f"unable to receive key {fingerprint} from {key_server}")
+
+    os.makedirs(key_cache_dir, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=key_cache_dir)
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as cache_file:
+        cache_file.write(gpg.export_keys(fingerprint))
+    os.replace(temp_path, cache_path)
+
+
+def _resolve_gnupg_home(gnupg_home: str = None) -> str:
+    """
+    Returns the GnuPG home to use, `temp` is kept as is and created by `keyring`.
+    """
+    if not gnupg_home:
+        gnupg_env_home = os.getenv("GNUPGHOME", None)
+        if gnupg_env_home:
+            return gnupg_env_home
+        return str(Path.joinpath(Path.home(), ".gnupg"))
+    return gnupg_home
+
+
+def prepare_keyring(
+    gnupg_home: str = None,
+    key_server: str = "hkps://keys.openpgp.org",
+    fingerprint: str = None,
+    key_path: str = None,
+    key_contents: str = None,
+    passphrase: str = None,
+    mode: str = None,
+    recv_keys: bool = False,
+    key_cache_dir: str = None,
+    key_cache_ttl: int = 86400,
+    offline: bool = False,
+) -> tuple:
+    """
+    Returns a GnuPG instance with the keys imported and trusted, and the fingerprint to use.
+
+    The prepared keyring is kept for the rest of the process, a later call with the same GnuPG home,
+    key material, fingerprint and mode returns it without spawning any gpg process.
+    The `temp` GnuPG home is not accepted, use `keyring`.
+
+    Parameters:
+        gnupg_home (str): The GnuPG home directory.
+        key_server (str): The key server to receive the key from.
+        fingerprint (str): The fingerprint of the key.
+        key_path (str): The path of the key file to import.
+        key_contents (str): The contents of the key to import.
+        passphrase (str): The passphrase of the key.
+        mode (str): `encrypt` looks for public keys, `decrypt` for secret keys.
+        recv_keys (bool): Whether to receive the key from the key server, see `receive_key`.
+        key_cache_dir (str): Directory of the received keys cache.
+        key_cache_ttl (int): Seconds a received key is used from the cache before it is received again.
+        offline (bool): Only use the received keys cache, never the key server.
+
+    Returns:
+        tuple: The `gnupg.GPG` instance and the fingerprint of the key.
+    """
+    gnupg_home = _resolve_gnupg_home(gnupg_home)
+    cache_key = (
+        gnupg_home,
+        key_server if recv_keys else None,
+        fingerprint,
+        mode,
+        _key_material_hash(key_path=key_path, key_contents=key_contents, passphrase=passphrase),
+    )
+
+    if gnupg_home.lower() == "temp":
+        raise ValueError("the temp gnupg_home is only supported by keyring")
+
+    with _KEYRINGS_LOCK:
+        if cache_key in _KEYRINGS:
+            return _KEYRINGS[cache_key]
+
+        if not os.path.exists(gnupg_home):
+            os.makedirs(gnupg_home, exist_ok=True)
+        elif os.path.isfile(gnupg_home):
+            raise ValueError("gnupg_home is a file, not a directory")
+
+        _KEYRINGS[cache_key] = _import_keys(
+            gnupg_home,
+            key_server=key_server,
+            fingerprint=fingerprint,
+            key_path=key_path,
+            key_contents=key_contents,
+            passphrase=passphrase,
+            mode=mode,
+            recv_keys=recv_keys,
+            key_cache_dir=key_cache_dir,
+            key_cache_ttl=key_cache_ttl,
+            offline=offline,
+        )
+        return _KEYRINGS[cache_key]
+
+
+def _import_keys(
+    gnupg_home: str,
+    key_server: str = None,
+    fingerprint: str = None,
+    key_path: str = None,
+    key_contents: str = None,
+    passphrase: str = None,
+    mode: str = None,
+    recv_keys: bool = False,
+    key_cache_dir: str = None,
+    key_cache_ttl: int = 86400,
+    offline: bool = False,
+) -> tuple:
+    """
+    Imports and trusts the keys in the existing directory `gnupg_home`, see `prepare_keyring`.
+    """
+    gpg = gnupg.GPG(gnupghome=gnupg_home)
+    gpg.encoding = "utf-8"
+
+    if recv_keys and fingerprint:
+        receive_key(
+            gpg,
+            key_server=key_server,
+            fingerprint=fingerprint,
+            key_cache_dir=key_cache_dir,
+            key_cache_ttl=key_cache_ttl,
+            offline=offline,
+        )
+
+    if key_path:
+        gpg.import_keys_file(key_path, passphrase=passphrase)
+    if key_contents:
+        gpg.import_keys(key_contents, passphrase=passphrase)
+
+    keys_list = gpg.list_keys(mode == "decrypt")
+
+    if len(keys_list) == 0:
+        raise ValueError("no keys found")
+
+    if len(keys_list) > 1 and not fingerprint:
+        raise ValueError("multiple keys found, please specify a fingerprint")
+
+    if not fingerprint:
+        fingerprint = keys_list[0]["fingerprint"]
+
+    gpg.trust_keys(fingerprints=fingerprint, trustlevel="TRUST_ULTIMATE")
+    return gpg, fingerprint
+
+
+@contextlib.contextmanager
+def keyring(gnupg_home: str = None, **options):
+    """
+    Context manager yielding the `gnupg.GPG` instance and the fingerprint to use, see `prepare_keyring`.
+
+    With the `temp` GnuPG home, a new directory is created, its gpg-agent stopped and the directory removed,
+    with the imported keys, when the context exits, whatever the outcome.
+    Other GnuPG homes are prepared with `prepare_keyring`.
+    """
+    gnupg_home = _resolve_gnupg_home(gnupg_home)
+    if gnupg_home.lower() != "temp":
+        yield prepare_keyring(gnupg_home=gnupg_home, **options)
+        return
+
+    temp_home = tempfile.mkdtemp(prefix="nebula-gnupg-")
+    try:
+        yield _import_keys(temp_home, **options)
+    finally:
+        _remove_gnupg_home(temp_home)
+
+
+def _validate_options(
+    fingerprint: str = None,
+    key_path: str = None,
+    key_contents: str = None,
+    mode: str = None,
+    recv_keys: bool = False,
+) -> None:
+    """
+    Raises a `ValueError` for invalid combinations of the `d_gpg_ops` options.
+    """
+    if key_contents and key_path:
+        raise ValueError("key_contents and key_path are mutually exclusive")
+
+    if recv_keys and not fingerprint:
+        raise ValueError("recv_keys is True but fingerprint is None")
+
+    if mode not in ["encrypt", "decrypt"]:
+        raise ValueError("mode must be either encrypt or decrypt")
+
+    if mode == "decrypt" and recv_keys:
+        raise ValueError("mode is decrypt but recv_keys is True")
+
+
+def d_gpg_ops(
+    gnupg_home: str = None,
+    key_server: str = "hkps://keys.openpgp.org",
+    fingerprint: str = None,
+    key_path: str = None,
+    key_contents: str = None,
+    passphrase: str = None,
+    mode: str = None,
+    data: str = None,
+    recv_keys: bool = False,
+    key_cache_dir: str = None,
+    key_cache_ttl: int = 86400,
+    offline: bool = False,
+) -> str:
+    """
+    __gpg_ops:
+    - description: Performs encryption or decryption using GnuPG.
+    - parameters:
+        - gnupg_home: The path to the GnuPG home directory. Default is None.
+        - key_server: The key server to use for key operations. Default is 'hkps://keys.openpgp.org'.
+        - fingerprint: The fingerprint of the key to use for encryption or decryption. Required if recv_keys is False and key_path and key_contents are None.
+        - key_path: The path to the key file to use for encryption or decryption. Required if key_contents is None and recv_keys is False and fingerprint is None.
+        - key_contents: The contents of the key to use for encryption or decryption. Required if key_path is None and recv_keys is False and fingerprint is None.
+        - passphrase: The passphrase to use for key operations. Default is None.
+        - mode: The mode of operation. Must be either 'encrypt' or 'decrypt'. Required.
+        - data: The data to encrypt or decrypt. Required.
+        - recv_keys: Whether to receive the key from the key server. Default is False.
+        - key_cache_dir: Directory of the received keys cache. Default is $XDG_CACHE_HOME/nebula-gpg-keys.
+        - key_cache_ttl: Seconds a received key is used from the cache before it is received again. Default is 86400.
+        - offline: Only use the received keys cache, never the key server. Default is False.
+    - return: The result of the encryption or decryption operation.
+    """
+    if data is None or len(data) == 0:
+        raise ValueError("data is required")
+
+    _validate_options(fingerprint=fingerprint, key_path=key_path, key_contents=key_contents, mode=mode, recv_keys=recv_keys)
+
+    with keyring(
+        gnupg_home=gnupg_home,
+        key_server=key_server,
+        fingerprint=fingerprint,
+        key_path=key_path,
+        key_contents=key_contents,
+        passphrase=passphrase,
+        mode=mode,
+        recv_keys=recv_keys,
+        key_cache_dir=key_cache_dir,
+        key_cache_ttl=key_cache_ttl,
+        offline=offline,
+    ) as (gpg, fingerprint):
+        return _crypt(gpg, fingerprint, mode, data, passphrase)
+
+
+def _crypt(gpg: gnupg.GPG, fingerprint: str, mode: str, data: str, passphrase: str = None) -> str:
+    """
+    Encrypts or decrypts `data` with a prepared keyring.
+    """
+    if mode == "encrypt":
+        ascii_data = gpg.encrypt(data=data, recipients=fingerprint)
+
+    if mode == "decrypt":
+        ascii_data = gpg.decrypt(
+            message=data,
+            passphrase=passphrase,
+            extra_args=["--pinentry-mode", "loopback", "--recipient", fingerprint],
+        )
+
+    final_result = str(ascii_data)
+
+    if not ascii_data.ok or len(final_result) == 0:
+        raise ValueError("decryption failed : " + ascii_data.status)
+
+    return final_result
+
+
+def _collect_leaves(node, leaves: list) -> None:
+    """
+    Appends every non empty string of a nested structure of dictionaries and lists to `leaves`, depth first.
+    """
+    if isinstance(node, dict):
+        for value in node.values():
+            _collect_leaves(value, leaves)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            _collect_leaves(value, leaves)
+    elif isinstance(node, str) and len(node) > 0:
+        leaves.append(node)
+
+
+def _replace_leaves(node, results):
+    """
+    Returns a copy of a nested structure with every non empty string replaced by the next item of `results`,
+    in the order of `_collect_leaves`.
+    """
+    if isinstance(node, dict):
+        return {key: _replace_leaves(value, results) for key, value in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_replace_leaves(value, results) for value in node]
+    if isinstance(node, str) and len(node) > 0:
+        return next(results)
+    return node
+
+
+def d_gpg_ops_many(data, concurrency: int = 8, **gpg_options):
+    """
+    Performs `d_gpg_ops` on every non empty string of a list or nested dictionary, keeping its structure.
+
+    The keyring, a `temp` GnuPG home included, is prepared once for the whole call,
+    then the values are encrypted or decrypted by up to `concurrency` workers.
+    Other values, numbers, booleans, empty strings and None, are returned as they are.
+
+    Parameters:
+        data (dict|list|str): The values to encrypt or decrypt.
+        concurrency (int): Maximum number of concurrent gpg processes.
+        gpg_options: The options of `d_gpg_ops`, except `data`.
+
+    Returns:
+        dict|list|str: The same structure with the encrypted or decrypted values.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    leaves = []
+    _collect_leaves(data, leaves)
+    if len(leaves) == 0:
+        return _replace_leaves(data, iter([]))
+
+    options = {"gnupg_home": None, "key_server": "hkps://keys.openpgp.org", "recv_keys": False, **gpg_options}
+    _validate_options(
+        fingerprint=options.get("fingerprint"),
+        key_path=options.get("key_path"),
+        key_contents=options.get("key_contents"),
+        mode=options.get("mode"),
+        recv_keys=options["recv_keys"],
+    )
+
+    with keyring(**options) as (gpg, fingerprint):
+        mode, passphrase = options["mode"], options.get("passphrase")
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(leaves))) as executor:
+            results = list(executor.map(lambda leaf: _crypt(gpg, fingerprint, mode, leaf, passphrase), leaves))
+
+    return _replace_leaves(data, iter(results))
+
+
+def d_gpg_file_ops(
+    src: str,
+    dest: str,
+    gnupg_home: str = None,
+    key_server: str = "hkps://keys.openpgp.org",
+    fingerprint: str = None,
+    key_path: str = None,
+    key_contents: str = None,
+    passphrase: str = None,
+    mode: str = None,
+    recv_keys: bool = False,
+    key_cache_dir: str = None,
+    key_cache_ttl: int = 86400,
+    offline: bool = False,
+    armor: bool = False,
+    buffer_size: int = 65536,
+) -> None:
+    """
+    Encrypts or decrypts the file `src` into `dest` using GnuPG.
+
+    The file is streamed through gpg `buffer_size` bytes at a time, so memory use does not depend on the file size.
+    The result is written to a temporary file next to `dest` and renamed over it once gpg succeeded,
+    `dest` is never left half written.
+
+    Parameters:
+        src (str): The path of the file to encrypt or decrypt.
+        dest (str): The path of the result.
+        armor (bool): Whether to ASCII armor the encrypted file.
+        buffer_size (int): Size of the chunks copied to gpg.
+        Other parameters are the same as `d_gpg_ops`, except `data`.
+    """
+    _validate_options(fingerprint=fingerprint, key_path=key_path, key_contents=key_contents, mode=mode, recv_keys=recv_keys)
+
+    if not os.path.isfile(src):
+        raise ValueError(f"src {src} is not a file")
+
+    if buffer_size < 1:
+        raise ValueError("buffer_size must be at least 1")
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), prefix=".gpg-")
+    os.close(file_descriptor)
+    try:
+        with keyring(
+            gnupg_home=gnupg_home,
+            key_server=key_server,
+            fingerprint=fingerprint,
+            key_path=key_path,
+            key_contents=key_contents,
+            passphrase=passphrase,
+            mode=mode,
+            recv_keys=recv_keys,
+            key_cache_dir=key_cache_dir,
+            key_cache_ttl=key_cache_ttl,
+            offline=offline,
+        ) as (gpg, fingerprint), open(src, "rb") as src_file:
+            gpg.buffer_size = buffer_size
+            if mode == "encrypt":
+                crypt_result = gpg.encrypt_file(src_file, recipients=fingerprint, armor=armor, output=temp_path)
+            else:
+                crypt_result = gpg.decrypt_file(
+                    src_file,
+                    passphrase=passphrase,
+                    output=temp_path,
+                    extra_args=["--pinentry-mode", "loopback", "--recipient", fingerprint],
+                )
+
+        if not crypt_result.ok:
+            raise ValueError(f"{mode} failed : {crypt_result.status}")
+
+        os.replace(temp_path, dest)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,472 @@
+"""
+HashiCorp Vault KV v2 helpers shared by the arpanrec.nebula plugins.
+
+The walker lists a KV v2 tree breadth first and reads every leaf secret through a bounded thread pool,
+all requests going through a single pooled HTTP session.
+When the secrets of a previous walk are known, only the metadata is read and only secrets whose
+`current_version` changed are read again, the metadata is still one request per secret.
+
+Hosts can also be registered for lazy reading, their secret is read the first time it is requested
+and kept for the rest of the process.
+
+Many secrets can be read concurrently at once, a path repeated in one call is read once.
+
+A walked tree can be saved to a gzip compressed json snapshot and loaded later without any request to vault.
+
+Clients can log in with AppRole, JWT or TLS certificates, the issued token is kept in a file readable only
+by the owner and reused by later runs, renewed when it is close to expiry instead of logging in again.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import hvac
+import requests
+from requests.adapters import HTTPAdapter
+
+_LAZY_SOURCES = {}
+_LAZY_SECRETS = {}
+_LAZY_LOCK = threading.Lock()
+
+
+def vault_client(
+    hostname: str = "http://localhost:8200",
+    token: str = None,
+    verify=True,
+    cert: tuple = None,
+    pool_size: int = 10,
+) -> hvac.Client:
+    """
+    Creates a hvac client whose HTTP session keeps up to `pool_size` connections alive,
+    so that concurrent workers reuse connections instead of opening a new one per request.
+
+    Parameters:
+        hostname (str): The URL of the vault.
+        token (str): Vault token, environment variable `VAULT_TOKEN` has more priority.
+        verify (bool|str): Verify the TLS connection, or path to a CA bundle.
+        cert (tuple): Mutual TLS client certificate and key path.
+        pool_size (int): Maximum number of pooled connections.
+
+    Returns:
+        hvac.Client: The vault client.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return hvac.Client(
+        url=hostname,
+        token=os.environ.get("VAULT_TOKEN", token),
+        verify=verify,
+        cert=cert,
+        session=session,
+    )
+
+
+def _read_token_cache(token_cache_path: str) -> dict:
+    """Reads the token cache file, empty when missing or unreadable."""
+    try:
+        with open(token_cache_path, encoding="utf-8") as token_cache_file:
+            return json.load(token_cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_token_cache(token_cache_path: str, entries: dict) -> None:
+    """Atomically writes the token cache file with mode 0600."""
+    token_cache_dir = os.path.dirname(os.path.abspath(token_cache_path))
+    os.makedirs(token_cache_dir, mode=0o700, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=token_cache_dir, prefix=".vault_token_")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as token_cache_file:
+            json.dump(entries, token_cache_file)
+        os.replace(temp_path, token_cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _login(
+    client: hvac.Client,
+    auth_method: str,
+    auth_mount_point: str = None,
+    role: str = None,
+    role_id: str = None,
+    secret_id: str = None,
+    jwt: str = None,
+    cert: tuple = None,
+) -> dict:
+    """Logs in with the auth method and returns the `auth` block of the response."""
+    if auth_method == "approle":
+        response = client.auth.approle.login(
+            role_id=role_id, secret_id=secret_id, use_token=False, mount_point=auth_mount_point or "approle"
+        )
+    elif auth_method == "jwt":
+        response = client.auth.jwt.jwt_login(role=role, jwt=jwt, use_token=False, path=auth_mount_point or "jwt")
+    elif auth_method == "cert":
+        if not cert:
+            raise ValueError("auth_method cert requires cert")
+        response = client.auth.cert.login(
+            name=role or "", cert_pem=cert[0], key_pem=cert[1], use_token=False, mount_point=auth_mount_point or "cert"
+        )
+    else:
+        raise ValueError(f"auth_method must be one of token, approle, jwt or cert, {auth_method}")
+    return response["auth"]
+
+
+def _token_entry(auth: dict) -> dict:
+    """Token cache entry of a login or renew `auth` block, `expires_at` is None for tokens without TTL."""
+    lease_duration = auth.get("lease_duration") or 0
+    return {
+        "token": auth["client_token"],
+        "expires_at": time.time() + lease_duration if lease_duration else None,
+        "renewable": bool(auth.get("renewable")),
+    }
+
+
+def authenticate(
+    client: hvac.Client,
+    auth_method: str = "token",
+    auth_mount_point: str = None,
+    role: str = None,
+    role_id: str = None,
+    secret_id: str = None,
+    jwt: str = None,
+    cert: tuple = None,
+    token_cache_path: str = None,
+    renew_threshold: int = 300,
+) -> None:
+    """
+    Sets the token of `client` by logging in with `auth_method`, the token auth method keeps the token of the client.
+
+    With `token_cache_path` the issued token is kept in that file and reused by later calls until it expires
+    within `renew_threshold` seconds, then it is renewed, and only when that fails a new login happens.
+    A cached token is checked with a token lookup before it is reused, a revoked token is dropped and a new login happens.
+
+    Parameters:
+        client (hvac.Client): The vault client, see `vault_client`.
+        auth_method (str): One of `token`, `approle`, `jwt` or `cert`.
+        auth_mount_point (str): Mount point of the auth method, defaults to the name of the method.
+        role (str): Role name, for `jwt` and `cert`.
+        role_id (str): AppRole role id.
+        secret_id (str): AppRole secret id.
+        jwt (str): The signed JSON Web Token.
+        cert (tuple): TLS client certificate and key path, for `cert`.
+        token_cache_path (str): File to keep the issued tokens in, None to always log in.
+        renew_threshold (int): Remaining seconds of TTL below which the cached token is renewed.
+    """
+    if auth_method == "token":
+        return
+
+    cache_key = "|".join([client.url, auth_method, auth_mount_point or auth_method, role or role_id or ""])
+    entries = {}
+    entry = None
+    if token_cache_path:
+        token_cache_path = os.path.expanduser(token_cache_path)
+        entries = _read_token_cache(token_cache_path)
+        entry = entries.get(cache_key)
+
+    now = time.time()
+    if entry and (entry["expires_at"] is None or entry["expires_at"] - now > renew_threshold):
+        client.token = entry["token"]
+        try:
+            client.auth.token.lookup_self()
+            return
+        except hvac.exceptions.VaultError:
+            # Revoked, or issued by a vault that was reset since.
+            entry = None
+
+    auth = None
+    if entry and entry["renewable"] and entry["expires_at"] > now:
+        client.token = entry["token"]
+        try:
+            auth = client.auth.token.renew_self()["auth"]
+        except hvac.exceptions.VaultError:
+            auth = None
+        # A renewal capped by the max TTL is not worth keeping.
+        if auth and (auth.get("lease_duration") or 0) <= renew_threshold:
+            auth = None
+
+    if not auth:
+        auth = _login(client, auth_method, auth_mount_point, role, role_id, secret_id, jwt, cert)
+
+    entry = _token_entry(auth)
+    client.token = entry["token"]
+    if token_cache_path:
+        entries = {key: value for key, value in entries.items() if value["expires_at"] is None or value["expires_at"] > now}
+        entries[cache_key] = entry
+        _write_token_cache(token_cache_path, entries)
+
+
+def join_path(*parts: str) -> str:
+    """Joins vault path fragments, ignoring empty fragments and duplicate slashes."""
+    return "/".join(part.strip("/") for part in parts if part and part.strip("/"))
+
+
+def list_keys(client: hvac.Client, mount_point: str, path: str) -> list:
+    """
+    Lists the keys directly below `path`, folders end with a `/`.
+
+    Returns:
+        list: The keys, empty if the path does not exist.
+    """
+    try:
+        response = client.secrets.kv.v2.list_secrets(path=path, mount_point=mount_point)
+    except hvac.exceptions.InvalidPath:
+        return []
+    return response["data"]["keys"]
+
+
+def read_secret(client: hvac.Client, mount_point: str, path: str) -> dict:
+    """
+    Reads the latest version of a secret.
+    KV v2 still lists secrets whose latest version was deleted or destroyed, they are treated as missing.
+
+    Returns:
+        dict: `data` with the secret key values and `version` with the KV version they came from,
+            None when the secret does not exist or its latest version is deleted or destroyed.
+    """
+    try:
+        response = client.secrets.kv.v2.read_secret_version(path=path, mount_point=mount_point, raise_on_deleted_version=False)
+    except hvac.exceptions.InvalidPath:
+        return None
+    secret = response.get("data") or {}
+    metadata = secret.get("metadata") or {}
+    if secret.get("data") is None or metadata.get("deletion_time") or metadata.get("destroyed"):
+        return None
+    return {
+        "data": secret["data"],
+        "version": metadata["version"],
+    }
+
+
+def read_secrets(client: hvac.Client, mount_point: str, paths: list, concurrency: int = 10) -> list:
+    """
+    Reads the latest version of many secrets, never more than `concurrency` requests at a time.
+    A path given more than once is read once.
+
+    Returns:
+        list: The secret data, in the order of `paths`, empty for a missing or deleted secret.
+    """
+    joined_paths = [join_path(path) for path in paths]
+    unique_paths = list(dict.fromkeys(joined_paths))
+    if not unique_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(min(concurrency, len(unique_paths)), 1)) as executor:
+        secrets = dict(zip(unique_paths, executor.map(lambda path: (read_secret(client, mount_point, path) or {}).get("data", {}), unique_paths)))
+    return [secrets[path] for path in joined_paths]
+
+
+def read_current_version(client: hvac.Client, mount_point: str, path: str) -> int:
+    """
+    Reads the metadata of a secret.
+
+    Returns:
+        int: The `current_version` of the secret, None when it is deleted or destroyed.
+    """
+    response = client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=mount_point)
+    current_version = response["data"]["current_version"]
+    version_metadata = (response["data"].get("versions") or {}).get(str(current_version)) or {}
+    if version_metadata.get("deletion_time") or version_metadata.get("destroyed"):
+        return None
+    return current_version
+
+
+def shard_of(name: str, shard_count: int) -> int:
+    """
+    Shard of `name` among `shard_count` shards, by rendezvous hashing.
+    A name always lands in the same shard, and changing the number of shards only moves the names of the added or removed shards.
+
+    Returns:
+        int: The shard index, from 0 to `shard_count` - 1.
+    """
+    if shard_count <= 1:
+        return 0
+    return max(range(shard_count), key=lambda shard: hashlib.sha256(f"{shard}:{name}".encode("utf-8")).digest())
+
+
+def walk_kv_tree(
+    client: hvac.Client,
+    mount_point: str = "secret",
+    path: str = "/",
+    concurrency: int = 10,
+    read: bool = True,
+    known: dict = None,
+    select=None,
+) -> dict:
+    """
+    Recursively lists `mount_point`/`path` and reads every leaf secret.
+
+    Folders are listed level by level, every listing of a level runs concurrently.
+    Once the tree is known all leaves are read concurrently, never more than `concurrency` requests at a time.
+
+    Parameters:
+        client (hvac.Client): The vault client, see `vault_client`.
+        mount_point (str): Name of the KV secret engine.
+        path (str): Path of the root folder.
+        concurrency (int): Number of concurrent requests.
+        read (bool): Read the leaf secrets, when False only the tree is listed.
+        known (dict): `leaves` of a previous walk, their secrets are only read again when the `current_version` changed.
+        select (callable): Called with the path of each leaf relative to `path`, leaves it returns False for are dropped before any read.
+
+    Returns:
+        dict: A dictionary with
+            `leaves`: mapping of leaf path (relative to `path`) to `{"data": ..., "version": ...}`, or None when not read,
+                leaves whose latest version is deleted or destroyed are dropped when read.
+            `folders`: list of folder paths relative to `path`, parents before children.
+            `timings`: seconds spent in the `list`, `metadata` (only with `known`) and `read` phases.
+    """
+    root = join_path(path)
+    leaves = {}
+    folders = []
+    timings = {}
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        started = time.perf_counter()
+        level = [""]
+        while level:
+            listings = executor.map(lambda folder: list_keys(client, mount_point, join_path(root, folder)), level)
+            next_level = []
+            for folder, keys in zip(level, listings):
+                for key in keys:
+                    relative = join_path(folder, key)
+                    if key.endswith("/"):
+                        folders.append(relative)
+                        next_level.append(relative)
+                    elif select is None or select(relative):
+                        leaves[relative] = None
+            level = next_level
+        timings["list"] = time.perf_counter() - started
+
+        if read and known:
+            started = time.perf_counter()
+            names = [leaf for leaf in leaves if known.get(leaf)]
+            versions = executor.map(lambda leaf: read_current_version(client, mount_point, join_path(root, leaf)), names)
+            for leaf, version in zip(names, versions):
+                if known[leaf]["version"] == version:
+                    leaves[leaf] = known[leaf]
+            timings["metadata"] = time.perf_counter() - started
+
+        if read:
+            started = time.perf_counter()
+            names = [leaf for leaf, secret in leaves.items() if secret is None]
+            secrets = executor.map(lambda leaf: read_secret(client, mount_point, join_path(root, leaf)), names)
+            for leaf, secret in zip(names, secrets):
+                if secret is None:
+                    # deleted or destroyed latest version, still listed by KV v2
+                    del leaves[leaf]
+                else:
+                    leaves[leaf] = secret
+            timings["read"] = time.perf_counter() - started
+
+    return {"leaves": leaves, "folders": folders, "timings": timings}
+
+
+def register_lazy_host(inventory_hostname: str, client: hvac.Client, mount_point: str, path: str) -> None:
+    """
+    Remembers where the secret of a host lives, without reading it, see `read_lazy_host`.
+
+    Parameters:
+        inventory_hostname (str): Name of the host in the inventory.
+        client (hvac.Client): The vault client, see `vault_client`.
+        mount_point (str): Name of the KV secret engine.
+        path (str): Path of the host secret.
+    """
+    with _LAZY_LOCK:
+        _LAZY_SOURCES[inventory_hostname] = (client, mount_point, path)
+        _LAZY_SECRETS.pop(inventory_hostname, None)
+
+
+def read_lazy_host(inventory_hostname: str) -> dict:
+    """
+    Reads the secret of a host registered with `register_lazy_host`.
+    The secret is read from vault once, every later call returns the same data.
+
+    Returns:
+        dict: The secret data, empty when the secret is deleted, None when the host is not registered.
+    """
+    with _LAZY_LOCK:
+        if inventory_hostname not in _LAZY_SECRETS:
+            if inventory_hostname not in _LAZY_SOURCES:
+                return None
+            client, mount_point, path = _LAZY_SOURCES[inventory_hostname]
+            _LAZY_SECRETS[inventory_hostname] = (read_secret(client, mount_point, path) or {}).get("data", {})
+        return _LAZY_SECRETS[inventory_hostname]
+
+
+def write_snapshot(snapshot_path: str, tree: dict, source: dict) -> None:
+    """
+    Atomically writes the `leaves` and `folders` of a walked tree to a gzip compressed json file readable only by the owner.
+
+    Parameters:
+        snapshot_path (str): Path of the snapshot file.
+        tree (dict): The walked tree, see `walk_kv_tree`.
+        source (dict): Settings the tree was walked with, a snapshot is only loaded for the same settings.
+    """
+    snapshot_path = os.path.expanduser(snapshot_path)
+    snapshot_dir = os.path.dirname(os.path.abspath(snapshot_path))
+    os.makedirs(snapshot_dir, mode=0o700, exist_ok=True)
+    snapshot = {
+        "created": time.time(),
+        "source": source,
+        "leaves": tree["leaves"],
+        "folders": tree["folders"],
+    }
+    file_descriptor, temp_path = tempfile.mkstemp(dir=snapshot_dir, prefix=".vault_inv_")
+    try:
+        with os.fdopen(file_descriptor, "wb") as raw_file, gzip.open(raw_file, "wt", encoding="utf-8") as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(",", ":"))
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_snapshot(snapshot_path: str, ttl: int, source: dict, warn=None) -> dict:
+    """
+    Reads a snapshot written by `write_snapshot`.
+
+    A truncated, corrupt or unreadable snapshot is ignored, like a missing one, so a fresh walk replaces it.
+
+    Parameters:
+        snapshot_path (str): Path of the snapshot file.
+        ttl (int): Maximum age of the snapshot in seconds, 0 for no limit.
+        source (dict): Settings the tree must have been walked with.
+        warn (callable): Called with a message when the snapshot exists but cannot be used, e.g. `display.warning`.
+
+    Returns:
+        dict: The tree with `leaves`, `folders` and `created`,
+            None when the snapshot does not exist, cannot be read, is older than `ttl` or was walked with other settings.
+    """
+    try:
+        with gzip.open(os.path.expanduser(snapshot_path), "rt", encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (EOFError, OSError, ValueError) as ex:
+        if warn:
+            warn(f"vault_inv: ignoring unreadable snapshot {snapshot_path}: {ex}")
+        return None
+    if (
+        not isinstance(snapshot, dict)
+        or not isinstance(snapshot.get("created"), (int, float))
+        or not isinstance(snapshot.get("leaves"), dict)
+        or not isinstance(snapshot.get("folders"), list)
+    ):
+        if warn:
+            warn(f"vault_inv: ignoring snapshot {snapshot_path} with an unexpected content")
+        return None
+    if snapshot.get("source") != source:
+        return None
+    if ttl and time.time() - snapshot["created"] > ttl:
+        return None
+    return snapshot
@@ -0,0 +1,74 @@
+"""
+PEM helpers shared by the arpanrec.nebula plugins.
+
+The scanner finds every `-----BEGIN <LABEL>-----` ... `-----END <LABEL>-----` block of a text in one pass over the offsets
+of the BEGIN and END lines, without splitting the text into lines,
+and returns each block with its type, certificate, private key, certificate signing request, CRL, public key or other.
+Text around and between the blocks is ignored, CRLF line endings are converted to LF.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import re
+
+_PEM_BEGIN_RE = re.compile(r"-----BEGIN ([A-Z0-9 ]+)-----")
+
+PEM_TYPES = {
+    "CERTIFICATE": "certificate",
+    "X509 CERTIFICATE": "certificate",
+    "PRIVATE KEY": "private_key",
+    "ENCRYPTED PRIVATE KEY": "private_key",
+    "RSA PRIVATE KEY": "private_key",
+    "EC PRIVATE KEY": "private_key",
+    "DSA PRIVATE KEY": "private_key",
+    "OPENSSH PRIVATE KEY": "private_key",
+    "CERTIFICATE REQUEST": "csr",
+    "NEW CERTIFICATE REQUEST": "csr",
+    "X509 CRL": "crl",
+    "PUBLIC KEY": "public_key",
+    "RSA PUBLIC KEY": "public_key",
+}
+
+
+def iter_pem_blocks(text, types: list = None):
+    """
+    Yields every PEM block of `text`, in order, as a dictionary with `type`, `label` and `pem`.
+
+    The text is scanned once and lazily, a block is yielded as soon as it is found.
+
+    Parameters:
+        text (str|bytes): Text containing PEM blocks, anything outside the blocks is ignored, bytes in any ASCII compatible encoding.
+        types (list): Only yield blocks of these types, see `PEM_TYPES`, `other` for unknown labels.
+
+    Yields:
+        dict: `type` of the block, `label` of its BEGIN line, and `pem`, the block ending with a new line.
+    """
+    if isinstance(text, bytes):
+        # PEM blocks are ASCII, latin-1 maps every byte so UTF-8 comments around them can not fail the decode
+        text = text.decode("latin-1")
+
+    position = 0
+    while True:
+        begin_match = _PEM_BEGIN_RE.search(text, position)
+        if not begin_match:
+            return
+        label = begin_match.group(1)
+        end_line = f"-----END {label}-----"
+        end = text.find(end_line, begin_match.end())
+        next_begin = text.find("-----BEGIN ", begin_match.end(), end if end >= 0 else len(text))
+        if next_begin >= 0:
+            # truncated block, without its END line before the next block
+            position = next_begin
+            continue
+        if end < 0:
+            return
+        position = end + len(end_line)
+
+        block_type = PEM_TYPES.get(label, "other")
+        if types and block_type not in types:
+            continue
+        pem = text[begin_match.start() : position]
+        if "\r" in pem:
+            pem = pem.replace("\r\n", "\n")
+        yield {"type": block_type, "label": label, "pem": pem + "\n"}
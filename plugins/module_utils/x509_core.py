@@ -0,0 +1,634 @@
+"""
+X.509 certificate helpers shared by the arpanrec.nebula plugins.
+
+Certificates are parsed in process with the cryptography library, the parsed certificates and their metadata records
+are memoized by their PEM, so the same bundle templated once per host is parsed once per process.
+
+Key usages, extended key usages, subject alternative names, subjects and basic constraints of a certificate specification
+are normalized to the same form as the ones read from a certificate, in the OpenSSL configuration names or community.crypto names.
+
+Certificates are signed from the same specification, private keys are generated by a worker function
+that can run in a process pool, RSA key generation being bound by the CPU.
+
+Chains are built with hash map indexes of the certificates by subject and by subject key identifier,
+the issuer of every certificate is found with one lookup instead of comparing every pair of certificates.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import datetime
+import ipaddress
+from functools import lru_cache
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID, ObjectIdentifier
+from ansible_collections.arpanrec.nebula.plugins.module_utils.pem_core import iter_pem_blocks
+
+TIME_FORMAT = "%Y%m%d%H%M%SZ"
+
+KEY_USAGES = {
+    "digitalsignature": "digital_signature",
+    "nonrepudiation": "content_commitment",
+    "contentcommitment": "content_commitment",
+    "keyencipherment": "key_encipherment",
+    "dataencipherment": "data_encipherment",
+    "keyagreement": "key_agreement",
+    "keycertsign": "key_cert_sign",
+    "certificatesign": "key_cert_sign",
+    "crlsign": "crl_sign",
+    "encipheronly": "encipher_only",
+    "decipheronly": "decipher_only",
+}
+
+EXTENDED_KEY_USAGES = {
+    "serverauth": ExtendedKeyUsageOID.SERVER_AUTH,
+    "tlswebserverauthentication": ExtendedKeyUsageOID.SERVER_AUTH,
+    "clientauth": ExtendedKeyUsageOID.CLIENT_AUTH,
+    "tlswebclientauthentication": ExtendedKeyUsageOID.CLIENT_AUTH,
+    "codesigning": ExtendedKeyUsageOID.CODE_SIGNING,
+    "emailprotection": ExtendedKeyUsageOID.EMAIL_PROTECTION,
+    "timestamping": ExtendedKeyUsageOID.TIME_STAMPING,
+    "ocspsigning": ExtendedKeyUsageOID.OCSP_SIGNING,
+    "anyextendedkeyusage": ExtendedKeyUsageOID.ANY_EXTENDED_KEY_USAGE,
+    "msctlsign": ObjectIdentifier("1.3.6.1.4.1.311.10.3.1"),
+    "microsofttrustlistsigning": ObjectIdentifier("1.3.6.1.4.1.311.10.3.1"),
+}
+
+SUBJECT_NAMES = {
+    "c": NameOID.COUNTRY_NAME,
+    "countryname": NameOID.COUNTRY_NAME,
+    "st": NameOID.STATE_OR_PROVINCE_NAME,
+    "stateorprovincename": NameOID.STATE_OR_PROVINCE_NAME,
+    "l": NameOID.LOCALITY_NAME,
+    "localityname": NameOID.LOCALITY_NAME,
+    "o": NameOID.ORGANIZATION_NAME,
+    "organizationname": NameOID.ORGANIZATION_NAME,
+    "ou": NameOID.ORGANIZATIONAL_UNIT_NAME,
+    "organizationalunitname": NameOID.ORGANIZATIONAL_UNIT_NAME,
+    "cn": NameOID.COMMON_NAME,
+    "commonname": NameOID.COMMON_NAME,
+    "emailaddress": NameOID.EMAIL_ADDRESS,
+}
+
+EC_CURVES = {
+    "secp256r1": ec.SECP256R1,
+    "secp384r1": ec.SECP384R1,
+    "secp521r1": ec.SECP521R1,
+}
+
+_GENERAL_NAME_PREFIXES = {
+    "dns": "DNS",
+    "ip": "IP",
+    "email": "email",
+    "uri": "URI",
+    "rid": "RID",
+    "dirname": "dirName",
+    "othername": "otherName",
+}
+
+
+def _name_key(name: str) -> str:
+    """
+    Lower case `name` without spaces, dashes and underscores, `Digital Signature` and `digitalSignature` give the same key.
+    """
+    return "".join(character for character in name.lower() if character.isalnum())
+
+
+def normalize_key_usage(key_usages: list) -> list:
+    """
+    Returns the sorted `cryptography.x509.KeyUsage` attribute names of OpenSSL or community.crypto key usage names.
+    """
+    normalized = set()
+    for key_usage in key_usages or []:
+        if _name_key(key_usage) not in KEY_USAGES:
+            raise ValueError(f"unknown key usage {key_usage}")
+        normalized.add(KEY_USAGES[_name_key(key_usage)])
+    return sorted(normalized)
+
+
+def normalize_extended_key_usage(extended_key_usages: list) -> list:
+    """
+    Returns the sorted dotted OIDs of OpenSSL or community.crypto extended key usage names, or dotted OIDs.
+    """
+    normalized = set()
+    for extended_key_usage in extended_key_usages or []:
+        if _name_key(extended_key_usage) in EXTENDED_KEY_USAGES:
+            normalized.add(EXTENDED_KEY_USAGES[_name_key(extended_key_usage)].dotted_string)
+        elif all(part.isdigit() for part in extended_key_usage.split(".")):
+            normalized.add(extended_key_usage)
+        else:
+            raise ValueError(f"unknown extended key usage {extended_key_usage}")
+    return sorted(normalized)
+
+
+def normalize_subject_alt_name(subject_alt_names: list) -> list:
+    """
+    Returns the sorted subject alternative names, with the prefixes of `general_name` and normalized IP addresses.
+    """
+    normalized = set()
+    for subject_alt_name in subject_alt_names or []:
+        prefix, _, value = subject_alt_name.partition(":")
+        if prefix.lower() not in _GENERAL_NAME_PREFIXES:
+            raise ValueError(f"unknown subject alternative name prefix in {subject_alt_name}")
+        prefix = _GENERAL_NAME_PREFIXES[prefix.lower()]
+        if prefix == "IP":
+            value = str(ipaddress.ip_address(value))
+        normalized.add(f"{prefix}:{value}")
+    return sorted(normalized)
+
+
+def _subject_attributes(subject: dict) -> list:
+    """
+    Returns the `(dotted OID, value)` pairs of a subject dictionary in the order of the dictionary, values can be lists.
+    """
+    attributes = []
+    for name, values in (subject or {}).items():
+        if _name_key(name) not in SUBJECT_NAMES:
+            raise ValueError(f"unknown subject name {name}")
+        for value in values if isinstance(values, list) else [values]:
+            attributes.append((SUBJECT_NAMES[_name_key(name)].dotted_string, str(value)))
+    return attributes
+
+
+def normalize_subject(subject: dict) -> list:
+    """
+    Returns the sorted `(dotted OID, value)` pairs of a subject dictionary, values can be lists.
+    Sorted for comparison only, `sign_certificate` keeps the order of the dictionary.
+    """
+    return sorted(_subject_attributes(subject))
+
+
+def normalize_basic_constraints(basic_constraints: list) -> list:
+    """
+    Returns the sorted basic constraints as `CA:TRUE`, `CA:FALSE` and `pathlen:<n>`.
+    """
+    normalized = set()
+    for basic_constraint in basic_constraints or []:
+        name, _, value = basic_constraint.partition(":")
+        if name.strip().lower() == "ca":
+            normalized.add(f"CA:{value.strip().upper()}")
+        elif name.strip().lower() == "pathlen":
+            normalized.add(f"pathlen:{int(value)}")
+        else:
+            raise ValueError(f"unknown basic constraint {basic_constraint}")
+    return sorted(normalized)
+
+
+def certificate_spec(certificate: x509.Certificate) -> dict:
+    """
+    Returns the key usage, extended key usage, subject alternative name, subject and basic constraints of `certificate`,
+    in the form of the `normalize_*` functions.
+    """
+    key_usage = _extension_value(certificate, x509.KeyUsage)
+    extended_key_usage = _extension_value(certificate, x509.ExtendedKeyUsage)
+    subject_alt_name = _extension_value(certificate, x509.SubjectAlternativeName)
+    basic_constraints = _extension_value(certificate, x509.BasicConstraints)
+
+    key_usages = []
+    if key_usage:
+        for attribute in sorted(set(KEY_USAGES.values())):
+            if attribute in ("encipher_only", "decipher_only") and not key_usage.key_agreement:
+                continue
+            if getattr(key_usage, attribute):
+                key_usages.append(attribute)
+
+    basic_constraints_list = []
+    if basic_constraints:
+        basic_constraints_list.append("CA:TRUE" if basic_constraints.ca else "CA:FALSE")
+        if basic_constraints.path_length is not None:
+            basic_constraints_list.append(f"pathlen:{basic_constraints.path_length}")
+
+    return {
+        "key_usage": key_usages,
+        "extended_key_usage": sorted(oid.dotted_string for oid in extended_key_usage) if extended_key_usage else [],
+        "subject_alt_name": sorted(general_name(name) for name in subject_alt_name) if subject_alt_name else [],
+        "subject": sorted((attribute.oid.dotted_string, attribute.value) for attribute in certificate.subject),
+        "basic_constraints": sorted(basic_constraints_list),
+    }
+
+
+def hex_colon(data: bytes) -> str:
+    """
+    Returns `data` as colon separated lower case hexadecimal bytes, `ab:cd:..`.
+    """
+    return ":".join(f"{byte:02x}" for byte in data)
+
+
+@lru_cache(maxsize=4096)
+def load_certificate(pem: str) -> x509.Certificate:
+    """
+    Parses a PEM certificate, memoized by its PEM.
+    """
+    return x509.load_pem_x509_certificate(pem.encode("ascii"))
+
+
+def iter_certificates(bundle):
+    """
+    Yields every PEM certificate of a bundle string, or of a list of bundle strings.
+    """
+    if isinstance(bundle, (list, tuple)):
+        for item in bundle:
+            yield from iter_certificates(item)
+        return
+    for block in iter_pem_blocks(bundle, types=["certificate"]):
+        yield block["pem"]
+
+
+def not_valid_before(certificate: x509.Certificate) -> datetime.datetime:
+    """
+    Start of the validity of `certificate`, timezone aware in UTC.
+    """
+    if hasattr(certificate, "not_valid_before_utc"):
+        return certificate.not_valid_before_utc
+    return certificate.not_valid_before.replace(tzinfo=datetime.timezone.utc)
+
+
+def not_valid_after(certificate: x509.Certificate) -> datetime.datetime:
+    """
+    End of the validity of `certificate`, timezone aware in UTC.
+    """
+    if hasattr(certificate, "not_valid_after_utc"):
+        return certificate.not_valid_after_utc
+    return certificate.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+
+
+def _extension_value(certificate: x509.Certificate, extension_class):
+    """
+    Value of the extension `extension_class` of `certificate`, None when it is not present.
+    """
+    try:
+        return certificate.extensions.get_extension_for_class(extension_class).value
+    except x509.ExtensionNotFound:
+        return None
+
+
+def general_name(name) -> str:
+    """
+    Returns a subject alternative name as `DNS:..`, `IP:..`, `email:..`, `URI:..`, `dirName:..` or `RID:..`.
+    """
+    if isinstance(name, x509.DNSName):
+        return f"DNS:{name.value}"
+    if isinstance(name, x509.IPAddress):
+        return f"IP:{name.value}"
+    if isinstance(name, x509.RFC822Name):
+        return f"email:{name.value}"
+    if isinstance(name, x509.UniformResourceIdentifier):
+        return f"URI:{name.value}"
+    if isinstance(name, x509.DirectoryName):
+        return f"dirName:{name.value.rfc4514_string()}"
+    if isinstance(name, x509.RegisteredID):
+        return f"RID:{name.value.dotted_string}"
+    return f"otherName:{name.type_id.dotted_string}"
+
+
+def subject_key_identifier(certificate: x509.Certificate) -> bytes:
+    """
+    Subject key identifier of `certificate`, None when the extension is not present.
+    """
+    value = _extension_value(certificate, x509.SubjectKeyIdentifier)
+    return value.digest if value else None
+
+
+def authority_key_identifier(certificate: x509.Certificate) -> bytes:
+    """
+    Authority key identifier of `certificate`, None when the extension or the key identifier is not present.
+    """
+    value = _extension_value(certificate, x509.AuthorityKeyIdentifier)
+    return value.key_identifier if value else None
+
+
+@lru_cache(maxsize=4096)
+def _certificate_record(pem: str) -> tuple:
+    """
+    Memoized items of `certificate_record`.
+    """
+    certificate = load_certificate(pem)
+    subject_alt_name = _extension_value(certificate, x509.SubjectAlternativeName)
+    basic_constraints = _extension_value(certificate, x509.BasicConstraints)
+    ski = subject_key_identifier(certificate)
+    aki = authority_key_identifier(certificate)
+    return (
+        ("fingerprint_sha256", hex_colon(certificate.fingerprint(hashes.SHA256()))),
+        ("serial_number", certificate.serial_number),
+        ("subject", certificate.subject.rfc4514_string()),
+        ("issuer", certificate.issuer.rfc4514_string()),
+        ("subject_key_identifier", hex_colon(ski) if ski else None),
+        ("authority_key_identifier", hex_colon(aki) if aki else None),
+        ("not_before", not_valid_before(certificate).strftime(TIME_FORMAT)),
+        ("not_after", not_valid_after(certificate).strftime(TIME_FORMAT)),
+        ("subject_alt_name", tuple(general_name(name) for name in subject_alt_name) if subject_alt_name else ()),
+        ("is_ca", bool(basic_constraints and basic_constraints.ca)),
+    )
+
+
+def certificate_record(pem: str) -> dict:
+    """
+    Returns the metadata of a PEM certificate.
+
+    Parameters:
+        pem (str): The PEM certificate.
+
+    Returns:
+        dict: `fingerprint_sha256`, `serial_number`, `subject`, `issuer`, `subject_key_identifier`,
+            `authority_key_identifier`, `not_before`, `not_after`, `subject_alt_name` and `is_ca`.
+            Fingerprints and key identifiers are colon separated hexadecimal, times are `YYYYMMDDHHMMSSZ` in UTC.
+    """
+    record = dict(_certificate_record(pem))
+    record["subject_alt_name"] = list(record["subject_alt_name"])
+    return record
+
+
+def _find_issuer(certificate: x509.Certificate, by_ski: dict, by_subject: dict):
+    """
+    Returns the fingerprint of the issuer of `certificate` in the indexes, None when it is not there or self signed.
+    """
+    aki = authority_key_identifier(certificate)
+    issuer_name = certificate.issuer.public_bytes()
+    candidates = by_ski.get(aki, []) if aki else []
+    if not candidates:
+        candidates = by_subject.get(issuer_name, [])
+    own_fingerprint = certificate.fingerprint(hashes.SHA256())
+    for candidate_fingerprint, candidate in candidates:
+        if candidate_fingerprint != own_fingerprint and candidate.subject.public_bytes() == issuer_name:
+            return candidate_fingerprint
+    return None
+
+
+def _is_self_signed(certificate: x509.Certificate) -> bool:
+    """
+    Whether `certificate` is its own issuer, by name and key identifiers.
+    """
+    if certificate.issuer != certificate.subject:
+        return False
+    aki = authority_key_identifier(certificate)
+    return aki is None or aki == subject_key_identifier(certificate)
+
+
+def build_chains(pems: list, include_root: bool = True) -> dict:
+    """
+    Deduplicates certificates by fingerprint and builds the leaf to root chain of every leaf.
+
+    A leaf is a certificate which is not the issuer of any other certificate of `pems`.
+
+    Parameters:
+        pems (list): PEM certificates, in any order.
+        include_root (bool): Keep the self signed root at the end of the chains.
+
+    Returns:
+        dict: `chains`, a list with `fingerprints`, `certificates`, `fullchain` and `complete`, false when the chain does not
+            end with a self signed root, `unchained`, the records of the certificates whose issuer is missing,
+            and `duplicates`, the number of certificates removed.
+    """
+    certificates = {}
+    pem_of = {}
+    for pem in pems:
+        certificate = load_certificate(pem)
+        fingerprint = certificate.fingerprint(hashes.SHA256())
+        if fingerprint not in certificates:
+            certificates[fingerprint] = certificate
+            pem_of[fingerprint] = pem
+
+    by_ski = {}
+    by_subject = {}
+    for fingerprint, certificate in certificates.items():
+        ski = subject_key_identifier(certificate)
+        if ski:
+            by_ski.setdefault(ski, []).append((fingerprint, certificate))
+        by_subject.setdefault(certificate.subject.public_bytes(), []).append((fingerprint, certificate))
+
+    issuer_of = {}
+    for fingerprint, certificate in certificates.items():
+        if not _is_self_signed(certificate):
+            issuer_of[fingerprint] = _find_issuer(certificate, by_ski, by_subject)
+    issuers = set(issuer_of.values())
+
+    chains = []
+    for fingerprint in certificates:
+        if fingerprint in issuers:
+            continue
+        chain = [fingerprint]
+        while issuer_of.get(chain[-1]) and issuer_of[chain[-1]] not in chain:
+            chain.append(issuer_of[chain[-1]])
+        complete = _is_self_signed(certificates[chain[-1]])
+        if complete and not include_root and len(chain) > 1:
+            chain = chain[:-1]
+        chain_pems = [pem_of[chain_fingerprint] for chain_fingerprint in chain]
+        chains.append(
+            {
+                "fingerprints": [hex_colon(chain_fingerprint) for chain_fingerprint in chain],
+                "certificates": chain_pems,
+                "fullchain": "".join(chain_pems),
+                "complete": complete,
+            }
+        )
+
+    return {
+        "chains": chains,
+        "unchained": [certificate_record(pem_of[fingerprint]) for fingerprint, issuer in issuer_of.items() if issuer is None],
+        "duplicates": len(pems) - len(certificates),
+    }
+
+
+def renewal_reasons(
+    certificate_content: str,
+    ca_certificate_content: str,
+    private_key_content: str = None,
+    private_key_passphrase: str = None,
+    validity_days: int = 7,
+    min_remaining_days: int = 1,
+    key_usage: list = None,
+    extended_key_usage: list = None,
+    subject_alt_name: list = None,
+    subject: dict = None,
+    basic_constraints: list = None,
+) -> dict:
+    """
+    Checks whether a certificate issued by an OwnCA has to be issued again.
+
+    Parameters:
+        certificate_content (str): The existing certificate, empty when there is none.
+        ca_certificate_content (str): The OwnCA certificate.
+        private_key_content (str): The private key of the certificate.
+        private_key_passphrase (str): The passphrase of the private key.
+        validity_days (int): Validity of a new certificate, in days.
+        min_remaining_days (int): Minimum remaining validity of the existing certificate, in days.
+        key_usage (list): Expected key usages.
+        extended_key_usage (list): Expected extended key usages.
+        subject_alt_name (list): Expected subject alternative names.
+        subject (dict): Expected subject.
+        basic_constraints (list): Expected basic constraints.
+
+    Returns:
+        dict: A dictionary with `needs_renewal` and `reasons`, or `error`.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ca_certificate = load_certificate(ca_certificate_content)
+
+    if not_valid_after(ca_certificate) < now + datetime.timedelta(days=validity_days):
+        return {"error": "Expected validity should not cross CA"}
+
+    if not certificate_content or len(certificate_content) < 2:
+        return {"needs_renewal": True, "reasons": ["When Certificate Content Not Present"]}
+
+    try:
+        certificate = load_certificate(certificate_content)
+    except ValueError:
+        return {"needs_renewal": True, "reasons": ["Existing Certificate is Invalid"]}
+
+    reasons = []
+
+    if authority_key_identifier(certificate) != subject_key_identifier(ca_certificate) or certificate.issuer != ca_certificate.subject:
+        reasons.append("Authority Key Identifier Mismatch, Existing Certificate is not signed by OwnCA")
+
+    if not_valid_before(certificate) > now or not_valid_after(certificate) < now + datetime.timedelta(days=min_remaining_days):
+        reasons.append("Certificate Expired")
+
+    if private_key_content:
+        private_key = load_private_key(private_key_content, private_key_passphrase)
+        public_key_format = (serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        if private_key.public_key().public_bytes(*public_key_format) != certificate.public_key().public_bytes(*public_key_format):
+            reasons.append("Private Key Mismatch")
+
+    current = certificate_spec(certificate)
+    expected = {
+        "key_usage": normalize_key_usage(key_usage),
+        "extended_key_usage": normalize_extended_key_usage(extended_key_usage),
+        "subject_alt_name": normalize_subject_alt_name(subject_alt_name),
+        "subject": normalize_subject(subject),
+        "basic_constraints": normalize_basic_constraints(basic_constraints),
+    }
+    for spec_name, reason in (
+        ("key_usage", "Key Usage Mismatch"),
+        ("extended_key_usage", "Extended Key Usage Mismatch"),
+        ("subject_alt_name", "SAN Mismatch"),
+        ("subject", "Subject Mismatch"),
+        ("basic_constraints", "Basic Constraints Mismatch"),
+    ):
+        if current[spec_name] != expected[spec_name]:
+            reasons.append(reason)
+
+    return {"needs_renewal": len(reasons) > 0, "reasons": reasons}
+
+
+def generate_private_key_pem(key_type: str = "rsa", key_size: int = 4096, curve: str = "secp384r1") -> str:
+    """
+    Generates an unencrypted PKCS#8 PEM private key, a module level function so it can run in a process pool.
+
+    Parameters:
+        key_type (str): `rsa`, `ec`, `ed25519` or `ed448`.
+        key_size (int): Size of RSA keys.
+        curve (str): Curve of EC keys, like `secp256r1` or `secp384r1`.
+
+    Returns:
+        str: The PEM private key.
+    """
+    if key_type == "rsa":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    elif key_type == "ec":
+        if curve not in EC_CURVES:
+            raise ValueError(f"unknown curve {curve}")
+        private_key = ec.generate_private_key(EC_CURVES[curve]())
+    elif key_type == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif key_type == "ed448":
+        private_key = ed448.Ed448PrivateKey.generate()
+    else:
+        raise ValueError(f"unknown key type {key_type}")
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("ascii")
+
+
+def load_private_key(pem: str, passphrase: str = None):
+    """
+    Parses a PEM private key, encrypted with `passphrase` when given.
+    """
+    return serialization.load_pem_private_key(pem.encode("ascii"), password=passphrase.encode("utf-8") if passphrase else None)
+
+
+def sign_certificate(
+    private_key,
+    ca_certificate: x509.Certificate,
+    ca_private_key,
+    validity_days: int = 7,
+    key_usage: list = None,
+    extended_key_usage: list = None,
+    subject_alt_name: list = None,
+    subject: dict = None,
+    basic_constraints: list = None,
+) -> x509.Certificate:
+    """
+    Signs a certificate for `private_key` with the OwnCA, with the same extensions as the get_certificate_ownca role,
+    all critical except the key identifiers, valid from one day ago for `validity_days` days.
+
+    Parameters:
+        private_key: The private key of the certificate.
+        ca_certificate (x509.Certificate): The OwnCA certificate.
+        ca_private_key: The OwnCA private key.
+        validity_days (int): Validity of the certificate, in days.
+        key_usage (list): Key usages, see `normalize_key_usage`.
+        extended_key_usage (list): Extended key usages, see `normalize_extended_key_usage`.
+        subject_alt_name (list): Subject alternative names, see `normalize_subject_alt_name`.
+        subject (dict): Subject, see `normalize_subject`, the attributes are kept in the order of the dictionary.
+        basic_constraints (list): Basic constraints, see `normalize_basic_constraints`.
+
+    Returns:
+        x509.Certificate: The signed certificate.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    subject_name = x509.Name(
+        [x509.NameAttribute(ObjectIdentifier(oid), value) for oid, value in _subject_attributes(subject)]
+    )
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(subject_name)
+        .issuer_name(ca_certificate.subject)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=validity_days))
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_certificate.public_key()), critical=False)
+    )
+
+    key_usages = normalize_key_usage(key_usage)
+    if key_usages:
+        flags = {attribute: attribute in key_usages for attribute in set(KEY_USAGES.values())}
+        builder = builder.add_extension(x509.KeyUsage(**flags), critical=True)
+
+    extended_key_usages = normalize_extended_key_usage(extended_key_usage)
+    if extended_key_usages:
+        builder = builder.add_extension(
+            x509.ExtendedKeyUsage([ObjectIdentifier(oid) for oid in extended_key_usages]), critical=True
+        )
+
+    subject_alt_names = []
+    for name in normalize_subject_alt_name(subject_alt_name):
+        prefix, _, value = name.partition(":")
+        if prefix == "DNS":
+            subject_alt_names.append(x509.DNSName(value))
+        elif prefix == "IP":
+            subject_alt_names.append(x509.IPAddress(ipaddress.ip_address(value)))
+        elif prefix == "email":
+            subject_alt_names.append(x509.RFC822Name(value))
+        elif prefix == "URI":
+            subject_alt_names.append(x509.UniformResourceIdentifier(value))
+        elif prefix == "RID":
+            subject_alt_names.append(x509.RegisteredID(ObjectIdentifier(value)))
+        elif prefix == "dirName":
+            subject_alt_names.append(x509.DirectoryName(x509.Name.from_rfc4514_string(value)))
+        else:
+            raise ValueError(f"unsupported subject alternative name {name}")
+    if subject_alt_names:
+        builder = builder.add_extension(x509.SubjectAlternativeName(subject_alt_names), critical=True)
+
+    constraints = normalize_basic_constraints(basic_constraints)
+    if constraints:
+        path_length = next((int(item.partition(":")[2]) for item in constraints if item.startswith("pathlen:")), None)
+        builder = builder.add_extension(x509.BasicConstraints(ca="CA:TRUE" in constraints, path_length=path_length), critical=True)
+
+    algorithm = None if isinstance(ca_private_key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)) else hashes.SHA256()
+    return builder.sign(ca_private_key, algorithm)
@@ -0,0 +1,169 @@
+"""
+This module decides whether a certificate issued by an OwnCA has to be issued again.
+
+Every check of the get_certificate_ownca role, validity, issuer, private key, key usage, extended key usage,
+subject alternative name, subject and basic constraints, is done in one process, and every reason that applies is returned.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+# Copyright: (c) 2022, Arpan Mandal <arpan.rec@gmail.com>
+# MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
+from __future__ import absolute_import, division, print_function
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import renewal_reasons
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+
+DOCUMENTATION = r"""
+---
+module: certificate_needs_renewal
+
+short_description: Decide whether a certificate issued by an OwnCA has to be issued again
+
+version_added: "5.0.0"
+
+description:
+  - Compares an existing certificate with the expected certificate and its OwnCA, in one process.
+  - Returns O(needs_renewal) and every reason that applies, an empty list when nothing changed.
+  - Fails when a certificate valid for O(validity_days) would outlive the OwnCA certificate.
+
+options:
+  certificate_content:
+    description: The existing certificate, empty when there is none.
+    required: false
+    type: str
+    default: ""
+  ca_certificate_content:
+    description: The OwnCA certificate.
+    required: true
+    type: str
+  private_key_content:
+    description: The private key of the certificate, the certificate is renewed when its public key does not match.
+    required: false
+    type: str
+  private_key_passphrase:
+    description: The passphrase of O(private_key_content).
+    required: false
+    type: str
+  validity_days:
+    description: Validity of a new certificate, in days.
+    required: false
+    type: int
+    default: 7
+  min_remaining_days:
+    description: The certificate is renewed when it is not valid anymore this many days from now.
+    required: false
+    type: int
+    default: 1
+  key_usage:
+    description: Expected key usages, OpenSSL names like C(digitalSignature) or community.crypto names like C(Digital Signature).
+    required: false
+    type: list
+    elements: str
+    default: []
+  extended_key_usage:
+    description: Expected extended key usages, OpenSSL names like C(serverAuth), community.crypto names or dotted OIDs.
+    required: false
+    type: list
+    elements: str
+    default: []
+  subject_alt_name:
+    description: Expected subject alternative names, like C(DNS:www.example.com) or C(IP:127.0.0.1).
+    required: false
+    type: list
+    elements: str
+    default: []
+  subject:
+    description: Expected subject, like C(commonName) or C(CN), values can be lists.
+    required: false
+    type: dict
+    default: {}
+  basic_constraints:
+    description: Expected basic constraints, like C(CA:TRUE) and C(pathlen:0).
+    required: false
+    type: list
+    elements: str
+    default: []
+author:
+  - Arpan Mandal (mailto:arpan.rec@gmail.com)
+"""
+
+EXAMPLES = r"""
+- name: Check the certificate
+  arpanrec.nebula.certificate_needs_renewal:
+    certificate_content: "{{ lookup('file', 'server.crt') }}"
+    ca_certificate_content: "{{ lookup('file', 'ca.crt') }}"
+    private_key_content: "{{ lookup('file', 'server.key') }}"
+    validity_days: 30
+    key_usage:
+      - digitalSignature
+      - keyEncipherment
+    extended_key_usage:
+      - serverAuth
+    subject_alt_name:
+      - DNS:www.example.com
+    subject:
+      commonName: www.example.com
+  register: server_certificate_check
+"""
+
+RETURN = r"""
+needs_renewal:
+  description: Whether the certificate has to be issued again
+  type: bool
+  returned: always
+reasons:
+  description: Every reason the certificate has to be issued again
+  type: list
+  elements: str
+  returned: always
+"""
+
+
+def run_module():
+    """
+    Ansible main module
+    """
+    module_args = {
+        "certificate_content": {"type": "str", "required": False, "default": ""},
+        "ca_certificate_content": {"type": "str", "required": True},
+        "private_key_content": {"type": "str", "required": False, "no_log": True},
+        "private_key_passphrase": {"type": "str", "required": False, "no_log": True},
+        "validity_days": {"type": "int", "required": False, "default": 7},
+        "min_remaining_days": {"type": "int", "required": False, "default": 1},
+        "key_usage": {"type": "list", "elements": "str", "required": False, "default": []},
+        "extended_key_usage": {"type": "list", "elements": "str", "required": False, "default": []},
+        "subject_alt_name": {"type": "list", "elements": "str", "required": False, "default": []},
+        "subject": {"type": "dict", "required": False, "default": {}},
+        "basic_constraints": {"type": "list", "elements": "str", "required": False, "default": []},
+    }
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+
+    try:
+        result = renewal_reasons(**module.params)
+    except (ValueError, TypeError) as ex:
+        module.fail_json(msg=f"Unable to check the certificate: {ex}")
+
+    if "error" in result:
+        module.fail_json(msg=result["error"])
+
+    module.exit_json(changed=False, **result)
+
+
+def main():
+    """
+    Python Main Module
+    """
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,20 @@ Ansible Module for adding github action secret.
 # MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
 from __future__ import absolute_import, division, print_function
 
-from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 
+import hvac
 import requests
 from ansible.module_utils.basic import AnsibleModule
-from nacl import encoding, public
+from ansible_collections.arpanrec.nebula.plugins.module_utils.github_core import (
+    GithubClient,
+    GithubError,
+    encrypt,
+    read_ledger,
+    secret_digest,
+    write_ledger,
+)
+from ansible_collections.arpanrec.nebula.plugins.module_utils.hashicorp_vault_core import vault_client
 
 # pylint: disable=C0103
 __metaclass__ = type
@@ -24,7 +33,10 @@ short_description: Create Update Delete Github Action Secret
 
 version_added: "1.0.0"
 
-description: Create Update Delete Github Action Secret.
+description:
+  - Create Update Delete Github Action Secret.
+  - With O(targets), many secrets of many repositories and organizations are created or updated in one invocation,
+    over one pooled HTTP session, fetching each public key once and waiting for the rate limit reset when needed.
 
 options:
   api_ep:
@@ -54,8 +66,10 @@ options:
     required: false
     type: str
   name:
-    description: Name of the secret
-    required: true
+    description:
+      - Name of the secret
+      - Mandatory unless O(targets) is set, mutually exclusive with O(targets)
+    required: false
     type: str
   repository:
     description: Name of the github repository.
@@ -72,6 +86,91 @@ options:
     choices: ["private", "all", "selected"]
     type: str
     required: false
+  targets:
+    description:
+      - Repositories and organizations with their secrets, created or updated concurrently.
+      - Mutually exclusive with O(name), O(owner), O(repository), O(organization) and O(unencrypted_secret).
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      owner:
+        description: Owner of the repository, the owner of PAT when O(targets[].organization) is missing too.
+        required: false
+        type: str
+      repository:
+        description: Name of the repository, the secrets are organization secrets when missing.
+        required: false
+        type: str
+      organization:
+        description: Organization of the repository, or of the secrets when O(targets[].repository) is missing.
+        required: false
+        type: str
+      visibility:
+        description: Mandatory for organization secrets.
+        choices: ["private", "all", "selected"]
+        required: false
+        type: str
+      secrets:
+        description:
+          - Plain text secrets, by name.
+          - Every value must be a string, quote numbers and booleans, other types are rejected.
+        required: true
+        type: dict
+  concurrency:
+    description: Maximum number of concurrent requests with O(targets).
+    required: false
+    type: int
+    default: 8
+  ledger_path:
+    description:
+      - File keeping an HMAC of every secret sent with O(targets) and its C(updated_at), created when missing.
+      - The secrets of every scope are listed once, and a secret is sent only when its value or its C(updated_at) changed.
+      - Mutually exclusive with O(ledger_vault).
+    required: false
+    type: path
+  ledger_vault:
+    description: Same as O(ledger_path), the ledger is kept in a HashiCorp Vault KV v2 secret.
+    required: false
+    type: dict
+    suboptions:
+      url:
+        description: Vault address.
+        required: false
+        type: str
+        default: "http://localhost:8200"
+      token:
+        description: Vault token, environment variable C(VAULT_TOKEN) has more priority.
+        required: false
+        type: str
+      validate_certs:
+        description: Verify the TLS connection to Vault.
+        required: false
+        type: bool
+        default: true
+      mount_point:
+        description: Mount point of the KV v2 secrets engine.
+        required: false
+        type: str
+        default: secret
+      path:
+        description: Path of the ledger secret.
+        required: true
+        type: str
+  ledger_key:
+    description: HMAC key of the ledger digests, O(pat) when missing, so a new PAT sends every secret once.
+    required: false
+    type: str
+  exclusive:
+    description:
+      - O(targets) are the complete set of secrets of their repositories and organizations.
+      - The existing secrets are listed once per scope, the secrets missing from O(targets) are deleted
+        while the others are created or updated concurrently.
+      - A target with empty O(targets[].secrets) deletes every secret of its scope.
+      - Only supported with O(targets).
+    required: false
+    type: bool
+    default: false
 author:
   - Arpan Mandal (mailto:arpan.rec@gmail.com)
 """
@@ -95,6 +194,39 @@ EXAMPLES = r"""
     state: present
     visibility: all
 
+- name: Create or Update many secrets of many repositories
+  github_action_secret:
+    pat: "{{ lookup('ansible.builtin.env', 'GH_PROD_API_TOKEN') }}"
+    concurrency: 16
+    targets:
+      - repository: "github_master_controller"
+        secrets:
+          ENV_SECRET1: "supersecret1"
+          ENV_SECRET2: "supersecret2"
+      - organization: arpanrec
+        visibility: all
+        secrets:
+          ENV_SECRET: "supersecret"
+
+- name: Create or Update only the changed secrets
+  github_action_secret:
+    pat: "{{ lookup('ansible.builtin.env', 'GH_PROD_API_TOKEN') }}"
+    ledger_path: "{{ lookup('ansible.builtin.env', 'HOME') }}/.cache/github_action_secret_ledger.json"
+    ledger_key: "{{ lookup('ansible.builtin.env', 'GH_LEDGER_KEY') }}"
+    targets:
+      - repository: "github_master_controller"
+        secrets:
+          ENV_SECRET1: "supersecret1"
+
+- name: Make the repository secrets exactly these, deleting the others
+  github_action_secret:
+    pat: "{{ lookup('ansible.builtin.env', 'GH_PROD_API_TOKEN') }}"
+    exclusive: true
+    targets:
+      - repository: "github_master_controller"
+        secrets:
+          ENV_SECRET1: "supersecret1"
+
 - name: Delete a repository secret
   github_action_secret:
     api_ep: "https://api.github.com"
@@ -117,17 +249,24 @@ secret:
   description: Encrypted secret
   type: str
   returned: if state == present
+secrets:
+  description: Secrets created or updated with O(targets), the scope, the name and C(created) or C(updated)
+  type: list
+  elements: dict
+  returned: if targets
+unchanged:
+  description: Secrets skipped with O(targets) because the ledger shows they did not change, the scope and the name
+  type: list
+  elements: dict
+  returned: if targets
+deleted:
+  description: Secrets deleted with O(exclusive), the scope and the name
+  type: list
+  elements: dict
+  returned: if targets
 """
 
 
-def encrypt(public_key: str, secret_value: str) -> str:
-    """Encrypt a Unicode string using the public key."""
-    public_key = public.PublicKey(public_key.encode("utf-8"), encoding.Base64Encoder())
-    sealed_box = public.SealedBox(public_key)
-    encrypted = sealed_box.encrypt(secret_value.encode("utf-8"))
-    return b64encode(encrypted).decode("utf-8")
-
-
 def crud(
     pat=None,
     owner=None,
@@ -234,6 +373,170 @@ def crud(
     return result
 
 
+def bulk_crud(pat=None, api_ep=None, targets=None, concurrency=8, ledger=None, ledger_key=None, exclusive=False) -> dict:
+    """
+    Creates or updates the secrets of many repositories and organizations.
+
+    Each public key is fetched once, and the secrets are sealed and sent concurrently over one pooled session.
+    With a ledger, the secrets of every scope are listed once and the secrets whose digest and `updated_at`
+    match the ledger are skipped, the ledger is updated in place with the secrets sent,
+    and the `updated_at` of each of them read back right after its own PUT.
+    With `exclusive`, the targets are the complete set of secrets of their scopes, the existing secrets
+    missing from them are deleted while the others are created or updated.
+
+    Parameters:
+        api_ep (str): The endpoint of the GitHub API.
+        pat (str): The Personal Access Token (PAT) for the GitHub API.
+        targets (list): Repositories and organizations with their `secrets`, see the module documentation.
+        concurrency (int): Maximum number of concurrent requests.
+        ledger (dict): Digest and `updated_at` of the secrets sent before, by `<scope>/<name>`. Optional.
+        ledger_key (str): HMAC key of the ledger digests, the PAT when missing.
+        exclusive (bool): Delete the secrets of the target scopes that are not in the targets.
+
+    Returns:
+        dict: A dictionary containing the results, `error` lists the failed secrets.
+    """
+
+    result = {"changed": False, "secrets": [], "unchanged": [], "deleted": []}
+    client = GithubClient(api_ep, pat, pool_size=concurrency)
+    jobs = []
+    declared = {}
+    for target in targets:
+        if not target.get("repository") and not target.get("organization"):
+            result["error"] = f"'repository' or 'organization' is mandatory in every target, {target.get('owner')}"
+            return result
+        if target.get("owner") and target.get("organization"):
+            result["error"] = f"'owner' and 'organization' are mutually exclusive, {target['owner']}"
+            return result
+        if not target.get("repository") and target.get("visibility") not in ["private", "all", "selected"]:
+            result["error"] = f"visibility should in 'private', 'all', 'selected', organization {target['organization']}"
+            return result
+        try:
+            scope = client.scope(target.get("owner"), target.get("repository"), target.get("organization"))
+        except requests.RequestException as ex:
+            result["error"] = f"Unable to get the owner of PAT: {ex}"
+            return result
+        declared.setdefault(scope, set())
+        for name, unencrypted_secret in (target.get("secrets") or {}).items():
+            if not isinstance(unencrypted_secret, str):
+                result["error"] = f"The value of secret {name} in {scope} must be a string, not {type(unencrypted_secret).__name__}"
+                return result
+            jobs.append((scope, name, unencrypted_secret, target.get("visibility")))
+            declared[scope].add(name)
+
+    def _list_secrets(scope):
+        try:
+            return client.list_secrets(scope)
+        except GithubError as ex:
+            return ex
+
+    def _put_secret(scope, name, unencrypted_secret, visibility):
+        outcome = client.put_secret(scope, name, unencrypted_secret, visibility)
+        if ledger is not None and "error" not in outcome:
+            try:
+                outcome["updated_at"] = (client.get_secret(scope, name) or {}).get("updated_at")
+            except GithubError:
+                outcome["updated_at"] = None
+        return outcome
+
+    def _public_key(scope):
+        try:
+            client.public_key(scope)
+        except GithubError:
+            pass
+
+    ledger_key = ledger_key or pat
+    errors = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        existing = {}
+        if ledger is not None or exclusive:
+            scopes = sorted(declared)
+            for scope, secrets in zip(scopes, executor.map(_list_secrets, scopes)):
+                if isinstance(secrets, GithubError):
+                    errors.append({"scope": scope, **secrets.args[0]})
+                else:
+                    existing[scope] = secrets
+
+        if ledger is not None:
+            pending = []
+            for job in jobs:
+                scope, name, unencrypted_secret, _ = job
+                entry = ledger.get(f"{scope}/{name}", {})
+                if (
+                    name in existing.get(scope, {})
+                    and entry.get("updated_at") == existing[scope][name].get("updated_at")
+                    and entry.get("digest") == secret_digest(ledger_key, scope, name, unencrypted_secret)
+                ):
+                    result["unchanged"].append({"scope": scope, "name": name})
+                else:
+                    pending.append(job)
+            jobs = pending
+
+        deletes = []
+        if exclusive:
+            deletes = [(scope, name) for scope in sorted(existing) for name in sorted(existing[scope]) if name not in declared[scope]]
+
+        list(executor.map(_public_key, sorted({job[0] for job in jobs})))
+        put_futures = [executor.submit(_put_secret, *job) for job in jobs]
+        delete_futures = [executor.submit(client.delete_secret, scope, name) for scope, name in deletes]
+
+        for job, future in zip(jobs, put_futures):
+            outcome = future.result()
+            if "error" in outcome:
+                errors.append({"scope": job[0], "name": job[1], **outcome["error"]})
+            else:
+                updated_at = outcome.pop("updated_at", None)
+                result["changed"] = True
+                result["secrets"].append({"scope": job[0], "name": job[1], **outcome})
+                if ledger is not None:
+                    ledger[f"{job[0]}/{job[1]}"] = {
+                        "digest": secret_digest(ledger_key, job[0], job[1], job[2]),
+                        "updated_at": updated_at,
+                    }
+
+        for (scope, name), future in zip(deletes, delete_futures):
+            outcome = future.result()
+            if "error" in outcome:
+                errors.append({"scope": scope, "name": name, **outcome["error"]})
+                continue
+            if outcome["deleted"]:
+                result["changed"] = True
+                result["deleted"].append({"scope": scope, "name": name})
+            if ledger is not None:
+                ledger.pop(f"{scope}/{name}", None)
+
+    if errors:
+        result["error"] = errors
+    return result
+
+
+def _read_ledger(ledger_path: str = None, ledger_vault: dict = None) -> dict:
+    """
+    Reads the ledger from the file `ledger_path` or from the vault KV v2 secret `ledger_vault`, empty when missing.
+    """
+    if ledger_path:
+        return read_ledger(ledger_path)
+    client = vault_client(ledger_vault["url"], ledger_vault["token"], verify=ledger_vault["validate_certs"])
+    try:
+        response = client.secrets.kv.v2.read_secret_version(
+            path=ledger_vault["path"], mount_point=ledger_vault["mount_point"], raise_on_deleted_version=True
+        )
+    except hvac.exceptions.InvalidPath:
+        return {}
+    return response["data"]["data"]
+
+
+def _write_ledger(ledger: dict, ledger_path: str = None, ledger_vault: dict = None) -> None:
+    """
+    Writes the ledger to the file `ledger_path` or to the vault KV v2 secret `ledger_vault`.
+    """
+    if ledger_path:
+        write_ledger(ledger_path, ledger)
+        return
+    client = vault_client(ledger_vault["url"], ledger_vault["token"], verify=ledger_vault["validate_certs"])
+    client.secrets.kv.v2.create_or_update_secret(path=ledger_vault["path"], secret=ledger, mount_point=ledger_vault["mount_point"])
+
+
 def run_module():
     """
     Ansible main module
@@ -245,10 +548,37 @@ def run_module():
         "owner": {"type": "str", "required": False},
         "organization": {"type": "str", "required": False},
         "unencrypted_secret": {"type": "str", "required": False, "no_log": True},
-        "name": {"type": "str", "required": True},
+        "name": {"type": "str", "required": False},
         "repository": {"type": "str", "required": False},
         "state": {"type": "str", "required": False, "default": "present", "choices": ["present", "absent"]},
         "visibility": {"type": "str", "required": False, "choices": ["private", "all", "selected"]},
+        "targets": {
+            "type": "list",
+            "elements": "dict",
+            "required": False,
+            "options": {
+                "owner": {"type": "str", "required": False},
+                "repository": {"type": "str", "required": False},
+                "organization": {"type": "str", "required": False},
+                "visibility": {"type": "str", "required": False, "choices": ["private", "all", "selected"]},
+                "secrets": {"type": "dict", "required": True, "no_log": True},
+            },
+        },
+        "concurrency": {"type": "int", "required": False, "default": 8},
+        "ledger_path": {"type": "path", "required": False},
+        "ledger_vault": {
+            "type": "dict",
+            "required": False,
+            "options": {
+                "url": {"type": "str", "required": False, "default": "http://localhost:8200"},
+                "token": {"type": "str", "required": False, "no_log": True},
+                "validate_certs": {"type": "bool", "required": False, "default": True},
+                "mount_point": {"type": "str", "required": False, "default": "secret"},
+                "path": {"type": "str", "required": True},
+            },
+        },
+        "ledger_key": {"type": "str", "required": False, "no_log": True},
+        "exclusive": {"type": "bool", "required": False, "default": False},
     }
 
     module = AnsibleModule(
@@ -258,15 +588,57 @@ def run_module():
             ("owner", "organization"),
             ("unencrypted_secret", "secret"),
             ("owner", "visibility"),
+            ("name", "targets"),
+            ("targets", "owner"),
+            ("targets", "repository"),
+            ("targets", "organization"),
+            ("targets", "unencrypted_secret"),
+            ("ledger_path", "ledger_vault"),
         ],
         required_one_of=[
-            ("repository", "organization"),
+            ("repository", "organization", "targets"),
+            ("name", "targets"),
         ],
         required_if=[
-            ("state", "present", (["unencrypted_secret"]), False),
+            ("state", "present", (["unencrypted_secret", "targets"]), True),
         ],
+        required_by={
+            "ledger_path": "targets",
+            "ledger_vault": "targets",
+        },
     )
 
+    if module.params["exclusive"] and module.params["targets"] is None:
+        module.fail_json(msg="'exclusive' is only supported with 'targets'")
+
+    if module.params["targets"] is not None:
+        if module.params["state"] != "present":
+            module.fail_json(msg="'targets' only supports state present")
+        ledger_path, ledger_vault = module.params["ledger_path"], module.params["ledger_vault"]
+        ledger = None
+        if ledger_path or ledger_vault:
+            try:
+                ledger = _read_ledger(ledger_path, ledger_vault)
+            except (hvac.exceptions.VaultError, requests.RequestException) as ex:
+                module.fail_json(msg=f"Unable to read the ledger: {ex}")
+        bulk_response = bulk_crud(
+            api_ep=module.params["api_ep"],
+            pat=module.params["pat"],
+            targets=module.params["targets"],
+            concurrency=module.params["concurrency"],
+            ledger=ledger,
+            ledger_key=module.params["ledger_key"],
+            exclusive=module.params["exclusive"],
+        )
+        if ledger is not None and bulk_response["changed"]:
+            try:
+                _write_ledger(ledger, ledger_path, ledger_vault)
+            except (OSError, hvac.exceptions.VaultError, requests.RequestException) as ex:
+                bulk_response["error"] = bulk_response.get("error", []) + [f"Unable to write the ledger: {ex}"]
+        if "error" in bulk_response:
+            module.fail_json(msg=bulk_response["error"], **bulk_response)
+        module.exit_json(**bulk_response)
+
     github_update_response = crud(
         api_ep=module.params["api_ep"],
         pat=module.params["pat"],
@@ -5,6 +5,14 @@ It uses the GitLab API to trigger a pipeline for a specific project. The module
 and access token as input.
 It also allows for the specification of a branch or tag for which to trigger the pipeline, as well as any variables to include in the pipeline.
 
+The trigger tokens of a project are listed page by page, and the resolved trigger token and default branch can be
+kept in a local cache with a TTL.
+
+Many projects can be triggered at once, concurrently over one pooled HTTP session.
+
+The triggered pipelines can be waited for, all of them polled in a single loop with exponential backoff, jitter and
+conditional requests.
+
 This module is part of the arpanrec.nebula collection.
 
 Author:
@@ -15,12 +23,20 @@ Author:
 # MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
 from __future__ import absolute_import, division, print_function
 
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from ansible.errors import AnsibleError
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.common.text.converters import to_native
+from requests.adapters import HTTPAdapter
 
 # pylint: disable=C0103
 __metaclass__ = type
@@ -34,7 +50,10 @@ short_description: Trigger Gitlab Pipeline
 
 version_added: "1.0.0"
 
-description: Trigger Gitlab Pipeline.
+description:
+  - Trigger Gitlab Pipeline.
+  - With O(projects), many projects are triggered concurrently over one pooled HTTP session.
+  - With O(wait), the module returns when the triggered pipelines finish, polling all of them in one loop.
 
 options:
   api_ep:
@@ -51,13 +70,86 @@ options:
     required: false
     type: str
   project_id:
-    description: The ID or URL-encoded path of the project owned by the authenticated user.
+    description:
+      - The ID or URL-encoded path of the project owned by the authenticated user.
+      - Mandatory unless O(projects) is set, mutually exclusive with O(projects).
+    required: false
+    type: str
   ref:
     description:
       - The branch or tag to run the pipeline on.
       - Defaults to the default branch of repo
     required: false
     type: str
+  projects:
+    description:
+      - Projects to trigger concurrently, with the same O(api_ep) and O(private_token).
+      - Mutually exclusive with O(project_id), O(ref) and O(token).
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      project_id:
+        description: The ID or URL-encoded path of the project.
+        required: true
+        type: str
+      ref:
+        description: The branch or tag to run the pipeline on, defaults to the default branch of repo.
+        required: false
+        type: str
+      token:
+        description:
+          - The trigger token of the project, created with O(private_token) when missing.
+          - With O(projects[].ref), the project is triggered with this token only, it overrides O(private_token).
+        required: false
+        type: str
+  concurrency:
+    description: Maximum number of projects triggered or polled at once.
+    required: false
+    type: int
+    default: 8
+  wait:
+    description:
+      - Wait until the triggered pipelines finish, fail when one of them failed, was canceled or did not finish in time.
+      - Every pipeline is polled with its own exponential backoff, from O(poll_interval) up to O(max_poll_interval) seconds,
+        with jitter, and back to O(poll_interval) when its status changes.
+      - Polls are conditional requests with the last C(ETag), an unchanged pipeline is answered with an empty C(304).
+      - O(private_token) is mandatory.
+    required: false
+    type: bool
+    default: false
+  wait_timeout:
+    description: Maximum number of seconds to wait for the pipelines with O(wait).
+    required: false
+    type: int
+    default: 3600
+  poll_interval:
+    description: First delay between two polls of a pipeline with O(wait), in seconds.
+    required: false
+    type: float
+    default: 5
+  max_poll_interval:
+    description: Maximum delay between two polls of a pipeline with O(wait), in seconds.
+    required: false
+    type: float
+    default: 60
+  cache_ttl:
+    description:
+      - Keep the trigger token and the default branch resolved with O(private_token) for this many seconds,
+        so that later triggers of the same project skip the trigger and the project lookups.
+      - The cache is opt-in, with the default C(0) nothing is cached and no file is written,
+        every run lists the trigger tokens and reads the project when O(token) or O(ref) is missing.
+      - A cached trigger token that the trigger endpoint refuses with C(401) or C(404) is dropped and resolved again, once.
+      - A cached default branch that no longer exists, a C(400) with C(Reference not found), is dropped and looked up again, once.
+    required: false
+    type: int
+    default: 0
+  cache_path:
+    description:
+      - File of the trigger cache, readable only by the owner, as it holds trigger tokens.
+      - Defaults to C($XDG_CACHE_HOME/nebula-gitlab-triggers.json).
+    required: false
+    type: path
 author:
   - Arpan Mandal (mailto:arpan.rec@gmail.com)
 
@@ -75,26 +167,70 @@ EXAMPLES = r"""
     token: xxxxxxxxxxx
     project_id: arpanrec/test
     ref: feature/something
+
+- name: Trigger the pipelines of a release train
+  gitlab_trigger_pipeline:
+    private_token: xxxxxxxxxxx
+    concurrency: 16
+    projects:
+      - project_id: arpanrec/service-a
+      - project_id: arpanrec/service-b
+        ref: release/1.2
+
+- name: Trigger pipelines and wait for them
+  gitlab_trigger_pipeline:
+    private_token: xxxxxxxxxxx
+    projects:
+      - project_id: arpanrec/service-a
+      - project_id: arpanrec/service-b
+    wait: true
+    wait_timeout: 1800
 """
 
 RETURN = r"""
 run_details:
-    description: Newly created pipeline run details
+    description: Newly created pipeline run details, the finished pipeline with O(wait)
     type: dict
     returned: always
+runs:
+    description: Result of every project of O(projects), with O(projects[].project_id), C(ref) and C(run_details)
+    type: list
+    elements: dict
+    returned: if projects
 """
 
 
+def gitlab_session(pool_size: int = 8) -> requests.Session:
+    """
+    HTTP session keeping up to `pool_size` connections alive, shared by concurrent triggers.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def crud(
     api_ep=None,
     private_token=None,
     token=None,
     project_id=None,
     ref=None,
+    session=None,
+    cache=None,
+    cache_ttl=3600,
 ) -> dict:
     """
     Gitlab Trigger pipeline implementation
+
+    All requests go through `session` when given, a new connection per request otherwise.
+    With a `cache` dictionary, the trigger token and the default branch resolved with the private token are kept
+    for `cache_ttl` seconds, a cached trigger token refused with a 401 or 404 is dropped and resolved again,
+    and a cached default branch that GitLab does not find, a 400 with `Reference not found`, is dropped and looked up again,
+    once each.
     """
+    http = session or requests
     result = {"changed": False, "token_created": False}
     _token_description = "gitlab_trigger_pipeline_tmp"
 
@@ -118,24 +254,45 @@ def crud(
         result["error"] = "private_token is mandatory when ref is not present"
         return result
 
+    cache_key = None
+    cache_entry = {}
+    if cache is not None and private_token:
+        cache_key = hashlib.sha256(f"{api_ep}\0{project_id}\0{private_token}".encode("utf-8")).hexdigest()
+        cache_entry = cache.get(cache_key, {})
+        if cache_entry.get("expires_at", 0) <= time.time():
+            cache_entry = {}
+    _requested = {"project_id": project_id, "ref": ref}
+    _cached_token = not token and "token" in cache_entry
+    _cached_ref = not ref and "default_branch" in cache_entry
+    token = token or cache_entry.get("token")
+    ref = ref or cache_entry.get("default_branch")
+    _resolved = {}
+
     project_id = urllib.parse.quote(project_id.encode("utf-8"), safe="").strip()
 
     if not token:
         head = {"PRIVATE-TOKEN": private_token}
         trigger_url = f"{api_ep}/api/v4/projects/{project_id}/triggers"
-        list_of_trigger_token_response = requests.get(trigger_url, timeout=30, headers=head)
-        if list_of_trigger_token_response.status_code == 200:
-            _if_token_exists = False
+        _if_token_exists = False
+        _page = "1"
+        while _page and not _if_token_exists:
+            list_of_trigger_token_response = http.get(
+                trigger_url, timeout=30, headers=head, params={"per_page": 100, "page": _page}
+            )
+            if list_of_trigger_token_response.status_code != 200:
+                break
             for token_details in list_of_trigger_token_response.json():
                 if token_details["description"] == _token_description:
                     _token_details = token_details
                     _if_token_exists = True
                     break
+            _page = list_of_trigger_token_response.headers.get("X-Next-Page")
+        if list_of_trigger_token_response.status_code == 200:
             if not _if_token_exists:
                 params = {
                     "description": _token_description,
                 }
-                new_trigger_token_response = requests.post(trigger_url, timeout=30, headers=head, params=params)
+                new_trigger_token_response = http.post(trigger_url, timeout=30, headers=head, params=params)
                 if new_trigger_token_response.status_code == 201:
                     result["changed"] = True
                     result["token_created"] = True
@@ -153,14 +310,16 @@ def crud(
             }
             return result
         token = _token_details["token"]
+        _resolved["token"] = token
     result["token"] = token
 
     if not ref:
         head = {"PRIVATE-TOKEN": private_token}
         ref_url = f"{api_ep}/api/v4/projects/{project_id}"
-        ref_details_res = requests.get(ref_url, timeout=30, headers=head)
+        ref_details_res = http.get(ref_url, timeout=30, headers=head)
         if ref_details_res.status_code == 200:
             ref = ref_details_res.json().get("default_branch")
+            _resolved["default_branch"] = ref
         else:
             result["error"] = {
                 "msg": ref_details_res.json(),
@@ -172,7 +331,36 @@ def crud(
 
     trigger_pipeline_url = f"{api_ep}/api/v4/projects/{project_id}/trigger/pipeline"
     params = {"ref": ref, "token": token}
-    trigger_pipeline_details_res = requests.post(trigger_pipeline_url, params=params, timeout=30)
+    trigger_pipeline_details_res = http.post(trigger_pipeline_url, params=params, timeout=30)
+    if cache_key and _cached_token and trigger_pipeline_details_res.status_code in (401, 404):
+        cache.pop(cache_key, None)
+        return crud(
+            api_ep=api_ep,
+            private_token=private_token,
+            project_id=_requested["project_id"],
+            ref=_requested["ref"],
+            session=session,
+            cache=cache,
+            cache_ttl=cache_ttl,
+        )
+    if (
+        cache_key
+        and _cached_ref
+        and trigger_pipeline_details_res.status_code == 400
+        and "Reference not found" in trigger_pipeline_details_res.text
+    ):
+        cache[cache_key] = {key: value for key, value in cache_entry.items() if key != "default_branch"}
+        return crud(
+            api_ep=api_ep,
+            private_token=private_token,
+            project_id=_requested["project_id"],
+            ref=_requested["ref"],
+            session=session,
+            cache=cache,
+            cache_ttl=cache_ttl,
+        )
+    if cache_key and _resolved:
+        cache[cache_key] = {**cache_entry, **_resolved, "expires_at": time.time() + cache_ttl}
     if trigger_pipeline_details_res.status_code == 201:
         result["run_details"] = trigger_pipeline_details_res.json()
         result["changed"] = True
@@ -192,6 +380,190 @@ def crud(
     return result
 
 
+def _default_cache_path() -> str:
+    """
+    Trigger cache file when not given, `$XDG_CACHE_HOME/nebula-gitlab-triggers.json`.
+    """
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "nebula-gitlab-triggers.json")
+
+
+def _read_cache(cache_path: str) -> dict:
+    """Reads the trigger cache file, without the expired entries, empty when missing or unreadable."""
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            entries = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    return {key: entry for key, entry in entries.items() if entry.get("expires_at", 0) > time.time()}
+
+
+def _write_cache(cache_path: str, entries: dict) -> None:
+    """Atomically writes the trigger cache file with mode 0600."""
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".gitlab_triggers_")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def bulk_crud(
+    api_ep=None, private_token=None, projects=None, concurrency=8, session=None, cache=None, cache_ttl=3600
+) -> dict:
+    """
+    Triggers the pipelines of many projects concurrently, over one pooled session.
+
+    Parameters:
+        api_ep (str): Gitlab endpoint.
+        private_token (str): Gitlab Private Token, used by the projects without a trigger token or a ref.
+        projects (list): Projects with their `project_id`, and optional `ref` and `token`.
+        concurrency (int): Maximum number of projects triggered at once.
+        session (requests.Session): HTTP session, a new pooled session when missing.
+        cache (dict): Trigger tokens and default branches, see `crud`. Optional.
+        cache_ttl (int): Lifetime of new cache entries, in seconds.
+
+    Returns:
+        dict: `runs`, the result of every project in order, and `error` listing the failed projects.
+    """
+    session = session or gitlab_session(concurrency)
+
+    def _trigger(project):
+        # the trigger token and ref of a project override the module private token, crud refuses both at once
+        project_private_token = None if project.get("token") and project.get("ref") else private_token
+        try:
+            run = crud(
+                api_ep=api_ep,
+                private_token=project_private_token,
+                token=project.get("token"),
+                project_id=project["project_id"],
+                ref=project.get("ref"),
+                session=session,
+                cache=cache,
+                cache_ttl=cache_ttl,
+            )
+        except requests.RequestException as ex:
+            run = {"changed": False, "error": to_native(ex)}
+        run.pop("token", None)
+        return {"project_id": project["project_id"], **run}
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        runs = list(executor.map(_trigger, projects))
+
+    result = {"changed": any(run["changed"] for run in runs), "runs": runs}
+    errors = [{"project_id": run["project_id"], "error": run["error"]} for run in runs if "error" in run]
+    if errors:
+        result["error"] = errors
+    return result
+
+
+def wait_for_pipelines(
+    api_ep=None,
+    private_token=None,
+    runs=None,
+    session=None,
+    timeout=3600,
+    poll_interval=5,
+    max_poll_interval=60,
+    concurrency=8,
+) -> list:
+    """
+    Waits until the triggered pipelines finish, polling all of them in a single loop.
+
+    Every pipeline is polled with its own exponential backoff from `poll_interval` up to `max_poll_interval`,
+    with equal jitter, and back to `poll_interval` when its status changes. A poll sends the last `ETag`
+    of the pipeline in `If-None-Match`, an unchanged pipeline is answered with an empty 304.
+
+    Parameters:
+        api_ep (str): Gitlab endpoint.
+        private_token (str): Gitlab Private Token.
+        runs (list): `(project_id, run)` pairs, the `run_details` of every run are replaced with the last polled pipeline.
+        session (requests.Session): HTTP session. Optional.
+        timeout (float): Maximum number of seconds to wait.
+        poll_interval (float): First delay between two polls of a pipeline.
+        max_poll_interval (float): Maximum delay between two polls of a pipeline.
+        concurrency (int): Maximum number of pipelines polled at once.
+
+    Returns:
+        list: Errors of the pipelines that failed, were canceled, could not be read or did not finish in time.
+    """
+    http = session or requests
+    polls = []
+    for project_id, run in runs:
+        pipeline_id = (run.get("run_details") or {}).get("id")
+        if "error" in run or not pipeline_id:
+            continue
+        quoted_project_id = urllib.parse.quote(project_id.encode("utf-8"), safe="").strip()
+        polls.append(
+            {
+                "project_id": project_id,
+                "run": run,
+                "url": f"{api_ep}/api/v4/projects/{quoted_project_id}/pipelines/{pipeline_id}",
+                "etag": None,
+                "delay": poll_interval,
+                "next": time.monotonic() + poll_interval,
+            }
+        )
+
+    def _poll(poll):
+        headers = {"PRIVATE-TOKEN": private_token}
+        if poll["etag"]:
+            headers["If-None-Match"] = poll["etag"]
+        try:
+            return http.get(poll["url"], headers=headers, timeout=30)
+        except requests.RequestException as ex:
+            return ex
+
+    errors = []
+    deadline = time.monotonic() + timeout
+    pending = polls
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                for poll in pending:
+                    details = poll["run"]["run_details"]
+                    errors.append(
+                        {
+                            "project_id": poll["project_id"],
+                            "error": f"pipeline {details['id']} did not finish within {timeout} seconds, {details.get('status')}",
+                        }
+                    )
+                break
+            due = [poll for poll in pending if poll["next"] <= now]
+            if not due:
+                time.sleep(min(min(poll["next"] for poll in pending), deadline) - now)
+                continue
+
+            for poll, response in zip(due, executor.map(_poll, due)):
+                status_changed = False
+                if isinstance(response, requests.Response) and response.status_code == 200:
+                    details = response.json()
+                    status_changed = details.get("status") != poll["run"]["run_details"].get("status")
+                    poll["run"]["run_details"] = details
+                    poll["etag"] = response.headers.get("ETag")
+                elif isinstance(response, requests.Response) and response.status_code in (401, 403, 404):
+                    poll["error"] = {"msg": response.json(), "status_code": response.status_code}
+                poll["delay"] = poll_interval if status_changed else min(poll["delay"] * 2, max_poll_interval)
+                poll["next"] = time.monotonic() + poll["delay"] / 2 + random.uniform(0, poll["delay"] / 2)
+
+            still_pending = []
+            for poll in pending:
+                status = poll["run"]["run_details"].get("status")
+                if "error" in poll:
+                    errors.append({"project_id": poll["project_id"], "error": poll["error"]})
+                elif status in ("failed", "canceled"):
+                    errors.append({"project_id": poll["project_id"], "error": f"pipeline {poll['run']['run_details']['id']} {status}"})
+                elif status not in ("success", "skipped", "manual"):
+                    still_pending.append(poll)
+            pending = still_pending
+    return errors
+
+
 def run_module() -> None:
     """
     Ansible run module
@@ -200,20 +572,92 @@ def run_module() -> None:
         "api_ep": {"type": "str", "required": False, "default": "https://gitlab.com"},
         "private_token": {"type": "str", "required": False, "no_log": True},
         "token": {"type": "str", "required": False, "no_log": True},
-        "project_id": {"type": "str", "required": True},
+        "project_id": {"type": "str", "required": False},
         "ref": {"type": "str", "required": False},
+        "projects": {
+            "type": "list",
+            "elements": "dict",
+            "required": False,
+            "options": {
+                "project_id": {"type": "str", "required": True},
+                "ref": {"type": "str", "required": False},
+                "token": {"type": "str", "required": False, "no_log": True},
+            },
+        },
+        "concurrency": {"type": "int", "required": False, "default": 8},
+        "wait": {"type": "bool", "required": False, "default": False},
+        "wait_timeout": {"type": "int", "required": False, "default": 3600},
+        "poll_interval": {"type": "float", "required": False, "default": 5},
+        "max_poll_interval": {"type": "float", "required": False, "default": 60},
+        "cache_ttl": {"type": "int", "required": False, "default": 0},
+        "cache_path": {"type": "path", "required": False},
     }
 
-    module = AnsibleModule(argument_spec=module_args, supports_check_mode=False)
-
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ("project_id", "projects"),
+            ("ref", "projects"),
+            ("token", "projects"),
+        ],
+        required_one_of=[
+            ("project_id", "projects"),
+        ],
+        required_if=[
+            ("wait", True, ["private_token"]),
+        ],
+    )
+
+    session = gitlab_session(module.params["concurrency"])
+    cache = None
+    cache_path = module.params["cache_path"] or _default_cache_path()
+    if module.params["cache_ttl"] > 0:
+        cache = _read_cache(cache_path)
+        cached_entries = dict(cache)
     try:
-        gitlab_pipe_response = crud(
-            api_ep=module.params["api_ep"],
-            private_token=module.params["private_token"],
-            token=module.params["token"],
-            project_id=module.params["project_id"],
-            ref=module.params["ref"],
-        )
+        if module.params["projects"] is not None:
+            gitlab_pipe_response = bulk_crud(
+                api_ep=module.params["api_ep"],
+                private_token=module.params["private_token"],
+                projects=module.params["projects"],
+                concurrency=module.params["concurrency"],
+                session=session,
+                cache=cache,
+                cache_ttl=module.params["cache_ttl"],
+            )
+            runs = [(run["project_id"], run) for run in gitlab_pipe_response["runs"]]
+        else:
+            gitlab_pipe_response = crud(
+                api_ep=module.params["api_ep"],
+                private_token=module.params["private_token"],
+                token=module.params["token"],
+                project_id=module.params["project_id"],
+                ref=module.params["ref"],
+                session=session,
+                cache=cache,
+                cache_ttl=module.params["cache_ttl"],
+            )
+            runs = [(module.params["project_id"], gitlab_pipe_response)]
+
+        if cache is not None and cache != cached_entries:
+            _write_cache(cache_path, cache)
+
+        if module.params["wait"]:
+            wait_errors = wait_for_pipelines(
+                api_ep=module.params["api_ep"],
+                private_token=module.params["private_token"],
+                runs=runs,
+                session=session,
+                timeout=module.params["wait_timeout"],
+                poll_interval=module.params["poll_interval"],
+                max_poll_interval=module.params["max_poll_interval"],
+                concurrency=module.params["concurrency"],
+            )
+            if wait_errors and module.params["projects"] is not None:
+                gitlab_pipe_response["error"] = gitlab_pipe_response.get("error", []) + wait_errors
+            elif wait_errors:
+                gitlab_pipe_response["error"] = wait_errors[0]["error"]
 
     except BaseException as ex:
         raise AnsibleError(f"Something when wrong {to_native(ex)}") from ex
@@ -0,0 +1,227 @@
+"""
+This module encrypts or decrypts files using GnuPG.
+
+Files are streamed through gpg with a fixed size buffer, memory use stays flat whatever the file size,
+and the result is written atomically. It uses the same options as the `gpg_enc` and `gpg_dec` filters.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+# Copyright: (c) 2022, Arpan Mandal <arpan.rec@gmail.com>
+# MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
+from __future__ import absolute_import, division, print_function
+
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.arpanrec.nebula.plugins.module_utils.gnupg_core import d_gpg_file_ops
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+
+DOCUMENTATION = r"""
+---
+module: gpg_file
+
+short_description: Encrypt or decrypt a file with GnuPG
+
+version_added: "5.0.0"
+
+description:
+  - Streams O(src) through gpg into O(dest), O(buffer_size) bytes at a time.
+  - The result is written to a temporary file next to O(dest) and renamed over it, O(dest) is never left half written.
+  - Runs on the target, use O(delegate_to=localhost) to run it on the controller.
+
+requirements:
+  - python-gnupg
+  - gpg
+
+options:
+  src:
+    description: Path of the file to encrypt or decrypt.
+    required: true
+    type: path
+  dest:
+    description: Path of the result.
+    required: true
+    type: path
+  mode:
+    description: Encrypt or decrypt O(src).
+    required: true
+    type: str
+    choices: ["encrypt", "decrypt"]
+  force:
+    description: Overwrite O(dest) if it exists, the module is not changed when false and O(dest) exists.
+    required: false
+    type: bool
+    default: true
+  armor:
+    description: ASCII armor the encrypted file.
+    required: false
+    type: bool
+    default: false
+  buffer_size:
+    description: Size in bytes of the chunks copied to gpg.
+    required: false
+    type: int
+    default: 65536
+  gnupg_home:
+    description:
+      - The GnuPG home directory.
+      - V(temp) for a directory created for this task, its gpg-agent stopped and the directory removed before the module returns.
+      - Defaults to E(GNUPGHOME) or C(~/.gnupg) when empty.
+    required: false
+    type: str
+    default: temp
+  key_server:
+    description: The key server to receive the key from.
+    required: false
+    type: str
+    default: hkps://keys.openpgp.org
+  fingerprint:
+    description: The fingerprint of the key, required with O(recv_keys) or when the keyring has many keys.
+    required: false
+    type: str
+  key_path:
+    description: The path of the key file to import, mutually exclusive with O(key_contents).
+    required: false
+    type: path
+  key_contents:
+    description: The contents of the key to import, mutually exclusive with O(key_path).
+    required: false
+    type: str
+  passphrase:
+    description: The passphrase of the secret key.
+    required: false
+    type: str
+  recv_keys:
+    description: Receive the key O(fingerprint) from O(key_server), only with O(mode=encrypt).
+    required: false
+    type: bool
+    default: false
+  key_cache_dir:
+    description:
+      - Directory of the received keys cache, one exported public key per fingerprint.
+      - Defaults to C($XDG_CACHE_HOME/nebula-gpg-keys).
+    required: false
+    type: path
+  key_cache_ttl:
+    description: Seconds a received key is imported from the cache before it is received again from O(key_server).
+    required: false
+    type: int
+    default: 86400
+  offline:
+    description: Only import O(fingerprint) from the received keys cache, whatever its age, never from O(key_server).
+    required: false
+    type: bool
+    default: false
+author:
+  - Arpan Mandal (mailto:arpan.rec@gmail.com)
+"""
+
+EXAMPLES = r"""
+- name: Encrypt a database dump
+  arpanrec.nebula.gpg_file:
+    src: /var/backups/db.dump
+    dest: /var/backups/db.dump.gpg
+    mode: encrypt
+    fingerprint: 0123456789ABCDEF0123456789ABCDEF01234567
+    recv_keys: true
+
+- name: Decrypt it on the controller
+  arpanrec.nebula.gpg_file:
+    src: db.dump.gpg
+    dest: db.dump
+    mode: decrypt
+    key_contents: "{{ gpg_private_key }}"
+    passphrase: "{{ gpg_passphrase }}"
+  delegate_to: localhost
+"""
+
+RETURN = r"""
+dest:
+  description: Path of the result
+  type: str
+  returned: always
+size:
+  description: Size in bytes of the result
+  type: int
+  returned: always
+"""
+
+
+def run_module():
+    """
+    Ansible main module
+    """
+    module_args = {
+        "src": {"type": "path", "required": True},
+        "dest": {"type": "path", "required": True},
+        "mode": {"type": "str", "required": True, "choices": ["encrypt", "decrypt"]},
+        "force": {"type": "bool", "required": False, "default": True},
+        "armor": {"type": "bool", "required": False, "default": False},
+        "buffer_size": {"type": "int", "required": False, "default": 65536},
+        "gnupg_home": {"type": "str", "required": False, "default": "temp"},
+        "key_server": {"type": "str", "required": False, "default": "hkps://keys.openpgp.org"},
+        "fingerprint": {"type": "str", "required": False},
+        "key_path": {"type": "path", "required": False},
+        "key_contents": {"type": "str", "required": False, "no_log": True},
+        "passphrase": {"type": "str", "required": False, "no_log": True},
+        "recv_keys": {"type": "bool", "required": False, "default": False},
+        "key_cache_dir": {"type": "path", "required": False},
+        "key_cache_ttl": {"type": "int", "required": False, "default": 86400},
+        "offline": {"type": "bool", "required": False, "default": False},
+    }
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        mutually_exclusive=[["key_path", "key_contents"]],
+        supports_check_mode=False,
+    )
+
+    dest = module.params["dest"]
+    result = {"changed": False, "dest": dest}
+
+    if os.path.exists(dest) and not module.params["force"]:
+        result["size"] = os.path.getsize(dest)
+        module.exit_json(**result)
+
+    try:
+        d_gpg_file_ops(
+            src=module.params["src"],
+            dest=dest,
+            gnupg_home=module.params["gnupg_home"],
+            key_server=module.params["key_server"],
+            fingerprint=module.params["fingerprint"],
+            key_path=module.params["key_path"],
+            key_contents=module.params["key_contents"],
+            passphrase=module.params["passphrase"],
+            mode=module.params["mode"],
+            recv_keys=module.params["recv_keys"],
+            key_cache_dir=module.params["key_cache_dir"],
+            key_cache_ttl=module.params["key_cache_ttl"],
+            offline=module.params["offline"],
+            armor=module.params["armor"],
+            buffer_size=module.params["buffer_size"],
+        )
+    except (ValueError, OSError) as ex:
+        module.fail_json(msg=str(ex), **result)
+
+    result["changed"] = True
+    result["size"] = os.path.getsize(dest)
+    module.exit_json(**result)
+
+
+def main():
+    """
+    Python Main Module
+    """
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
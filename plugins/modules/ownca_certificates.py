@@ -0,0 +1,448 @@
+"""
+This module issues many certificates from an OwnCA in one call.
+
+The OwnCA private key and certificate are loaded and parsed once, the missing private keys are generated in a process pool,
+RSA key generation being bound by the CPU, and every certificate is signed and written, or returned, in the same run.
+Certificates which are still valid and match their specification are kept, with the checks of `certificate_needs_renewal`.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+# Copyright: (c) 2022, Arpan Mandal <arpan.rec@gmail.com>
+# MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import (
+    generate_private_key_pem,
+    load_certificate,
+    load_private_key,
+    not_valid_after,
+    renewal_reasons,
+    sign_certificate,
+)
+from cryptography.hazmat.primitives import serialization
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+
+DOCUMENTATION = r"""
+---
+module: ownca_certificates
+
+short_description: Issue many certificates from an OwnCA at once
+
+version_added: "5.0.0"
+
+description:
+  - Loads the OwnCA once and issues every certificate of O(certificates).
+  - Missing private keys are generated by up to O(workers) processes.
+  - Certificates are signed like the P(arpanrec.nebula.get_certificate_ownca#role) role does, extensions are critical.
+  - A certificate whose O(certificates[].certificate_path) exists, or given as O(certificates[].certificate_content),
+    is still valid and matches its specification is kept, unless O(force).
+  - Without any of them the certificate is issued again on every run.
+  - Files are written atomically, certificates of specifications without paths are returned.
+  - Returned private keys are not hidden, use C(no_log) when O(certificates[].private_key_path) is not set.
+
+options:
+  ca_certificate_content:
+    description: The OwnCA certificate, mutually exclusive with O(ca_certificate_path).
+    required: false
+    type: str
+  ca_certificate_path:
+    description: The path of the OwnCA certificate, mutually exclusive with O(ca_certificate_content).
+    required: false
+    type: path
+  ca_private_key_content:
+    description: The OwnCA private key, mutually exclusive with O(ca_private_key_path).
+    required: false
+    type: str
+  ca_private_key_path:
+    description: The path of the OwnCA private key, mutually exclusive with O(ca_private_key_content).
+    required: false
+    type: path
+  ca_private_key_passphrase:
+    description: The passphrase of the OwnCA private key.
+    required: false
+    type: str
+  validity_days:
+    description: Default validity of the certificates, in days.
+    required: false
+    type: int
+    default: 7
+  workers:
+    description: Number of processes generating private keys, defaults to the number of CPUs.
+    required: false
+    type: int
+  force:
+    description: Issue every certificate again, even if it is still valid and matches its specification.
+    required: false
+    type: bool
+    default: false
+  certificates:
+    description: Specifications of the certificates.
+    required: true
+    type: list
+    elements: dict
+    suboptions:
+      name:
+        description: Name of the certificate in the results.
+        required: true
+        type: str
+      subject:
+        description: Subject, like C(commonName) or C(CN), values can be lists, the attributes keep the order given here.
+        type: dict
+      subject_alt_name:
+        description: Subject alternative names, like C(DNS:www.example.com).
+        type: list
+        elements: str
+      key_usage:
+        description: Key usages, like C(digitalSignature).
+        type: list
+        elements: str
+      extended_key_usage:
+        description: Extended key usages, like C(serverAuth).
+        type: list
+        elements: str
+      basic_constraints:
+        description: Basic constraints, like C(CA:FALSE).
+        type: list
+        elements: str
+      validity_days:
+        description: Validity of the certificate, defaults to O(validity_days).
+        type: int
+      key_type:
+        description: Type of a generated private key.
+        type: str
+        choices: ["rsa", "ec", "ed25519", "ed448"]
+        default: rsa
+      key_size:
+        description: Size of a generated RSA private key.
+        type: int
+        default: 4096
+      curve:
+        description: Curve of a generated EC private key.
+        type: str
+        default: secp384r1
+      private_key_content:
+        description: Existing private key, a new one is generated when neither this nor the file at O(certificates[].private_key_path) exists.
+        type: str
+      private_key_passphrase:
+        description:
+          - The passphrase of the existing private key.
+          - A generated private key is encrypted with it before it is written or returned.
+        type: str
+      private_key_path:
+        description: Path of the private key, read when it exists, written when the key is generated.
+        type: path
+      certificate_path:
+        description: Path of the certificate, read when it exists, written when the certificate is issued.
+        type: path
+      certificate_content:
+        description:
+          - Existing certificate, when it is not kept in a file, mutually exclusive with O(certificates[].certificate_path).
+          - It is only checked, the issued certificate is returned.
+        type: str
+      certificatefullchain_path:
+        description: Path of the certificate followed by the OwnCA certificate.
+        type: path
+      mode:
+        description: Permissions of the written files.
+        type: str
+        default: "0600"
+author:
+  - Arpan Mandal (mailto:arpan.rec@gmail.com)
+"""
+
+EXAMPLES = r"""
+- name: Issue the service certificates
+  arpanrec.nebula.ownca_certificates:
+    ca_certificate_path: /etc/pki/ownca/ca.crt
+    ca_private_key_path: /etc/pki/ownca/ca.key
+    validity_days: 90
+    certificates:
+      - name: api
+        subject:
+          commonName: api.example.com
+        subject_alt_name:
+          - DNS:api.example.com
+        extended_key_usage:
+          - serverAuth
+        private_key_path: /etc/pki/api.key
+        certificate_path: /etc/pki/api.crt
+        certificatefullchain_path: /etc/pki/api.fullchain.crt
+      - name: worker
+        key_type: ec
+        subject:
+          commonName: worker.example.com
+        extended_key_usage:
+          - clientAuth
+  register: service_certificates
+  no_log: true
+"""
+
+RETURN = r"""
+certificates:
+  description: Result of every specification, in order.
+  type: list
+  elements: dict
+  returned: always
+  contains:
+    name:
+      description: Name of the certificate.
+      type: str
+    changed:
+      description: Whether the certificate was issued.
+      type: bool
+    reasons:
+      description: Why the certificate was issued.
+      type: list
+      elements: str
+    certificate:
+      description: The issued or kept certificate, when O(certificates[].certificate_path) is not set.
+      type: str
+    private_key:
+      description: The generated private key, when O(certificates[].private_key_path) is not set.
+      type: str
+"""
+
+CERTIFICATE_SPEC = {
+    "name": {"type": "str", "required": True},
+    "subject": {"type": "dict", "required": False},
+    "subject_alt_name": {"type": "list", "elements": "str", "required": False},
+    "key_usage": {"type": "list", "elements": "str", "required": False},
+    "extended_key_usage": {"type": "list", "elements": "str", "required": False},
+    "basic_constraints": {"type": "list", "elements": "str", "required": False},
+    "validity_days": {"type": "int", "required": False},
+    "key_type": {"type": "str", "required": False, "default": "rsa", "choices": ["rsa", "ec", "ed25519", "ed448"]},
+    "key_size": {"type": "int", "required": False, "default": 4096},
+    "curve": {"type": "str", "required": False, "default": "secp384r1"},
+    "private_key_content": {"type": "str", "required": False, "no_log": True},
+    "private_key_passphrase": {"type": "str", "required": False, "no_log": True},
+    "private_key_path": {"type": "path", "required": False},
+    "certificate_path": {"type": "path", "required": False},
+    "certificate_content": {"type": "str", "required": False},
+    "certificatefullchain_path": {"type": "path", "required": False},
+    "mode": {"type": "str", "required": False, "default": "0600"},
+}
+
+_EXTENSION_KEYS = ("key_usage", "extended_key_usage", "subject_alt_name", "subject", "basic_constraints")
+
+
+def _read_file(path: str) -> str:
+    """
+    Content of `path`, None when it does not exist.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def _write_file(path: str, content: str, mode: str) -> None:
+    """
+    Writes `content` to a temporary file next to `path` and renames it over `path`.
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.chmod(temp_path, int(mode, 8))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def issue_certificates(
+    certificates: list,
+    ca_certificate_content: str,
+    ca_private_key_content: str,
+    ca_private_key_passphrase: str = None,
+    validity_days: int = 7,
+    workers: int = None,
+    force: bool = False,
+) -> dict:
+    """
+    Issues every certificate of `certificates` from the OwnCA.
+
+    Parameters:
+        certificates (list): Specifications of the certificates, see `CERTIFICATE_SPEC`.
+        ca_certificate_content (str): The OwnCA certificate.
+        ca_private_key_content (str): The OwnCA private key.
+        ca_private_key_passphrase (str): The passphrase of the OwnCA private key.
+        validity_days (int): Default validity of the certificates, in days.
+        workers (int): Number of processes generating private keys.
+        force (bool): Issue every certificate again.
+
+    Returns:
+        dict: A dictionary with `changed` and `certificates`, or `error`.
+    """
+    ca_certificate = load_certificate(ca_certificate_content)
+    ca_private_key = load_private_key(ca_private_key_content, ca_private_key_passphrase)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    results = []
+    to_issue = []
+    to_generate = []
+    for spec in certificates:
+        spec_validity_days = spec["validity_days"] or validity_days
+        if not_valid_after(ca_certificate) < now + datetime.timedelta(days=spec_validity_days):
+            return {"error": f"Expected validity of {spec['name']} should not cross CA"}
+
+        private_key_pem = spec["private_key_content"] or _read_file(spec["private_key_path"])
+        result = {"name": spec["name"], "changed": False, "reasons": []}
+        results.append(result)
+
+        if private_key_pem and not force:
+            certificate_content = spec["certificate_content"] or _read_file(spec["certificate_path"])
+            check = renewal_reasons(
+                certificate_content=certificate_content,
+                ca_certificate_content=ca_certificate_content,
+                private_key_content=private_key_pem,
+                private_key_passphrase=spec["private_key_passphrase"],
+                validity_days=spec_validity_days,
+                **{key: spec[key] for key in _EXTENSION_KEYS},
+            )
+            if not check["needs_renewal"]:
+                if not spec["certificate_path"]:
+                    result["certificate"] = certificate_content
+                continue
+            result["reasons"] = check["reasons"]
+        elif not private_key_pem:
+            result["reasons"] = ["Private Key Not Present"]
+            to_generate.append(len(to_issue))
+        else:
+            result["reasons"] = ["Forced"]
+
+        to_issue.append((spec, result, private_key_pem, spec_validity_days))
+
+    if to_generate:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = {
+                index: executor.submit(
+                    generate_private_key_pem, to_issue[index][0]["key_type"], to_issue[index][0]["key_size"], to_issue[index][0]["curve"]
+                )
+                for index in to_generate
+            }
+            for index, future in futures.items():
+                spec, result, _, spec_validity_days = to_issue[index]
+                to_issue[index] = (spec, result, future.result(), spec_validity_days)
+
+    for spec, result, private_key_pem, spec_validity_days in to_issue:
+        generated = "Private Key Not Present" in result["reasons"]
+        private_key = load_private_key(private_key_pem, None if generated else spec["private_key_passphrase"])
+        if generated and spec["private_key_passphrase"]:
+            private_key_pem = private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.BestAvailableEncryption(spec["private_key_passphrase"].encode("utf-8")),
+            ).decode("ascii")
+        certificate_pem = (
+            sign_certificate(
+                private_key,
+                ca_certificate,
+                ca_private_key,
+                validity_days=spec_validity_days,
+                **{key: spec[key] for key in _EXTENSION_KEYS},
+            )
+            .public_bytes(serialization.Encoding.PEM)
+            .decode("ascii")
+        )
+        result["changed"] = True
+
+        if generated:
+            if spec["private_key_path"]:
+                _write_file(spec["private_key_path"], private_key_pem, spec["mode"])
+            else:
+                result["private_key"] = private_key_pem
+
+        if spec["certificate_path"]:
+            _write_file(spec["certificate_path"], certificate_pem, spec["mode"])
+        else:
+            result["certificate"] = certificate_pem
+
+        if spec["certificatefullchain_path"]:
+            _write_file(spec["certificatefullchain_path"], certificate_pem + ca_certificate_content.strip() + "\n", spec["mode"])
+
+    return {"changed": any(result["changed"] for result in results), "certificates": results}
+
+
+def run_module():
+    """
+    Ansible main module
+    """
+    module_args = {
+        "ca_certificate_content": {"type": "str", "required": False},
+        "ca_certificate_path": {"type": "path", "required": False},
+        "ca_private_key_content": {"type": "str", "required": False, "no_log": True},
+        "ca_private_key_path": {"type": "path", "required": False},
+        "ca_private_key_passphrase": {"type": "str", "required": False, "no_log": True},
+        "validity_days": {"type": "int", "required": False, "default": 7},
+        "workers": {"type": "int", "required": False},
+        "force": {"type": "bool", "required": False, "default": False},
+        "certificates": {
+            "type": "list",
+            "elements": "dict",
+            "required": True,
+            "options": CERTIFICATE_SPEC,
+            "mutually_exclusive": [["certificate_content", "certificate_path"]],
+        },
+    }
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        mutually_exclusive=[
+            ["ca_certificate_content", "ca_certificate_path"],
+            ["ca_private_key_content", "ca_private_key_path"],
+        ],
+        required_one_of=[
+            ["ca_certificate_content", "ca_certificate_path"],
+            ["ca_private_key_content", "ca_private_key_path"],
+        ],
+        supports_check_mode=False,
+    )
+
+    ca_certificate_content = module.params["ca_certificate_content"] or _read_file(module.params["ca_certificate_path"])
+    ca_private_key_content = module.params["ca_private_key_content"] or _read_file(module.params["ca_private_key_path"])
+    if not ca_certificate_content or not ca_private_key_content:
+        module.fail_json(msg="OwnCA certificate or private key not found")
+
+    try:
+        result = issue_certificates(
+            certificates=module.params["certificates"],
+            ca_certificate_content=ca_certificate_content,
+            ca_private_key_content=ca_private_key_content,
+            ca_private_key_passphrase=module.params["ca_private_key_passphrase"],
+            validity_days=module.params["validity_days"],
+            workers=module.params["workers"],
+            force=module.params["force"],
+        )
+    except (ValueError, TypeError, OSError) as ex:
+        module.fail_json(msg=f"Unable to issue the certificates: {ex}")
+
+    if "error" in result:
+        module.fail_json(msg=result["error"])
+
+    module.exit_json(**result)
+
+
+def main():
+    """
+    Python Main Module
+    """
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+This module provides a run scoped store for SSH private keys.
+
+Keys are written to a directory on tmpfs, named by the SHA-256 hash of their content, so the same key is written once
+and reused by every later run instead of piling up a new file per host per run. The store directory must be a real directory
+owned by the user with mode 0700, and `state: absent` removes only the key files of the store, then the directory when it is empty.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+# Copyright: (c) 2022, Arpan Mandal <arpan.rec@gmail.com>
+# MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import os
+import re
+import stat
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+
+DOCUMENTATION = r"""
+---
+module: ssh_key_store
+
+short_description: Store SSH private keys on tmpfs, keyed by content hash
+
+version_added: "5.0.0"
+
+description:
+  - Writes SSH private keys to a directory readable only by the owner, preferably on tmpfs.
+  - Every key is named by the SHA-256 hash of its content, a key already in the store is not written again.
+  - The store directory must not be a symlink, and must be owned by the user running the module with mode C(0700).
+  - Removes the key files of the store with O(state=absent), and the directory when nothing else is left in it,
+    run it at the end of the last play using the keys.
+
+options:
+  keys:
+    description:
+      - Mapping of a name, usually the inventory hostname, to the private key content.
+      - Names sharing the same key share the same file.
+    required: false
+    type: dict
+    default: {}
+  store_dir:
+    description:
+      - Directory of the store.
+      - Defaults to C($XDG_RUNTIME_DIR/nebula-ssh-keys), or C(/dev/shm/nebula-ssh-keys-<uid>),
+        or C(~/.ssh/nebula-ssh-keys) when there is no tmpfs.
+    required: false
+    type: path
+  state:
+    description: Write the keys, or remove the key files of the store.
+    required: false
+    type: str
+    choices: ["present", "absent"]
+    default: present
+author:
+  - Arpan Mandal (mailto:arpan.rec@gmail.com)
+"""
+
+EXAMPLES = r"""
+- name: Store the keys of the hosts
+  arpanrec.nebula.ssh_key_store:
+    keys:
+      web1: "{{ web1_private_key }}"
+      web2: "{{ web2_private_key }}"
+  register: ssh_keys
+  no_log: true
+
+- name: Use the key
+  ansible.builtin.add_host:
+    hostname: web1
+    ansible_ssh_private_key_file: "{{ ssh_keys.paths.web1 }}"
+
+- name: Remove the store at the end of the play
+  arpanrec.nebula.ssh_key_store:
+    state: absent
+"""
+
+RETURN = r"""
+store_dir:
+  description: Directory of the store
+  type: str
+  returned: always
+paths:
+  description: Mapping of every name in O(keys) to the path of its key file
+  type: dict
+  returned: if state == present
+"""
+
+
+_KEY_FILE_NAME = re.compile(r"^[0-9a-f]{64}$")
+_TEMP_FILE_PREFIX = ".nebula-ssh-key-"
+
+
+def default_store_dir() -> str:
+    """
+    Directory of the store when not given, a dedicated directory on tmpfs when the system has one.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "nebula-ssh-keys")
+    if os.path.isdir("/dev/shm"):
+        return f"/dev/shm/nebula-ssh-keys-{os.getuid()}"
+    return os.path.join(os.path.expanduser("~"), ".ssh", "nebula-ssh-keys")
+
+
+def check_store_dir(store_dir: str) -> bool:
+    """
+    Checks that the store is a directory owned by the current user with mode 0700, and not a symlink.
+
+    Returns:
+        bool: False when the store does not exist.
+
+    Raises:
+        ValueError: When the store exists but can not be trusted.
+    """
+    try:
+        store_stat = os.lstat(store_dir)
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(store_stat.st_mode) or not stat.S_ISDIR(store_stat.st_mode):
+        raise ValueError(f"{store_dir} is not a directory, or is a symlink")
+    if store_stat.st_uid != os.getuid():
+        raise ValueError(f"{store_dir} is not owned by the current user")
+    if stat.S_IMODE(store_stat.st_mode) != 0o700:
+        raise ValueError(f"{store_dir} has mode {oct(stat.S_IMODE(store_stat.st_mode))}, expected 0o700")
+    return True
+
+
+def store_keys(keys: dict = None, store_dir: str = None, state: str = "present") -> dict:
+    """
+    Writes the keys to the store, or removes the key files of the store.
+
+    Parameters:
+        keys (dict): Mapping of a name to the private key content.
+        store_dir (str): Directory of the store, see `default_store_dir`.
+        state (str): `present` to write the keys, `absent` to remove the key files of the store.
+
+    Returns:
+        dict: A dictionary with `changed`, `store_dir` and, when present, `paths`.
+    """
+    store_dir = store_dir or default_store_dir()
+    result = {"changed": False, "store_dir": store_dir}
+
+    if state == "absent":
+        if not check_store_dir(store_dir):
+            return result
+        for file_name in os.listdir(store_dir):
+            file_path = os.path.join(store_dir, file_name)
+            if (_KEY_FILE_NAME.match(file_name) or file_name.startswith(_TEMP_FILE_PREFIX)) and stat.S_ISREG(os.lstat(file_path).st_mode):
+                os.remove(file_path)
+                result["changed"] = True
+        if not os.listdir(store_dir):
+            os.rmdir(store_dir)
+            result["changed"] = True
+        return result
+
+    if not check_store_dir(store_dir):
+        os.makedirs(os.path.dirname(os.path.abspath(store_dir)), mode=0o700, exist_ok=True)
+        os.mkdir(store_dir, mode=0o700)
+        os.chmod(store_dir, 0o700)
+        check_store_dir(store_dir)
+        result["changed"] = True
+
+    result["paths"] = {}
+    for name, key_content in (keys or {}).items():
+        if not key_content.endswith("\n"):
+            key_content += "\n"
+        key_path = os.path.join(store_dir, hashlib.sha256(key_content.encode("utf-8")).hexdigest())
+        if os.path.lexists(key_path) and not stat.S_ISREG(os.lstat(key_path).st_mode):
+            raise ValueError(f"{key_path} is not a regular file")
+        if not os.path.lexists(key_path):
+            file_descriptor, temp_path = tempfile.mkstemp(dir=store_dir, prefix=_TEMP_FILE_PREFIX)
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as key_file:
+                key_file.write(key_content)
+            os.replace(temp_path, key_path)
+            result["changed"] = True
+        result["paths"][name] = key_path
+    return result
+
+
+def run_module():
+    """
+    Ansible main module
+    """
+    module_args = {
+        "keys": {"type": "dict", "required": False, "default": {}, "no_log": True},
+        "store_dir": {"type": "path", "required": False},
+        "state": {"type": "str", "required": False, "default": "present", "choices": ["present", "absent"]},
+    }
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=False)
+
+    try:
+        result = store_keys(keys=module.params["keys"], store_dir=module.params["store_dir"], state=module.params["state"])
+    except (OSError, ValueError) as ex:
+        module.fail_json(msg=f"Unable to update the ssh key store: {ex}")
+
+    module.exit_json(**result)
+
+
+def main():
+    """
+    Python Main Module
+    """
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
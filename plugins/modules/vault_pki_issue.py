@@ -0,0 +1,299 @@
+"""
+This module issues a certificate from the HashiCorp Vault PKI secrets engine, only when it is needed.
+
+The existing certificate on the target is checked first, a new certificate is issued only when there is none,
+when it does not match the private key, when its names changed, or when it expires within the renewal window.
+The private key and the certificate followed by its chain are then written atomically.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+# Copyright: (c) 2022, Arpan Mandal <arpan.rec@gmail.com>
+# MIT (see LICENSE or https://en.wikipedia.org/wiki/MIT_License)
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import os
+import tempfile
+
+import requests
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import (
+    TIME_FORMAT,
+    certificate_spec,
+    load_certificate,
+    load_private_key,
+    normalize_subject_alt_name,
+    not_valid_after,
+)
+from cryptography.hazmat.primitives import serialization
+from cryptography.x509.oid import NameOID
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+
+DOCUMENTATION = r"""
+---
+module: vault_pki_issue
+
+short_description: Issue a certificate from the Vault PKI secrets engine when it is needed
+
+version_added: "5.0.0"
+
+description:
+  - Reads the existing certificate and private key on the target.
+  - Issues a new certificate only when one of them is missing or invalid, when they do not match,
+    when the common name or the alternative names changed, or when the certificate expires within O(renew_before_days).
+  - Writes the private key and the certificate followed by the CA chain atomically.
+  - The certificate is replaced before the private key, and put back when replacing the key fails,
+    a crash between the two leaves a mismatched pair which the next run replaces.
+
+options:
+  url:
+    description: The Vault PKI issue endpoint, like C(https://vault.example.com:8200/v1/pki/issue/server).
+    required: true
+    type: str
+  token:
+    description: Vault token.
+    required: true
+    type: str
+  validate_certs:
+    description: Verify the TLS connection to Vault.
+    required: false
+    type: bool
+    default: true
+  common_name:
+    description: Common name of the certificate.
+    required: true
+    type: str
+  alt_names:
+    description: Alternative DNS names, the common name is always added.
+    required: false
+    type: list
+    elements: str
+    default: []
+  ttl:
+    description: Requested time to live of the certificate, like C(720h), the default of the Vault role when not set.
+    required: false
+    type: str
+  renew_before_days:
+    description: Issue a new certificate when the existing one expires within this many days.
+    required: false
+    type: int
+    default: 7
+  key_path:
+    description: Path of the private key.
+    required: true
+    type: path
+  cert_path:
+    description: Path of the certificate, followed by the CA chain.
+    required: true
+    type: path
+  owner:
+    description: Owner of the private key and the certificate.
+    required: false
+    type: str
+  force:
+    description: Issue a new certificate even if the existing one is still valid.
+    required: false
+    type: bool
+    default: false
+author:
+  - Arpan Mandal (mailto:arpan.rec@gmail.com)
+"""
+
+EXAMPLES = r"""
+- name: Issue the server certificate
+  arpanrec.nebula.vault_pki_issue:
+    url: https://vault.example.com:8200/v1/pki/issue/server
+    token: "{{ vault_token }}"
+    common_name: www.example.com
+    alt_names:
+      - example.com
+    renew_before_days: 10
+    key_path: /etc/ssl/private/server.key
+    cert_path: /etc/ssl/certs/server.crt
+"""
+
+RETURN = r"""
+reasons:
+  description: Why a new certificate was issued, empty when the existing one is kept.
+  type: list
+  elements: str
+  returned: always
+not_after:
+  description: End of the validity of the certificate, C(YYYYMMDDHHMMSSZ) in UTC.
+  type: str
+  returned: when a certificate exists or was issued
+"""
+
+
+def _read_file(path: str) -> str:
+    """
+    Content of `path`, None when it does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def _temp_file(path: str, content: str) -> str:
+    """
+    Writes `content` to a new file readable only by the owner, next to `path`, and returns its path.
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+        file.write(content)
+    return temp_path
+
+
+def write_pair(key_path: str, key_content: str, cert_path: str, cert_content: str) -> None:
+    """
+    Writes a new private key and certificate, each atomically.
+
+    Both are first written to temporary files next to their paths, then the certificate is replaced, then the key.
+    When replacing the key fails the previous certificate is put back, so the pair on disk is either the old one or the new one,
+    except after a crash between the two replaces, where the mismatch is found and a new certificate issued on the next run.
+    The temporary files are removed on any failure.
+    """
+    previous_cert_content = _read_file(cert_path)
+    temp_paths = []
+    try:
+        temp_paths.append(_temp_file(key_path, key_content))
+        temp_paths.append(_temp_file(cert_path, cert_content))
+        key_temp_path, cert_temp_path = temp_paths
+        os.replace(cert_temp_path, cert_path)
+        try:
+            os.replace(key_temp_path, key_path)
+        except OSError:
+            if previous_cert_content is not None:
+                temp_paths.append(_temp_file(cert_path, previous_cert_content))
+                os.replace(temp_paths[-1], cert_path)
+            raise
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def check_existing(key_path: str, cert_path: str, common_name: str, alt_names: list, renew_before_days: int) -> dict:
+    """
+    Checks the existing private key and certificate.
+
+    Returns:
+        dict: `reasons` why a new certificate is needed, and `not_after` of the existing certificate.
+    """
+    certificate_content = _read_file(cert_path)
+    private_key_content = _read_file(key_path)
+    if not certificate_content or not private_key_content:
+        return {"reasons": ["Certificate or Private Key Not Present"]}
+
+    try:
+        certificate = load_certificate(certificate_content)
+        private_key = load_private_key(private_key_content)
+    except ValueError:
+        return {"reasons": ["Existing Certificate or Private Key is Invalid"]}
+
+    reasons = []
+    public_key_format = (serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    if private_key.public_key().public_bytes(*public_key_format) != certificate.public_key().public_bytes(*public_key_format):
+        reasons.append("Private Key Mismatch")
+
+    common_names = [attribute.value for attribute in certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)]
+    if common_names != [common_name]:
+        reasons.append("Common Name Mismatch")
+
+    expected_names = normalize_subject_alt_name([f"DNS:{name}" for name in [common_name] + alt_names])
+    if certificate_spec(certificate)["subject_alt_name"] != expected_names:
+        reasons.append("SAN Mismatch")
+
+    expires_at = not_valid_after(certificate)
+    if expires_at < datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=renew_before_days):
+        reasons.append("Certificate Expires Within Renewal Window")
+
+    return {"reasons": reasons, "not_after": expires_at.strftime(TIME_FORMAT)}
+
+
+def issue(url: str, token: str, validate_certs: bool, common_name: str, alt_names: list, ttl: str = None) -> dict:
+    """
+    Issues a certificate from the Vault PKI issue endpoint.
+
+    Returns:
+        dict: The `data` of the Vault response, with `private_key`, `certificate` and `ca_chain`.
+    """
+    body = {"common_name": common_name, "alt_names": ",".join(alt_names)}
+    if ttl:
+        body["ttl"] = ttl
+    response = requests.post(
+        url,
+        headers={"X-Vault-Token": token, "Content-Type": "application/json"},
+        json=body,
+        verify=validate_certs,
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["data"]
+
+
+def run_module():
+    """
+    Ansible main module
+    """
+    module_args = {
+        "url": {"type": "str", "required": True},
+        "token": {"type": "str", "required": True, "no_log": True},
+        "validate_certs": {"type": "bool", "required": False, "default": True},
+        "common_name": {"type": "str", "required": True},
+        "alt_names": {"type": "list", "elements": "str", "required": False, "default": []},
+        "ttl": {"type": "str", "required": False},
+        "renew_before_days": {"type": "int", "required": False, "default": 7},
+        "key_path": {"type": "path", "required": True},
+        "cert_path": {"type": "path", "required": True},
+        "owner": {"type": "str", "required": False},
+        "force": {"type": "bool", "required": False, "default": False},
+    }
+
+    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+    params = module.params
+
+    result = check_existing(params["key_path"], params["cert_path"], params["common_name"], params["alt_names"], params["renew_before_days"])
+    if params["force"]:
+        result["reasons"].append("Forced")
+    result["changed"] = len(result["reasons"]) > 0
+
+    if result["changed"] and not module.check_mode:
+        try:
+            data = issue(params["url"], params["token"], params["validate_certs"], params["common_name"], params["alt_names"], params["ttl"])
+        except (requests.RequestException, KeyError, ValueError) as ex:
+            module.fail_json(msg=f"Unable to issue the certificate from vault: {ex}", **result)
+
+        chain = data.get("ca_chain") or [data.get("issuing_ca", "")]
+        certificate_content = "\n".join(item.strip() for item in [data["certificate"]] + chain if item) + "\n"
+        try:
+            write_pair(params["key_path"], data["private_key"].strip() + "\n", params["cert_path"], certificate_content)
+        except OSError as ex:
+            module.fail_json(msg=f"Unable to write the certificate and private key: {ex}", **result)
+        result["not_after"] = not_valid_after(load_certificate(certificate_content)).strftime(TIME_FORMAT)
+
+    if params["owner"] and not module.check_mode:
+        for path in (params["key_path"], params["cert_path"]):
+            if os.path.exists(path):
+                result["changed"] = module.set_owner_if_different(path, params["owner"], result["changed"])
+
+    module.exit_json(**result)
+
+
+def main():
+    """
+    Python Main Module
+    """
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+This module provides the host variables of the `vault_inv` inventory when it runs with `lazy_vars`.
+
+The inventory only lists the hosts, the secret of a host is read from the HashiCorp Vault KV engine
+the first time Ansible asks for the variables of that host, and kept for the rest of the run.
+
+This module is part of the arpanrec.nebula collection.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from ansible.inventory.host import Host
+from ansible.plugins.vars import BaseVarsPlugin
+from ansible_collections.arpanrec.nebula.plugins.module_utils.hashicorp_vault_core import read_lazy_host
+
+# pylint: disable=C0103
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+  name: vault_inv_vars
+  short_description: Lazy host variables for the vault_inv inventory.
+  requirements:
+      - python >= 3
+      - hvac >= 1.0.2
+      - Enabled in configuration, see O(vars_plugins_enabled)
+  description:
+    - Reads the host variables of hosts added by the P(arpanrec.nebula.vault_inv#inventory) inventory with O(lazy_vars).
+    - The secret of a host is read the first time its variables are requested, and kept for the rest of the run.
+    - Hosts from other inventories are ignored.
+  extends_documentation_fragment:
+    - vars_plugin_staging
+"""
+
+EXAMPLES = """
+# ansible.cfg
+# [defaults]
+# vars_plugins_enabled = ansible.builtin.host_group_vars,arpanrec.nebula.vault_inv_vars
+"""
+
+
+class VarsModule(BaseVarsPlugin):
+    """
+    Vars plugin returning the lazily read vault secret of the requested hosts.
+    """
+
+    def get_vars(self, loader, path, entities):
+        """
+        Returns the secret data of every host in `entities` registered by the `vault_inv` inventory.
+        """
+        super(VarsModule, self).get_vars(loader, path, entities)
+        if not isinstance(entities, list):
+            entities = [entities]
+
+        data = {}
+        for entity in entities:
+            if isinstance(entity, Host):
+                data.update(read_lazy_host(entity.name) or {})
+        return data
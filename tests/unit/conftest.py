@@ -0,0 +1,34 @@
+"""
+Makes the collection importable as `ansible_collections.arpanrec.nebula` when the unit tests run with plain pytest
+from a checkout, ansible-test already does it when the checkout is inside an `ansible_collections` tree.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import os
+import shutil
+import tempfile
+
+_COLLECTIONS_DIR = None
+
+try:
+    import ansible_collections.arpanrec.nebula  # noqa: F401 pylint: disable=unused-import
+except ImportError:
+    from ansible.utils.collection_loader._collection_finder import _AnsibleCollectionFinder
+
+    _COLLECTIONS_DIR = tempfile.mkdtemp(prefix="nebula-collections-")
+    os.makedirs(os.path.join(_COLLECTIONS_DIR, "ansible_collections", "arpanrec"))
+    os.symlink(
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")),
+        os.path.join(_COLLECTIONS_DIR, "ansible_collections", "arpanrec", "nebula"),
+    )
+    _AnsibleCollectionFinder(paths=[_COLLECTIONS_DIR])._install()  # pylint: disable=protected-access
+
+
+def pytest_unconfigure(config):  # pylint: disable=unused-argument
+    """
+    Removes the temporary collections directory.
+    """
+    if _COLLECTIONS_DIR:
+        shutil.rmtree(_COLLECTIONS_DIR, ignore_errors=True)
@@ -0,0 +1,53 @@
+"""
+Unit tests of the vault_inv inventory plugin, populating an inventory from walked trees.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import pytest
+from ansible.errors import AnsibleParserError
+from ansible.inventory.data import InventoryData
+from ansible_collections.arpanrec.nebula.plugins.inventory.vault_inv import VaultInventoryModule
+
+
+def _plugin() -> VaultInventoryModule:
+    plugin = VaultInventoryModule()
+    plugin.inventory = InventoryData()
+    return plugin
+
+
+def test_populate_hosts_and_groups():
+    plugin = _plugin()
+    plugin._populate(  # pylint: disable=protected-access
+        {
+            "folders": ["prod", "prod/db"],
+            "leaves": {
+                "web1": {"data": {"ansible_host": "10.0.0.1"}, "version": 1},
+                "prod/db/db1": {"data": {"ansible_host": "10.0.1.1"}, "version": 1},
+                "prod/app1": None,
+            },
+        }
+    )
+
+    inventory = plugin.inventory
+    assert sorted(inventory.hosts) == ["app1", "db1", "web1"]
+    assert inventory.hosts["db1"].vars["ansible_host"] == "10.0.1.1"
+    assert [group.name for group in inventory.groups["prod"].child_groups] == ["db"]
+    assert [host.name for host in inventory.groups["db"].hosts] == ["db1"]
+    assert [host.name for host in inventory.groups["prod"].hosts] == ["app1"]
+
+
+def test_populate_refuses_duplicate_host_names():
+    plugin = _plugin()
+
+    with pytest.raises(AnsibleParserError, match="prod/db1 and dev/db1"):
+        plugin._populate(  # pylint: disable=protected-access
+            {
+                "folders": ["prod", "dev"],
+                "leaves": {
+                    "prod/db1": {"data": {"ansible_host": "10.0.1.1"}, "version": 1},
+                    "dev/db1": {"data": {"ansible_host": "10.0.2.1"}, "version": 1},
+                },
+            }
+        )
@@ -0,0 +1,56 @@
+"""
+Unit tests of the GitHub secret ledger helpers.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import os
+import stat
+
+from ansible_collections.arpanrec.nebula.plugins.module_utils.github_core import read_ledger, secret_digest, write_ledger
+
+
+def test_secret_digest_is_stable_hex_sha256():
+    digest = secret_digest("key", "repos/me/repo", "TOKEN", "value")
+
+    assert digest == secret_digest("key", "repos/me/repo", "TOKEN", "value")
+    assert len(digest) == 64
+    assert set(digest) <= set("0123456789abcdef")
+
+
+def test_secret_digest_is_bound_to_key_scope_name_and_value():
+    digest = secret_digest("key", "repos/me/repo", "TOKEN", "value")
+
+    assert digest != secret_digest("other", "repos/me/repo", "TOKEN", "value")
+    assert digest != secret_digest("key", "orgs/me", "TOKEN", "value")
+    assert digest != secret_digest("key", "repos/me/repo", "OTHER", "value")
+    assert digest != secret_digest("key", "repos/me/repo", "TOKEN", "other")
+
+
+def test_write_ledger_round_trip(tmp_path):
+    ledger_path = str(tmp_path / "cache" / "ledger.json")
+    ledger = {"repos/me/repo/TOKEN": {"digest": "ab" * 32, "updated_at": "2024-01-01T00:00:00Z"}}
+
+    write_ledger(ledger_path, ledger)
+
+    assert read_ledger(ledger_path) == ledger
+    assert stat.S_IMODE(os.stat(ledger_path).st_mode) == 0o600
+    assert os.listdir(tmp_path / "cache") == ["ledger.json"]
+
+
+def test_write_ledger_replaces_existing(tmp_path):
+    ledger_path = str(tmp_path / "ledger.json")
+    write_ledger(ledger_path, {"a": {"digest": "1"}})
+
+    write_ledger(ledger_path, {"b": {"digest": "2"}})
+
+    assert read_ledger(ledger_path) == {"b": {"digest": "2"}}
+
+
+def test_read_ledger_missing_or_corrupt_is_empty(tmp_path):
+    corrupt_path = tmp_path / "corrupt.json"
+    corrupt_path.write_text("{not json", encoding="utf-8")
+
+    assert read_ledger(str(tmp_path / "missing.json")) == {}
+    assert read_ledger(str(corrupt_path)) == {}
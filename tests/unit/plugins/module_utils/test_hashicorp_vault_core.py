@@ -0,0 +1,284 @@
+"""
+Unit tests of the HashiCorp Vault KV v2 helpers, against an in memory fake of the hvac KV v2 API.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import gzip
+import json
+import threading
+
+import hvac
+from ansible_collections.arpanrec.nebula.plugins.module_utils.hashicorp_vault_core import (
+    authenticate,
+    read_lazy_host,
+    read_secrets,
+    read_snapshot,
+    register_lazy_host,
+    shard_of,
+    walk_kv_tree,
+    write_snapshot,
+)
+
+
+class FakeKvV2:
+    """
+    The `secrets.kv.v2` methods of an hvac client used by the walker, over a dict of path to data and version.
+    """
+
+    def __init__(self, secrets: dict):
+        self.secrets = secrets
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, path: str, mount_point: str) -> None:
+        assert mount_point == "secret"
+        with self._lock:
+            self.calls.append((method, path))
+
+    def list_secrets(self, path, mount_point):
+        self._call("list", path, mount_point)
+        prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+        keys = set()
+        for secret_path in self.secrets:
+            if secret_path.startswith(prefix):
+                head, slash, _ = secret_path[len(prefix) :].partition("/")
+                keys.add(head + slash)
+        if not keys:
+            raise hvac.exceptions.InvalidPath()
+        return {"data": {"keys": sorted(keys)}}
+
+    def read_secret_version(self, path, mount_point, raise_on_deleted_version=True):
+        self._call("read", path, mount_point)
+        data, version = self.secrets[path]
+        if data is None:
+            # a deleted latest version, vault answers 404 with the metadata
+            body = {"data": {"data": None, "metadata": {"version": version, "deletion_time": "2024-01-01T00:00:00Z", "destroyed": False}}}
+            if raise_on_deleted_version:
+                raise hvac.exceptions.InvalidPath(json=body)
+            return body
+        return {"data": {"data": data, "metadata": {"version": version, "deletion_time": "", "destroyed": False}}}
+
+    def read_secret_metadata(self, path, mount_point):
+        self._call("metadata", path, mount_point)
+        data, version = self.secrets[path]
+        deletion_time = "2024-01-01T00:00:00Z" if data is None else ""
+        return {"data": {"current_version": version, "versions": {str(version): {"deletion_time": deletion_time, "destroyed": False}}}}
+
+
+class FakeClient:
+    """
+    An hvac client with only the KV v2 engine.
+    """
+
+    def __init__(self, secrets: dict):
+        self.kv_v2 = FakeKvV2(secrets)
+        self.secrets = type("Secrets", (), {"kv": type("Kv", (), {"v2": self.kv_v2})})
+
+
+SECRETS = {
+    "ansible/inventory/web1": ({"ansible_host": "10.0.0.1"}, 1),
+    "ansible/inventory/web2": ({"ansible_host": "10.0.0.2"}, 3),
+    "ansible/inventory/db/db1": ({"ansible_host": "10.0.1.1"}, 2),
+    "ansible/other": ({}, 1),
+}
+
+
+def test_walk_kv_tree_lists_and_reads_every_leaf():
+    client = FakeClient(SECRETS)
+    tree = walk_kv_tree(client, path="/ansible/inventory/", concurrency=4)
+
+    assert tree["folders"] == ["db"]
+    assert tree["leaves"] == {
+        "web1": {"data": {"ansible_host": "10.0.0.1"}, "version": 1},
+        "web2": {"data": {"ansible_host": "10.0.0.2"}, "version": 3},
+        "db/db1": {"data": {"ansible_host": "10.0.1.1"}, "version": 2},
+    }
+    assert set(tree["timings"]) == {"list", "read"}
+
+
+def test_walk_kv_tree_without_read_only_lists():
+    client = FakeClient(SECRETS)
+    tree = walk_kv_tree(client, path="ansible/inventory", read=False)
+
+    assert tree["leaves"] == {"web1": None, "web2": None, "db/db1": None}
+    assert {method for method, _ in client.kv_v2.calls} == {"list"}
+
+
+def test_walk_kv_tree_reads_again_only_changed_versions():
+    known = walk_kv_tree(FakeClient(SECRETS), path="ansible/inventory")["leaves"]
+    changed = dict(SECRETS, **{"ansible/inventory/web2": ({"ansible_host": "10.0.0.20"}, 4)})
+    client = FakeClient(changed)
+
+    tree = walk_kv_tree(client, path="ansible/inventory", known=known)
+
+    reads = [path for method, path in client.kv_v2.calls if method == "read"]
+    assert reads == ["ansible/inventory/web2"]
+    assert tree["leaves"]["web2"] == {"data": {"ansible_host": "10.0.0.20"}, "version": 4}
+    assert tree["leaves"]["web1"] == known["web1"]
+
+
+def test_walk_kv_tree_select_drops_leaves_before_reading():
+    client = FakeClient(SECRETS)
+    tree = walk_kv_tree(client, path="ansible/inventory", select=lambda leaf: leaf.startswith("web"))
+
+    assert sorted(tree["leaves"]) == ["web1", "web2"]
+    assert "ansible/inventory/db/db1" not in [path for method, path in client.kv_v2.calls if method == "read"]
+
+
+def test_walk_kv_tree_missing_path_is_empty():
+    tree = walk_kv_tree(FakeClient(SECRETS), path="nothing/here")
+
+    assert tree["leaves"] == {}
+    assert tree["folders"] == []
+
+
+def test_walk_kv_tree_skips_deleted_leaves():
+    deleted = dict(SECRETS, **{"ansible/inventory/old": (None, 2)})
+    tree = walk_kv_tree(FakeClient(deleted), path="ansible/inventory")
+
+    assert sorted(tree["leaves"]) == ["db/db1", "web1", "web2"]
+
+
+def test_walk_kv_tree_drops_known_leaf_deleted_since():
+    known = walk_kv_tree(FakeClient(SECRETS), path="ansible/inventory")["leaves"]
+    deleted = dict(SECRETS, **{"ansible/inventory/web2": (None, 3)})
+
+    tree = walk_kv_tree(FakeClient(deleted), path="ansible/inventory", known=known)
+
+    assert sorted(tree["leaves"]) == ["db/db1", "web1"]
+
+
+def test_read_secrets_deleted_secret_is_empty():
+    deleted = dict(SECRETS, **{"ansible/inventory/old": (None, 2)})
+
+    assert read_secrets(FakeClient(deleted), "secret", ["ansible/inventory/old", "ansible/inventory/web1"]) == [
+        {},
+        {"ansible_host": "10.0.0.1"},
+    ]
+
+
+def test_read_lazy_host_deleted_secret_is_empty():
+    register_lazy_host("old", FakeClient({"ansible/inventory/old": (None, 2)}), "secret", "ansible/inventory/old")
+
+    assert read_lazy_host("old") == {}
+
+
+def test_read_secrets_reads_a_repeated_path_once():
+    client = FakeClient(SECRETS)
+    secrets = read_secrets(client, "secret", ["ansible/inventory/web1", "/ansible/inventory/web1/", "ansible/inventory/web2"])
+
+    assert secrets == [{"ansible_host": "10.0.0.1"}, {"ansible_host": "10.0.0.1"}, {"ansible_host": "10.0.0.2"}]
+    assert sorted(path for _, path in client.kv_v2.calls) == ["ansible/inventory/web1", "ansible/inventory/web2"]
+
+
+def test_shard_of_single_shard():
+    assert shard_of("web1", 1) == 0
+    assert shard_of("web1", 0) == 0
+
+
+def test_shard_of_is_stable_and_in_range():
+    names = [f"host{index}" for index in range(500)]
+    shards = [shard_of(name, 4) for name in names]
+
+    assert shards == [shard_of(name, 4) for name in names]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_shard_of_adding_a_shard_only_moves_names_to_it():
+    names = [f"host{index}" for index in range(500)]
+    for name in names:
+        before, after = shard_of(name, 4), shard_of(name, 5)
+        assert after in (before, 4)
+
+
+SOURCE = {"hostname": "https://vault", "mount_point": "secret", "path": "", "lazy_vars": False, "shard": [0, 1]}
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot_path = str(tmp_path / "inventory.json.gz")
+    tree = {"leaves": {"web1": {"data": {"ansible_host": "10.0.0.1"}, "version": 1}}, "folders": ["prod"]}
+
+    write_snapshot(snapshot_path, tree, SOURCE)
+    snapshot = read_snapshot(snapshot_path, 0, SOURCE)
+
+    assert snapshot["leaves"] == tree["leaves"]
+    assert snapshot["folders"] == tree["folders"]
+    assert read_snapshot(snapshot_path, 0, {**SOURCE, "path": "prod"}) is None
+    assert read_snapshot(str(tmp_path / "missing.json.gz"), 0, SOURCE) is None
+
+
+def test_read_snapshot_truncated_gzip_is_ignored(tmp_path):
+    snapshot_path = tmp_path / "inventory.json.gz"
+    tree = {"leaves": {f"host{index}": {"data": {"index": index}, "version": 1} for index in range(100)}, "folders": []}
+    write_snapshot(str(snapshot_path), tree, SOURCE)
+    snapshot_path.write_bytes(snapshot_path.read_bytes()[:-20])
+    warnings = []
+
+    assert read_snapshot(str(snapshot_path), 0, SOURCE, warn=warnings.append) is None
+    assert len(warnings) == 1
+    assert "unreadable snapshot" in warnings[0]
+
+
+def test_read_snapshot_corrupt_or_wrong_shape_is_ignored(tmp_path):
+    not_gzip_path = tmp_path / "not_gzip.json.gz"
+    not_gzip_path.write_bytes(b"not gzip")
+    not_json_path = tmp_path / "not_json.json.gz"
+    not_json_path.write_bytes(gzip.compress(b"{not json"))
+    wrong_shape_path = tmp_path / "wrong_shape.json.gz"
+    wrong_shape_path.write_bytes(gzip.compress(json.dumps(["leaves"]).encode("utf-8")))
+    warnings = []
+
+    for snapshot_path in (not_gzip_path, not_json_path, wrong_shape_path):
+        assert read_snapshot(str(snapshot_path), 0, SOURCE, warn=warnings.append) is None
+    assert len(warnings) == 3
+
+
+class FakeAuthClient:
+    """
+    An hvac client with only the AppRole login and the token lookup, the token of a login is `token-<count>`.
+    """
+
+    def __init__(self):
+        self.url = "https://vault"
+        self.token = None
+        self.logins = 0
+        self.revoked = set()
+        self.auth = type("Auth", (), {"approle": type("AppRole", (), {"login": self._login}), "token": self})
+
+    def _login(self, role_id, secret_id, use_token, mount_point):  # pylint: disable=unused-argument
+        self.logins += 1
+        return {"auth": {"client_token": f"token-{self.logins}", "lease_duration": 3600, "renewable": True}}
+
+    def lookup_self(self):
+        """Fails with Forbidden for a revoked token."""
+        if self.token in self.revoked:
+            raise hvac.exceptions.Forbidden("permission denied")
+        return {"data": {"id": self.token}}
+
+
+def test_authenticate_reuses_a_valid_cached_token(tmp_path):
+    token_cache_path = str(tmp_path / "tokens.json")
+    client = FakeAuthClient()
+
+    authenticate(client, auth_method="approle", role_id="role", secret_id="secret", token_cache_path=token_cache_path)
+    authenticate(client, auth_method="approle", role_id="role", secret_id="secret", token_cache_path=token_cache_path)
+
+    assert client.logins == 1
+    assert client.token == "token-1"
+
+
+def test_authenticate_logs_in_again_for_a_revoked_cached_token(tmp_path):
+    token_cache_path = str(tmp_path / "tokens.json")
+    client = FakeAuthClient()
+    authenticate(client, auth_method="approle", role_id="role", secret_id="secret", token_cache_path=token_cache_path)
+    client.revoked.add("token-1")
+
+    authenticate(client, auth_method="approle", role_id="role", secret_id="secret", token_cache_path=token_cache_path)
+    assert client.logins == 2
+    assert client.token == "token-2"
+
+    authenticate(client, auth_method="approle", role_id="role", secret_id="secret", token_cache_path=token_cache_path)
+    assert client.logins == 2
+    assert client.token == "token-2"
@@ -0,0 +1,179 @@
+"""
+Unit tests of the X.509 certificate helpers, on a root, an intermediate and leaf certificates generated in memory.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import datetime
+
+import pytest
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import (
+    build_chains,
+    generate_private_key_pem,
+    load_private_key,
+    renewal_reasons,
+    sign_certificate,
+)
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509.oid import NameOID
+
+
+def _pem(certificate: x509.Certificate) -> str:
+    return certificate.public_bytes(serialization.Encoding.PEM).decode("ascii")
+
+
+def _self_signed(private_key, common_name: str, validity_days: int = 365) -> x509.Certificate:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=validity_days))
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(private_key, hashes.SHA256())
+    )
+
+
+@pytest.fixture(scope="module", name="pki")
+def fixture_pki() -> dict:
+    """
+    A root CA, an intermediate CA signed by it, and two leaves signed by the intermediate, all with EC keys.
+    """
+    key_pems = {name: generate_private_key_pem("ec", curve="secp256r1") for name in ("root", "intermediate", "leaf1", "leaf2")}
+    keys = {name: load_private_key(key_pem) for name, key_pem in key_pems.items()}
+    root = _self_signed(keys["root"], "Test Root")
+    intermediate = sign_certificate(
+        keys["intermediate"], root, keys["root"], validity_days=180, subject={"commonName": "Test Intermediate"}, basic_constraints=["CA:TRUE"]
+    )
+    leaves = {
+        name: sign_certificate(
+            keys[name], intermediate, keys["intermediate"], validity_days=30, subject={"commonName": name}, subject_alt_name=[f"DNS:{name}.example.com"]
+        )
+        for name in ("leaf1", "leaf2")
+    }
+    return {"key_pems": key_pems, "root": root, "intermediate": intermediate, **leaves}
+
+
+def test_build_chains_leaf_to_root(pki):
+    pems = [_pem(pki[name]) for name in ("root", "leaf1", "intermediate")]
+
+    result = build_chains(pems)
+
+    assert len(result["chains"]) == 1
+    chain = result["chains"][0]
+    assert chain["certificates"] == [_pem(pki["leaf1"]), _pem(pki["intermediate"]), _pem(pki["root"])]
+    assert chain["fullchain"] == "".join(chain["certificates"])
+    assert chain["complete"] is True
+    assert result["unchained"] == []
+    assert result["duplicates"] == 0
+
+
+def test_build_chains_without_root(pki):
+    result = build_chains([_pem(pki[name]) for name in ("leaf1", "intermediate", "root")], include_root=False)
+
+    assert result["chains"][0]["certificates"] == [_pem(pki["leaf1"]), _pem(pki["intermediate"])]
+    assert result["chains"][0]["complete"] is True
+
+
+def test_build_chains_deduplicates_and_shares_issuers(pki):
+    pems = [_pem(pki[name]) for name in ("leaf1", "intermediate", "leaf2", "intermediate", "root", "leaf1")]
+
+    result = build_chains(pems)
+
+    assert result["duplicates"] == 2
+    assert sorted(chain["certificates"][0] for chain in result["chains"]) == sorted([_pem(pki["leaf1"]), _pem(pki["leaf2"])])
+    assert all(chain["certificates"][1:] == [_pem(pki["intermediate"]), _pem(pki["root"])] for chain in result["chains"])
+
+
+def test_build_chains_missing_issuer(pki):
+    result = build_chains([_pem(pki["leaf1"]), _pem(pki["intermediate"])])
+
+    assert result["chains"][0]["certificates"] == [_pem(pki["leaf1"]), _pem(pki["intermediate"])]
+    assert result["chains"][0]["complete"] is False
+    assert len(result["unchained"]) == 1
+
+
+def _leaf1_reasons(pki, **overrides) -> dict:
+    options = {
+        "certificate_content": _pem(pki["leaf1"]),
+        "ca_certificate_content": _pem(pki["intermediate"]),
+        "private_key_content": pki["key_pems"]["leaf1"],
+        "validity_days": 30,
+        "subject_alt_name": ["DNS:leaf1.example.com"],
+        "subject": {"CN": "leaf1"},
+    }
+    options.update(overrides)
+    return renewal_reasons(**options)
+
+
+def test_renewal_reasons_matching_certificate(pki):
+    assert _leaf1_reasons(pki) == {"needs_renewal": False, "reasons": []}
+
+
+def test_renewal_reasons_missing_certificate(pki):
+    assert _leaf1_reasons(pki, certificate_content="") == {"needs_renewal": True, "reasons": ["When Certificate Content Not Present"]}
+
+
+def test_renewal_reasons_invalid_certificate(pki):
+    assert _leaf1_reasons(pki, certificate_content="not a certificate")["reasons"] == ["Existing Certificate is Invalid"]
+
+
+def test_renewal_reasons_validity_crossing_ca(pki):
+    assert "error" in _leaf1_reasons(pki, validity_days=365)
+
+
+@pytest.mark.parametrize(
+    "overrides, reason",
+    [
+        ({"min_remaining_days": 60}, "Certificate Expired"),
+        ({"subject_alt_name": ["DNS:other.example.com"]}, "SAN Mismatch"),
+        ({"subject": {"CN": "other"}}, "Subject Mismatch"),
+        ({"key_usage": ["digitalSignature"]}, "Key Usage Mismatch"),
+        ({"extended_key_usage": ["serverAuth"]}, "Extended Key Usage Mismatch"),
+        ({"basic_constraints": ["CA:FALSE"]}, "Basic Constraints Mismatch"),
+    ],
+)
+def test_renewal_reasons_mismatch(pki, overrides, reason):
+    assert _leaf1_reasons(pki, **overrides) == {"needs_renewal": True, "reasons": [reason]}
+
+
+def test_renewal_reasons_private_key_mismatch(pki):
+    assert _leaf1_reasons(pki, private_key_content=pki["key_pems"]["leaf2"])["reasons"] == ["Private Key Mismatch"]
+
+
+def test_renewal_reasons_other_ca(pki):
+    result = _leaf1_reasons(pki, ca_certificate_content=_pem(pki["root"]))
+
+    assert result["reasons"] == ["Authority Key Identifier Mismatch, Existing Certificate is not signed by OwnCA"]
+
+
+def test_sign_certificate_keeps_the_subject_order(pki):
+    subject = {"C": "US", "ST": "California", "O": "Example", "OU": ["Platform", "Infra"], "CN": "leaf1"}
+    certificate = sign_certificate(
+        load_private_key(pki["key_pems"]["leaf1"]), pki["intermediate"], load_private_key(pki["key_pems"]["intermediate"]), subject=subject
+    )
+
+    assert [attribute.oid for attribute in certificate.subject] == [
+        NameOID.COUNTRY_NAME,
+        NameOID.STATE_OR_PROVINCE_NAME,
+        NameOID.ORGANIZATION_NAME,
+        NameOID.ORGANIZATIONAL_UNIT_NAME,
+        NameOID.ORGANIZATIONAL_UNIT_NAME,
+        NameOID.COMMON_NAME,
+    ]
+    assert certificate.subject.rfc4514_string() == "CN=leaf1,OU=Infra,OU=Platform,O=Example,ST=California,C=US"
+    reasons = renewal_reasons(
+        certificate_content=_pem(certificate),
+        ca_certificate_content=_pem(pki["intermediate"]),
+        private_key_content=pki["key_pems"]["leaf1"],
+        validity_days=7,
+        subject=dict(reversed(subject.items())),
+    )
+    assert reasons == {"needs_renewal": False, "reasons": []}
@@ -0,0 +1,58 @@
+"""
+Fixtures running an Ansible module's `run_module` in process, with `exit_json` and `fail_json` raising instead of exiting.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import json
+
+import pytest
+from ansible.module_utils import basic
+from ansible.module_utils.common.text.converters import to_bytes
+
+
+class AnsibleExitJson(Exception):
+    """
+    Raised by `exit_json`, the argument is the result.
+    """
+
+
+class AnsibleFailJson(Exception):
+    """
+    Raised by `fail_json`, the argument is the result.
+    """
+
+
+def _exit_json(self, **kwargs):  # pylint: disable=unused-argument
+    kwargs.setdefault("changed", False)
+    raise AnsibleExitJson(kwargs)
+
+
+def _fail_json(self, **kwargs):  # pylint: disable=unused-argument
+    kwargs["failed"] = True
+    raise AnsibleFailJson(kwargs)
+
+
+@pytest.fixture(name="run_module")
+def fixture_run_module(monkeypatch):
+    """
+    Calls `module.run_module()` with `args` as the module arguments.
+
+    Returns:
+        tuple: `failed`, and the result passed to `exit_json` or `fail_json`.
+    """
+    monkeypatch.setattr(basic.AnsibleModule, "exit_json", _exit_json)
+    monkeypatch.setattr(basic.AnsibleModule, "fail_json", _fail_json)
+
+    def _run(module, args: dict) -> tuple:
+        monkeypatch.setattr(basic, "_ANSIBLE_ARGS", to_bytes(json.dumps({"ANSIBLE_MODULE_ARGS": args})))
+        try:
+            module.run_module()
+        except AnsibleExitJson as ex:
+            return False, ex.args[0]
+        except AnsibleFailJson as ex:
+            return True, ex.args[0]
+        raise AssertionError("run_module returned without calling exit_json or fail_json")
+
+    return _run
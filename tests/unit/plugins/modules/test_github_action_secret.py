@@ -0,0 +1,70 @@
+"""
+Unit tests of the github_action_secret module argument handling, with the GitHub calls replaced.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+from ansible_collections.arpanrec.nebula.plugins.modules import github_action_secret
+
+
+def test_single_secret_mode(run_module, monkeypatch):
+    calls = []
+
+    def _crud(**kwargs):
+        calls.append(kwargs)
+        return {"changed": True, "updated": True}
+
+    monkeypatch.setattr(github_action_secret, "crud", _crud)
+
+    failed, result = run_module(
+        github_action_secret,
+        {"pat": "pat", "repository": "repo", "name": "TOKEN", "unencrypted_secret": "value"},
+    )
+
+    assert not failed, result
+    assert result["changed"] is True
+    assert calls == [
+        {
+            "api_ep": "https://api.github.com",
+            "pat": "pat",
+            "owner": None,
+            "unencrypted_secret": "value",
+            "name": "TOKEN",
+            "repository": "repo",
+            "organization": None,
+            "state": "present",
+            "visibility": None,
+        }
+    ]
+
+
+def test_single_secret_mode_rejects_exclusive(run_module, monkeypatch):
+    monkeypatch.setattr(github_action_secret, "crud", lambda **kwargs: {"changed": True})
+
+    failed, result = run_module(
+        github_action_secret,
+        {"pat": "pat", "repository": "repo", "name": "TOKEN", "unencrypted_secret": "value", "exclusive": True},
+    )
+
+    assert failed
+    assert result["msg"] == "'exclusive' is only supported with 'targets'"
+
+
+def test_targets_mode(run_module, monkeypatch):
+    calls = []
+
+    def _bulk_crud(**kwargs):
+        calls.append(kwargs)
+        return {"changed": False, "secrets": [], "unchanged": [], "deleted": []}
+
+    monkeypatch.setattr(github_action_secret, "bulk_crud", _bulk_crud)
+
+    failed, result = run_module(
+        github_action_secret,
+        {"pat": "pat", "exclusive": True, "targets": [{"repository": "repo", "secrets": {"TOKEN": "value"}}]},
+    )
+
+    assert not failed, result
+    assert calls[0]["exclusive"] is True
+    assert calls[0]["targets"][0]["secrets"] == {"TOKEN": "value"}
@@ -0,0 +1,125 @@
+"""
+Unit tests of the gitlab_trigger_pipeline bulk trigger and trigger cache, against a fake GitLab session.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import threading
+
+from ansible_collections.arpanrec.nebula.plugins.modules.gitlab_trigger_pipeline import bulk_crud, crud
+
+
+class FakeResponse:
+    """
+    The parts of a `requests.Response` read by the module.
+    """
+
+    def __init__(self, status_code: int, body, headers: dict = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = str(body)
+
+    def json(self):
+        """Returns the body."""
+        return self.body
+
+
+class FakeSession:
+    """
+    A GitLab session with one existing trigger token and default branch per project, recording every request.
+    """
+
+    def __init__(self, trigger_responses: list = None):
+        self.requests = []
+        self.trigger_responses = list(trigger_responses or [])
+        self._lock = threading.Lock()
+
+    def _record(self, method: str, url: str, headers: dict = None, params: dict = None) -> None:
+        with self._lock:
+            self.requests.append((method, url, (headers or {}).get("PRIVATE-TOKEN"), params))
+
+    def get(self, url, headers=None, params=None, timeout=None):  # pylint: disable=unused-argument
+        """Lists the trigger tokens, or reads the project."""
+        self._record("GET", url, headers, params)
+        if url.endswith("/triggers"):
+            return FakeResponse(200, [{"description": "gitlab_trigger_pipeline_tmp", "token": "resolved-token"}])
+        return FakeResponse(200, {"default_branch": "main"})
+
+    def post(self, url, headers=None, params=None, timeout=None):  # pylint: disable=unused-argument
+        """Triggers a pipeline."""
+        self._record("POST", url, headers, params)
+        if self.trigger_responses:
+            return self.trigger_responses.pop(0)
+        return FakeResponse(201, {"id": 1, "ref": params["ref"], "status": "created"})
+
+
+def test_bulk_crud_project_token_and_ref_override_private_token():
+    session = FakeSession()
+
+    result = bulk_crud(
+        api_ep="https://gitlab",
+        private_token="private",
+        projects=[
+            {"project_id": "1", "token": "project-token", "ref": "release/1.2"},
+            {"project_id": "2", "token": "project-token"},
+            {"project_id": "3", "ref": "develop"},
+            {"project_id": "4"},
+        ],
+        session=session,
+    )
+
+    assert "error" not in result, result
+    assert [run["ref"] for run in result["runs"]] == ["release/1.2", "main", "develop", "main"]
+    triggers = {url: params for method, url, _, params in session.requests if method == "POST"}
+    assert triggers["https://gitlab/api/v4/projects/1/trigger/pipeline"] == {"ref": "release/1.2", "token": "project-token"}
+    assert triggers["https://gitlab/api/v4/projects/2/trigger/pipeline"] == {"ref": "main", "token": "project-token"}
+    assert triggers["https://gitlab/api/v4/projects/3/trigger/pipeline"] == {"ref": "develop", "token": "resolved-token"}
+    assert triggers["https://gitlab/api/v4/projects/4/trigger/pipeline"] == {"ref": "main", "token": "resolved-token"}
+    assert not [url for method, url, _, _ in session.requests if method == "GET" and "/projects/1" in url]
+
+
+def _cache() -> dict:
+    """A trigger cache with a stale token and default branch for project 1, filled by a first trigger."""
+    cache = {}
+    crud(api_ep="https://gitlab", private_token="private", project_id="1", session=FakeSession(), cache=cache)
+    return cache
+
+
+def _triggers(session: FakeSession) -> list:
+    return [params for method, _, _, params in session.requests if method == "POST"]
+
+
+def test_crud_stale_cached_default_branch_is_looked_up_again():
+    cache = _cache()
+    session = FakeSession([FakeResponse(400, {"message": {"base": ["Reference not found"]}})])
+
+    result = crud(api_ep="https://gitlab", private_token="private", project_id="1", session=session, cache=cache)
+
+    assert "error" not in result, result
+    assert len(_triggers(session)) == 2
+    assert [url for method, url, _, _ in session.requests if method == "GET"] == ["https://gitlab/api/v4/projects/1"]
+
+
+def test_crud_other_400_is_not_retried():
+    cache = _cache()
+    session = FakeSession([FakeResponse(400, {"message": {"base": ["main is protected, pipeline for main not created"]}})])
+
+    result = crud(api_ep="https://gitlab", private_token="private", project_id="1", session=session, cache=cache)
+
+    assert result["error"]["status_code"] == 400
+    assert len(_triggers(session)) == 1
+    assert cache
+
+
+def test_crud_refused_cached_token_is_resolved_again_only_on_401_or_404():
+    session = FakeSession([FakeResponse(404, {"message": "404 Not Found"})])
+    result = crud(api_ep="https://gitlab", private_token="private", project_id="1", session=session, cache=_cache())
+    assert "error" not in result, result
+    assert len(_triggers(session)) == 2
+
+    session = FakeSession([FakeResponse(403, {"message": "403 Forbidden"})])
+    result = crud(api_ep="https://gitlab", private_token="private", project_id="1", session=session, cache=_cache())
+    assert result["error"]["status_code"] == 403
+    assert len(_triggers(session)) == 1
@@ -0,0 +1,95 @@
+"""
+Unit tests of the ownca_certificates module, issuing from an OwnCA generated in memory.
+
+Author:
+    Arpan Mandal (arpan.rec@gmail.com)
+"""
+
+import datetime
+
+import pytest
+from ansible_collections.arpanrec.nebula.plugins.module_utils.x509_core import generate_private_key_pem, load_private_key
+from ansible_collections.arpanrec.nebula.plugins.modules import ownca_certificates
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509.oid import NameOID
+
+
+@pytest.fixture(scope="module", name="ownca")
+def fixture_ownca() -> dict:
+    """
+    A self signed OwnCA certificate and its private key, as PEM.
+    """
+    private_key_pem = generate_private_key_pem("ec", curve="secp256r1")
+    private_key = load_private_key(private_key_pem)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Test OwnCA")])
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(private_key, hashes.SHA256())
+    )
+    return {
+        "ca_certificate_content": certificate.public_bytes(serialization.Encoding.PEM).decode("ascii"),
+        "ca_private_key_content": private_key_pem,
+    }
+
+
+def _certificate(**options) -> dict:
+    return {
+        "name": "api",
+        "key_type": "ec",
+        "curve": "secp256r1",
+        "subject": {"commonName": "api.example.com"},
+        "subject_alt_name": ["DNS:api.example.com"],
+        **options,
+    }
+
+
+def test_certificate_path_second_run_unchanged(run_module, ownca, tmp_path):
+    args = {
+        **ownca,
+        "certificates": [_certificate(private_key_path=str(tmp_path / "api.key"), certificate_path=str(tmp_path / "api.crt"))],
+    }
+
+    failed, first = run_module(ownca_certificates, args)
+    assert not failed, first
+    assert first["changed"] is True
+
+    failed, second = run_module(ownca_certificates, args)
+    assert not failed, second
+    assert second["changed"] is False
+    assert (tmp_path / "api.crt").read_text(encoding="utf-8").startswith("-----BEGIN CERTIFICATE-----")
+
+
+def test_certificate_content_second_run_unchanged(run_module, ownca, tmp_path):
+    key_path = str(tmp_path / "api.key")
+
+    failed, first = run_module(ownca_certificates, {**ownca, "certificates": [_certificate(private_key_path=key_path)]})
+    assert not failed, first
+    assert first["changed"] is True
+    certificate = first["certificates"][0]["certificate"]
+
+    failed, second = run_module(
+        ownca_certificates, {**ownca, "certificates": [_certificate(private_key_path=key_path, certificate_content=certificate)]}
+    )
+    assert not failed, second
+    assert second["changed"] is False
+    assert second["certificates"][0]["certificate"] == certificate
+
+
+def test_certificate_content_and_path_are_exclusive(run_module, ownca, tmp_path):
+    failed, result = run_module(
+        ownca_certificates,
+        {**ownca, "certificates": [_certificate(certificate_path=str(tmp_path / "api.crt"), certificate_content="x")]},
+    )
+
+    assert failed
+    assert "mutually exclusive" in result["msg"]